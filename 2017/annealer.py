@@ -1,13 +1,20 @@
 #!/usr/bin/python
 
-from optimizeLUT import plotLUT, plotPsize
-from subprocess32 import check_call, TimeoutExpired
-from utilities import parseTXT, parseLUT, sendEmail
+from plotter import plotLUT, plotPsize
+from subprocess32 import TimeoutExpired
+from jobrunner import summarizeRuns, summarizeBatch, useWorkerPool, drawSeed
+from lutcache import EvaluationCache, cachedRunLUT, cachedRunBatch
+from utilities import parseLUT, sendEmail, scratchDir
+from checkpoint import Checkpoint
+import notifier
+import plotter
+import tracer
 import numpy as np
-import matplotlib.pyplot as plt
+import cmaes
 import datetime
+import os
 import sys
-from createLUT import makeLUT
+from createLUT import makeLUT, DT_BOUNDS, A_BOUNDS, PSIZE_BOUNDS
 from simanneal import Annealer
 
 BOUND_CAP = 0.1  # cap on the bounds
@@ -16,6 +23,14 @@ UPDATE_PENALTY = 10000000  # penalty to give scripts which timeout
 N_ITERS_CAP = 1  # max number of optimization iterations
 RECURSION_LIMIT = 5  # max levels optimizer can branch LUT
 THRESHOLD = 0.25  # min threshold before accepting new minimum
+EXCHANGE_INTERVAL = 10  # steps between state exchanges of parallel tempering chains
+
+cache = None  # EvaluationCache of previous LUT evaluations
+seed = None  # fixed base seed of every evaluation, drawn once per run when not given
+chains = 1  # number of parallel tempering chains, 1 for a single annealing chain
+generations = 0  # number of CMA-ES generations, 0 to anneal instead
+checkpoint = Checkpoint()  # saved state of the running annealing
+snapshot = None  # image the plots are rendered into without a display, None for an interactive window
 
 
 class Optimizer(Annealer):
@@ -28,6 +43,8 @@ class Optimizer(Annealer):
         self.trials = trials
         self.var = var
         self.forward = True
+        self.key = (0, var)  # checkpoint frame of the run
+        self.step0 = 0  # steps done before resuming
         self.plotenabled, self.verbose = plotenabled, verbose
 
         if var == "all":
@@ -42,18 +59,18 @@ class Optimizer(Annealer):
 
         for row in range(bins):
             if self.var == "A":
-                lbound, ubound = 0.1, 1.0
+                lbound, ubound = A_BOUNDS
                 mu_diff, sigma = 0.05, 0.05
             elif self.var == "dT":
-                lbound, ubound = 0.1, 100.0
+                lbound, ubound = DT_BOUNDS
                 mu_diff, sigma = 0.5, 0.5
             elif self.var == "psize":
-                lbound, ubound = 16, 128
+                lbound, ubound = PSIZE_BOUNDS
                 mu_diff, sigma = 10, 10
             else:
-                self.walk(row, 0.5, 0.5, 0.1, 100.0)  # perturb dT
-                self.walk(bins+row, 0.05, 0.05, 0.1, 1.0)  # perturb A
-                self.walk(bins+bins+row, 5, 5, 16, 128)
+                self.walk(row, 0.5, 0.5, *DT_BOUNDS)  # perturb dT
+                self.walk(bins+row, 0.05, 0.05, *A_BOUNDS)  # perturb A
+                self.walk(bins+bins+row, 5, 5, *PSIZE_BOUNDS)
                 continue
 
             self.walk(row, mu_diff, sigma, lbound, ubound)
@@ -71,25 +88,138 @@ class Optimizer(Annealer):
         self.state[row] = min([ubound, self.state[row]])
         self.state[row] = max([lbound, self.state[row]])
 
-    def energy(self):
+    def schedule(self, state):
+        """Returns the dT, A and psize of a state"""
         if self.var == "A":
-            e = tryLUT(self.var, self.tag, self.datfile, self.trials, self.other1, self.state, self.other2,
-                       plotenabled=self.plotenabled, verbose=self.verbose)
+            return self.other1, state, self.other2
         elif self.var == "dT":
-            e = tryLUT(self.var, self.tag, self.datfile, self.trials, self.state, self.other1, self.other2,
-                       plotenabled=self.plotenabled, verbose=self.verbose)
+            return state, self.other1, self.other2
         elif self.var == "psize":
-            e = tryLUT(self.var, self.tag, self.datfile, self.trials, self.other1, self.other2, self.state,
-                       plotenabled=self.plotenabled, verbose=self.verbose)
+            return self.other1, self.other2, state
         else:
             bins = len(self.other1)
+            return state[:bins], state[bins:(bins+bins)], state[(bins+bins):]
 
-            e = tryLUT(self.var, self.tag, self.datfile, self.trials, self.state[:bins],
-                       self.state[bins:(bins+bins)], self.state[(bins+bins):],
-                       plotenabled=self.plotenabled, verbose=self.verbose)
-
-        return e
+    def bounds(self):
+        """Returns the lower and upper bounds of every entry of the state, and whether it is searched on a log scale"""
+        bins = len(self.other1)
+        if self.var == "all":
+            rows = [DT_BOUNDS + (True,)] * bins + [A_BOUNDS + (False,)] * bins + [PSIZE_BOUNDS + (False,)] * bins
+        elif self.var == "dT":
+            rows = [DT_BOUNDS + (True,)] * bins
+        elif self.var == "A":
+            rows = [A_BOUNDS + (False,)] * bins
+        else:
+            rows = [PSIZE_BOUNDS + (False,)] * bins
+        lower, upper, logscale = zip(*rows)
+        return np.array(lower, dtype=float), np.array(upper, dtype=float), np.array(logscale)
 
+    def energy(self):
+        dT, A, psize = self.schedule(self.state)
+        return tryLUT(self.var, self.tag, self.datfile, self.trials, dT, A, psize,
+                      plotenabled=self.plotenabled, verbose=self.verbose)
+
+    def temper(self, n_chains, exchange=EXCHANGE_INTERVAL):
+        """Parallel tempering: runs n_chains chains at temperatures spaced geometrically from Tmax to Tmin for
+        self.steps steps. The proposals of every chain are evaluated together in one batch, and neighbouring chains
+        try to swap states every exchange steps. Returns the best state and energy"""
+        T = self.Tmax * (self.Tmin / float(self.Tmax)) ** (np.arange(n_chains) / max(n_chains - 1.0, 1.0))
+
+        saved = checkpoint.load(self.key)
+        if saved is None:
+            E = self.energy()
+            states = [list(self.state) for _ in range(n_chains)]
+            energies = np.ones(n_chains) * E
+            self.best_state, self.best_energy = list(self.state), E
+
+            accepts = np.zeros(n_chains, dtype=int)
+            swaps = np.zeros(n_chains - 1, dtype=int)
+            swap_tries = np.zeros(n_chains - 1, dtype=int)
+            step0 = 0
+        else:
+            states, energies = saved["states"], saved["energies"]
+            self.best_state, self.best_energy = saved["best_state"], saved["best_energy"]
+            accepts, swaps, swap_tries = saved["accepts"], saved["swaps"], saved["swap_tries"]
+            step0 = saved["step"]
+
+        for step in range(step0 + 1, self.steps + 1):
+            proposals = []
+            for k in range(n_chains):
+                self.state = list(states[k])
+                self.move()
+                proposals.append(self.state)
+
+            new = tryLUTBatch(self.var, self.tag, self.datfile, self.trials, map(self.schedule, proposals),
+                              verbose=self.verbose)
+
+            # Metropolis step of every chain at its own temperature
+            for k in range(n_chains):
+                dE = new[k] - energies[k]
+                if dE <= 0 or np.random.rand() < np.exp(-dE / T[k]):
+                    states[k], energies[k] = proposals[k], new[k]
+                    accepts[k] += 1
+                    if new[k] < self.best_energy:
+                        self.best_state, self.best_energy = list(proposals[k]), new[k]
+
+            # exchange states between neighbouring chains, alternating even and odd pairs
+            if step % exchange == 0:
+                for k in range((step // exchange) % 2, n_chains - 1, 2):
+                    swap_tries[k] += 1
+                    delta = (1.0 / T[k] - 1.0 / T[k + 1]) * (energies[k] - energies[k + 1])
+                    if delta >= 0 or np.random.rand() < np.exp(delta):
+                        states[k], states[k + 1] = states[k + 1], states[k]
+                        energies[k], energies[k + 1] = energies[k + 1], energies[k]
+                        swaps[k] += 1
+
+            if self.updates > 0 and step % max(self.steps // self.updates, 1) == 0:
+                print("Step: {0}/{1}, best energy: {2}".format(step, self.steps, self.best_energy))
+                for k in range(n_chains):
+                    print("Chain {0}: temperature={1}, energy={2}, acceptance={3}".format(k, T[k], energies[k],
+                                                                                    accepts[k] / float(step)))
+                print("Exchange acceptance: {0}".format(swaps / np.maximum(swap_tries, 1).astype(float)))
+
+            checkpoint.save(self.key, step=step, states=states, energies=energies, best_state=self.best_state,
+                            best_energy=self.best_energy, accepts=accepts, swaps=swaps, swap_tries=swap_tries)
+
+        self.state = list(self.best_state)
+        return self.best_state, self.best_energy
+
+    def evolve(self, n_generations, popsize=None):
+        """CMA-ES over the whole state within the bounds of move(), with dT searched on a log scale. Every generation
+        is evaluated together in one batch. Returns the best state and energy"""
+        lower, upper, logscale = self.bounds()
+
+        def energies(points):
+            return tryLUTBatch(self.var, self.tag, self.datfile, self.trials, map(self.schedule, points),
+                               verbose=self.verbose)
+
+        x, E = cmaes.minimize(energies, self.state, lower, upper, n_generations, popsize, logscale=logscale,
+                              seed=seed, verbose=self.updates > 0)
+
+        self.best_state, self.best_energy = list(x), E
+        self.state = list(self.best_state)
+        return self.best_state, self.best_energy
+
+
+    def anneal(self):
+        """Anneals, continuing from the checkpoint of the run if there is one. The exponential cooling from the saved
+        temperature over the remaining steps is the rest of the original schedule. Returns the best state and energy"""
+        saved = checkpoint.load(self.key)
+        if saved is None:
+            return super(Optimizer, self).anneal()
+
+        if saved["step"] >= self.steps:
+            return saved["best_state"], saved["best_energy"]
+
+        self.state, self.Tmax = list(saved["state"]), saved["T"]
+        self.updates = max(self.updates * (self.steps - saved["step"]) // self.steps, 1)
+        self.step0, self.steps = saved["step"], self.steps - saved["step"]
+
+        state, E = super(Optimizer, self).anneal()
+        if saved["best_energy"] < E:
+            state, E = saved["best_state"], saved["best_energy"]
+        self.best_state, self.best_energy = list(state), E
+        return state, E
 
     def update(self, *args, **kwargs):
         step = args[0]
@@ -97,44 +227,67 @@ class Optimizer(Annealer):
         E = args[2]
         acceptance = args[3]
         improvement = args[4]
-        print("Step: {0}/{1}".format(step, self.steps))
+        print("Step: {0}/{1}".format(self.step0 + step, self.step0 + self.steps))
         print("Temperature: {0}, Energy: {1}".format(T, E))
         print("Acceptance: {0}, Improvement: {1}".format(acceptance, improvement))
 
+        checkpoint.save(self.key, step=self.step0 + step, T=T, state=list(self.state),
+                        best_state=list(self.best_state), best_energy=self.best_energy)
+
+
+"""Returns the factor of each (dT, A, psize) candidate, running every candidate in one batch of jobs"""
+@tracer.traced
+def tryLUTBatch(var, tag, filename, trials, candidates, weight=None, runtime=None, verbose=False):
+    rounded = []
+    for dT, A, psize in candidates:
+        if len(dT) != len(A) or len(psize) != len(dT) or len(psize) != len(A):
+            raise Exception("Vectors dT, A and psize are not the same length!")
+
+        rounded.append((dT, A, map(int, map(round, psize))))
+
+    # runs every trial of every candidate concurrently and returns the results as matrices
+    try:
+        with scratchDir() as scratch:
+            luts = []
+            for i, (dT, A, psize) in enumerate(rounded):
+                lut = os.path.join(scratch, "{0}.lut".format(i))
+                makeLUT(lut, len(dT), dT, A, psize)
+                luts.append(lut)
+
+            results = cachedRunBatch(cache, luts, rounded, filename, trials, seed, weight, runtime)
+    except TimeoutExpired:
+        return UPDATE_PENALTY * np.ones(len(candidates))
+
+    hits, updates, factor = summarizeBatch(filename, *results)
+
+    if verbose:
+        for i, (dT, A, psize) in enumerate(rounded):
+            print("Tried dT=" + str(dT) + ", A=" + str(A) + ", Psize=" + str(psize) + "  with factor=" + str(factor[i]))
+
+    return factor
+
 
 """Returns the factor of a set of conf files using given LUT"""
+@tracer.traced
 def tryLUT(var, tag, filename, trials, dT, A, psize, weight=None, runtime=None, plotenabled=False, verbose=False):
     if len(dT) != len(A) or len(psize) != len(dT) or len(psize) != len(A):
         raise Exception("Vectors dT, A and psize are not the same length!")
 
     bins = len(dT)
-    lut = tag + ".lut"
 
     psize = map(round, psize)
     psize = map(int, psize)
 
-    makeLUT(lut, bins, dT, A, psize)
-
-    args = []
-    args.append("./testrun.pl")  # the program to run
-    args.append("./ssmc")
-    args.append(lut)
-    args.append(filename)
-    args.append(str(trials))
-    args.append(tag)
-
-    if weight and runtime:
-        args.append(weight)
-        args.append(runtime)
-
-    # returns 0 if successful otherwise throws error
+    # runs every trial concurrently and returns the results as arrays, the LUT file lives only as long as the runs
     try:
-        check_call(args)
+        with scratchDir() as scratch:
+            lut = os.path.join(scratch, "lut")
+            makeLUT(lut, bins, dT, A, psize)
+            results = cachedRunLUT(cache, lut, dT, A, psize, filename, trials, seed, weight, runtime)
     except TimeoutExpired:
         return UPDATE_PENALTY
 
-    txtfile = tag + ".txt"
-    hits, updates, factor = parseTXT(txtfile)
+    hits, updates, factor = summarizeRuns(filename, *results)
 
     if hits < 1:
         updates += factor*UPDATE_PENALTY
@@ -152,20 +305,66 @@ def tryLUT(var, tag, filename, trials, dT, A, psize, weight=None, runtime=None,
 
 
 def main():
+    global seed
     args = sys.argv
     email = False
     verbose = False
     plotenabled = False
+    resume = False
 
+    if '--resume' in args:
+        resume = True
+        args.remove('--resume')
     if '-m' in args:
         email = True
         args.remove('-m')
+    if '-n' in args:
+        # the notifications go to a file instead of by email
+        i = args.index('-n')
+        notifier.configure([notifier.FileSink(args[i + 1])])
+        email = True
+        del args[i:i + 2]
     if '-v' in args:
         verbose = True
         args.remove('-v')
     if '-p' in args:
         plotenabled = True
         args.remove('-p')
+    if '-g' in args:
+        # plot without a display, into a PNG/SVG snapshot
+        i = args.index('-g')
+        global snapshot
+        snapshot = args[i + 1]
+        plotenabled = True
+        del args[i:i + 2]
+    if '-t' in args:
+        # record the time of every phase of every evaluation
+        i = args.index('-t')
+        tracer.use(args[i + 1])
+        del args[i:i + 2]
+    if '-c' in args:
+        i = args.index('-c')
+        global cache
+        cache = EvaluationCache(args[i + 1])
+        del args[i:i + 2]
+    if '-s' in args:
+        i = args.index('-s')
+        seed = int(args[i + 1])
+        del args[i:i + 2]
+    if '-w' in args:
+        # keep every instance loaded in long-lived ssmc workers
+        useWorkerPool()
+        args.remove('-w')
+    if '-k' in args:
+        i = args.index('-k')
+        global chains
+        chains = int(args[i + 1])
+        del args[i:i + 2]
+    if '-e' in args:
+        i = args.index('-e')
+        global generations
+        generations = int(args[i + 1])
+        del args[i:i + 2]
     if len(args) == 6 or len(args) == 8:
         global var
         var = args[1]
@@ -182,19 +381,39 @@ def main():
             runtime = args[7]
 
     else:
-        print("Usage: ./annealer.py dT|A|psize|all [-v] [-m] [-p] <initialLUT> <filelist.dat> trials tag [\"step weight\" \"runtime\"]\n")
+        print("Usage: ./annealer.py dT|A|psize|all [-v] [-m] [-n notifyfile] [-p] [-g snapshot] [-t tracefile] [-c cachefile] [-s seed] [-w] [-k chains] [-e generations] [--resume] <initialLUT> <filelist.dat> trials tag [\"step weight\" \"runtime\"]\n")
         return 1
 
+    # every annealing step is checkpointed, so that rerunning with --resume continues where it stopped
+    global checkpoint
+    checkpoint = Checkpoint(tag + ".CHECKPOINT", resume)
+
+    # common random numbers: every LUT of this run is evaluated on the same (instance, seed) pairs
+    if resume:
+        seed = checkpoint.load("run")["seed"]
+    elif seed is None:
+        seed = drawSeed()
+    checkpoint.save("run", seed=seed)
+    if verbose:
+        print("Seed: {0}".format(seed))
+
     optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_level=0, email=email, verbose=verbose, plotenabled=plotenabled)
 
+    checkpoint.remove()
+
+    if cache is not None:
+        if verbose:
+            print(cache.stats())
+        cache.close()
+
     return 0
 
 
 def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_level=0, email=False, verbose=False, plotenabled=False, start=datetime.datetime.now()):
     if recursion_level == 0:
         if plotenabled:
-            # Turn on interactive plotting
-            plt.ion()
+            # plots are drawn by a renderer process, in a window or into the snapshot image
+            plotter.start(snapshot)
         if verbose:
             print("########## STARTING OPTIMIZATION - " + datetime.datetime.now().strftime(
                 "%a %d/%m/%y %H:%M:%S") + " ##########")
@@ -219,7 +438,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
     elif var == "psize":
         varmin = psize.copy()
     elif var == "all":
-        pass
+        varmin = dT.copy()
     else:
         raise Exception("Invalid variable argument! Must be \"dT\", \"A\", \"psize\" or \"all\"")
 
@@ -236,6 +455,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
 
         # the state vector can simply be copied by slicing
         opt.copy_strategy = "slice"
+        opt.key = (recursion_level, var)
 
         opt.Tmax = 10  # Max (starting) temperature
         opt.Tmin = 0.1      # Min (ending) temperature
@@ -243,9 +463,15 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
         opt.updates = opt.steps
 
         try:
-            vlist, fval = opt.anneal()
+            if generations > 0:
+                vlist, fval = opt.evolve(generations)
+            elif chains > 1:
+                vlist, fval = opt.temper(chains)
+            else:
+                vlist, fval = opt.anneal()
         except Exception:
             vlist, fval = opt.best_state, opt.best_energy
+        checkpoint.drop(opt.key)
 
         varvector[:] = vlist[:]
 
@@ -258,6 +484,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
 
         # the state vector can simply be copied by slicing
         opt.copy_strategy = "slice"
+        opt.key = (recursion_level, var)
 
         opt.Tmax = 10  # Max (starting) temperature
         opt.Tmin = 0.1      # Min (ending) temperature
@@ -265,9 +492,15 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
         opt.updates = opt.steps
 
         try:
-            vlist, fval = opt.anneal()
+            if generations > 0:
+                vlist, fval = opt.evolve(generations)
+            elif chains > 1:
+                vlist, fval = opt.temper(chains)
+            else:
+                vlist, fval = opt.anneal()
         except Exception:
             vlist, fval = opt.best_state, opt.best_energy
+        checkpoint.drop(opt.key)
 
         varvector[:] = vlist[:bins]
         other1[:] = vlist[bins:(bins+bins)]
@@ -293,7 +526,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
             makeLUT(lut, bins, dT, A, psize)
 
         if plotenabled:
-            plt.savefig(tag + ".OPTIMAL." + var + ".png")
+            plotter.savefig(tag + ".OPTIMAL." + var + ".png")
 
 
     if var == 'A':
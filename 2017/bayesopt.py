@@ -0,0 +1,131 @@
+#!/usr/bin/python
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
+from scipy.stats import norm
+
+BATCH_SIZE = 4  # points proposed and evaluated together
+N_CANDIDATES = 2000  # random points scored by expected improvement for every proposal
+LOCAL_SIGMA = 0.05  # spread of the candidates around the best points, as a fraction of the bounds
+LENGTHSCALES = [0.05, 0.1, 0.2, 0.5, 1.0]  # kernel length scales tried when fitting, in the unit cube
+NOISES = [1e-4, 1e-2, 1e-1]  # noise variances tried when fitting, relative to the variance of the data
+
+
+class GaussianProcess:
+    """Gaussian process regression with a squared exponential kernel over inputs scaled to the unit cube.
+    The length scale and noise are picked from a grid by marginal likelihood"""
+
+    def __init__(self, lower, upper):
+        self.lower = np.asarray(lower, dtype=float)
+        self.upper = np.asarray(upper, dtype=float)
+        self.lengthscale = None
+        self.noise = None
+
+    def scale(self, X):
+        return (np.asarray(X, dtype=float) - self.lower) / (self.upper - self.lower)
+
+    def kernel(self, X1, X2, lengthscale):
+        d2 = (X1 ** 2).sum(1)[:, None] + (X2 ** 2).sum(1)[None, :] - 2 * X1.dot(X2.T)
+        return np.exp(-0.5 * np.maximum(d2, 0) / lengthscale ** 2)
+
+    def fit(self, X, y, refit=True):
+        """Fits the process to the points X and values y. Keeps the previous length scale and noise unless refit"""
+        self.X = self.scale(X)
+        y = np.asarray(y, dtype=float)
+        self.mean = y.mean()
+        self.std = y.std() if y.std() > 0 else 1.0
+        self.y = (y - self.mean) / self.std
+
+        if refit or self.lengthscale is None:
+            settings = [(l, s) for l in LENGTHSCALES for s in NOISES]
+            self.lengthscale, self.noise = max(settings, key=lambda ls: self.likelihood(*ls))
+
+        K = self.kernel(self.X, self.X, self.lengthscale) + self.noise * np.eye(len(self.X))
+        self.L = np.linalg.cholesky(K)
+        self.alpha = cho_solve((self.L, True), self.y)
+
+    def likelihood(self, lengthscale, noise):
+        """Returns the log marginal likelihood of the data for a length scale and noise"""
+        K = self.kernel(self.X, self.X, lengthscale) + noise * np.eye(len(self.X))
+        try:
+            L, lower = cho_factor(K, lower=True)
+        except np.linalg.LinAlgError:
+            return -np.inf
+        alpha = cho_solve((L, lower), self.y)
+        return -0.5 * self.y.dot(alpha) - np.log(np.diag(L)).sum()
+
+    def predict(self, X):
+        """Returns the predicted mean and standard deviation at the points X"""
+        Xs = self.scale(X)
+        Ks = self.kernel(Xs, self.X, self.lengthscale)
+        mu = Ks.dot(self.alpha)
+        v = solve_triangular(self.L, Ks.T, lower=True)
+        var = np.maximum(1.0 - (v ** 2).sum(0), 1e-12)
+        return mu * self.std + self.mean, np.sqrt(var) * self.std
+
+
+"""Returns the expected improvement below best of points with the given predicted means and standard deviations"""
+def expectedImprovement(mu, sigma, best):
+    z = (best - mu) / sigma
+    return (best - mu) * norm.cdf(z) + sigma * norm.pdf(z)
+
+
+"""Returns n points to evaluate next, each maximizing expected improvement after the previous ones are assumed to
+come out at the best value so far (constant liar), so that the batch spreads out"""
+def proposeBatch(gp, X, y, n, rs):
+    lower, upper = gp.lower, gp.upper
+    X = [np.asarray(x, dtype=float) for x in X]
+    y = list(y)
+    best = min(y)
+
+    points = []
+    for k in range(n):
+        # uniform candidates, plus candidates around the best points so far
+        uniform = lower + (upper - lower) * rs.random_sample((N_CANDIDATES, len(lower)))
+        centers = np.array(X)[np.argsort(y)[:BATCH_SIZE]]
+        local = centers[rs.randint(len(centers), size=N_CANDIDATES)] + \
+            LOCAL_SIGMA * (upper - lower) * rs.randn(N_CANDIDATES, len(lower))
+        candidates = np.clip(np.vstack((uniform, local)), lower, upper)
+
+        mu, sigma = gp.predict(candidates)
+        x = candidates[np.argmax(expectedImprovement(mu, sigma, best))]
+        points.append(x)
+
+        X.append(x)
+        y.append(best)
+        gp.fit(X, y, refit=False)
+
+    return points
+
+
+"""Minimizes a noisy, expensive function of a vector within bounds with a Gaussian process surrogate.
+f takes a list of points and returns their values, so that every batch can be evaluated in parallel.
+Returns the best point and value, and every point and value evaluated"""
+def minimize(f, lower, upper, evaluations, x0=None, batch_size=BATCH_SIZE, seed=None, verbose=False):
+    rs = np.random.RandomState(seed)
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+
+    # initial design: the starting point and random points
+    points = [lower + (upper - lower) * rs.random_sample(len(lower)) for _ in range(batch_size)]
+    if x0 is not None:
+        points[0] = np.clip(np.asarray(x0, dtype=float), lower, upper)
+
+    X = []
+    y = []
+    gp = GaussianProcess(lower, upper)
+
+    while len(X) < evaluations:
+        points = points[:evaluations - len(X)]
+        values = f(points)
+        X.extend(points)
+        y.extend(values)
+
+        if verbose:
+            print("Evaluated {0}/{1} points, best value={2}".format(len(X), evaluations, min(y)))
+
+        if len(X) < evaluations:
+            gp.fit(X, y)
+            points = proposeBatch(gp, X, y, batch_size, rs)
+
+    i = int(np.argmin(y))
+    return X[i], y[i], np.array(X), np.array(y)
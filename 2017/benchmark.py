@@ -0,0 +1,195 @@
+#!/usr/bin/python
+import json
+import os
+import sys
+import numpy as np
+from collections import OrderedDict
+from categorizeDAT import makeDAT
+from jobrunner import runLUT, useRunStore, useWorkerPool
+from runstore import hashLUTFile
+from utilities import parseDAT, scratchDir
+
+BENCH_DIR = "ms_random"  # directory of the benchmark DAT files
+CLASSES = ["a-h.2sat.120v", "a-h.2sat.140v", "a-h.2sat.160v", "a-h.2sat.180v", "a-h.2sat.200v",
+           "a-h.3sat.70v", "a-h.3sat.90v", "a-h.3sat.110v", "hg.3sat.250v"]  # classes run by default
+SEED = 1  # base seed of the fixed seed set, every trial t of an instance runs with seed SEED + t
+BOOTSTRAP = 1000  # resamples of the instances for the confidence intervals
+CONFIDENCE = 0.95  # level of the confidence intervals
+
+# Reported metrics, and whether higher is better
+METRICS = [("hit rate", True), ("time to target", False), ("updates to target", False), ("speedup", True)]
+
+
+"""Returns, for each instance of a run, its reference time in the DAT file, the number of trials that hit the target,
+and the expected time and updates to the target when restarting until a hit (the total over its trials per hit)"""
+def instanceResults(datfile, files, optima, times, updates):
+    dat_files, dat_optima, dat_times = parseDAT(datfile)
+    target = dict(zip(dat_files, dat_optima))
+    reference = dict(zip(dat_files, dat_times))
+
+    instances, index = np.unique(files, return_inverse=True)
+    hits = np.bincount(index, optima <= np.array([target[cnf] for cnf in files])).astype(int)
+    total_times = np.bincount(index, times)
+    total_updates = np.bincount(index, updates)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ttt = np.where(hits > 0, total_times / hits, np.inf)
+        utt = np.where(hits > 0, total_updates / hits, np.inf)
+
+    trials = np.bincount(index)
+    return {"instances": instances, "reference": np.array([reference[cnf] for cnf in instances]),
+            "trials": trials, "hits": hits, "ttt": ttt, "utt": utt}
+
+
+"""Returns the metrics of a set of instances: the hit rate over every trial, the mean time and updates to target and
+the geometric mean speedup over the DAT reference time of the instances with a hit (nan without)"""
+def metrics(res, sample=None):
+    if sample is None:
+        sample = np.arange(len(res["instances"]))
+    hits = res["hits"][sample]
+    solved = sample[hits > 0]
+
+    values = {"hit rate": hits.sum() / float(res["trials"][sample].sum())}
+    if len(solved) > 0:
+        values["time to target"] = res["ttt"][solved].mean()
+        values["updates to target"] = res["utt"][solved].mean()
+        values["speedup"] = np.exp(np.log(res["reference"][solved] / res["ttt"][solved]).mean())
+    else:
+        values["time to target"] = values["updates to target"] = values["speedup"] = np.nan
+    return values
+
+
+"""Returns each metric of a set of instances as an (estimate, low, high) tuple, the bounds of its bootstrap confidence
+interval over the instances"""
+def confidence(res, seed=0):
+    estimate = metrics(res)
+
+    rs = np.random.RandomState(seed)
+    n = len(res["instances"])
+    samples = [metrics(res, rs.randint(n, size=n)) for _ in range(BOOTSTRAP)]
+
+    alpha = (1 - CONFIDENCE) / 2.0 * 100
+    intervals = {}
+    for name, _ in METRICS:
+        values = np.array([s[name] for s in samples])
+        values = values[np.isfinite(values)]
+        if len(values) > 0:
+            low, high = np.percentile(values, [alpha, 100 - alpha])
+        else:
+            low = high = np.nan
+        intervals[name] = (estimate[name], low, high)
+    return intervals
+
+
+"""Runs the trials of a LUT on the instances of a DAT file that exist, with the fixed seed set.
+Returns the instance results, and the number of instances missing"""
+def runClass(lut, datfile, trials, seed):
+    files, optima, times = parseDAT(datfile)
+    found = [k for k in range(len(files)) if os.path.isfile(files[k])]
+    missing = len(files) - len(found)
+    if len(found) == 0:
+        return None, missing
+
+    with scratchDir() as scratch:
+        dat = os.path.join(scratch, "bench.dat")
+        makeDAT(dat, [files[k] for k in found], [optima[k] for k in found], [times[k] for k in found])
+        files, optima, times, _, updates = runLUT(lut, dat, trials, seed)
+        res = instanceResults(dat, files, optima, times, updates)
+
+    return res, missing
+
+
+"""Returns the lines comparing the metrics of each class to a baseline, and whether any got worse: when its estimate
+falls outside the baseline's confidence interval, on the bad side"""
+def compare(results, baseline):
+    lines = []
+    regressed = False
+    for name, intervals in results.items():
+        if name not in baseline["classes"]:
+            lines.append("{0}: not in the baseline".format(name))
+            continue
+        for metric, higher in METRICS:
+            estimate = intervals[metric][0]
+            base, low, high = baseline["classes"][name][metric]
+            worse = estimate < low if higher else estimate > high
+            better = estimate > high if higher else estimate < low
+            status = "REGRESSION" if worse else ("improved" if better else "same")
+            regressed = regressed or worse
+            lines.append("{0:<16}{1:<20}{2:>14.4g}{3:>14.4g}  {4}".format(name, metric, base, estimate, status))
+    return lines, regressed
+
+
+def report(name, intervals, instances, missing):
+    print("{0}: {1} instances{2}".format(name, instances, ", {0} missing".format(missing) if missing > 0 else ""))
+    for metric, _ in METRICS:
+        estimate, low, high = intervals[metric]
+        print("    {0:<20}{1:>12.4g}   [{2:.4g}, {3:.4g}]".format(metric, estimate, low, high))
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+    classes = CLASSES
+    seed = SEED
+    baseline = None
+    save = None
+
+    if '-d' in args:
+        # record every run in the run store
+        i = args.index('-d')
+        useRunStore(args[i + 1])
+        del args[i:i + 2]
+    if '-w' in args:
+        # keep every instance loaded in long-lived ssmc workers
+        useWorkerPool()
+        args.remove('-w')
+    if '-c' in args:
+        i = args.index('-c')
+        classes = args[i + 1].split(',')
+        del args[i:i + 2]
+    if '-s' in args:
+        i = args.index('-s')
+        seed = int(args[i + 1])
+        del args[i:i + 2]
+    if '-b' in args:
+        i = args.index('-b')
+        with open(args[i + 1], 'r') as f:
+            baseline = json.load(f)
+        del args[i:i + 2]
+    if '--save' in args:
+        i = args.index('--save')
+        save = args[i + 1]
+        del args[i:i + 2]
+
+    if len(args) != 3:
+        print("Usage: ./benchmark.py [-d store] [-w] [-c class,class,...] [-s seed] [-b baseline] [--save baseline] <LUT> trials")
+        print("Classes: " + ", ".join(sorted(f[:-4] for f in os.listdir(BENCH_DIR) if f.endswith(".dat"))))
+        sys.exit(1)
+
+    lut = args[1]
+    trials = int(args[2])
+
+    results = OrderedDict()
+    for name in classes:
+        res, missing = runClass(lut, os.path.join(BENCH_DIR, name + ".dat"), trials, seed)
+        if res is None:
+            print("{0}: none of the {1} instances found, skipped".format(name, missing))
+            continue
+        results[name] = confidence(res)
+        report(name, results[name], len(res["instances"]), missing)
+
+    if baseline is not None:
+        if baseline["trials"] != trials or baseline["seed"] != seed:
+            print("Warning: the baseline ran {0} trials from seed {1}".format(baseline["trials"], baseline["seed"]))
+        lines, regressed = compare(results, baseline)
+        print("\n{0:<16}{1:<20}{2:>14}{3:>14}".format("class", "metric", "baseline", "now"))
+        print("\n".join(lines))
+
+    if save is not None:
+        with open(save, 'w') as f:
+            json.dump({"lut": hashLUTFile(lut), "trials": trials, "seed": seed, "classes": results}, f, indent=1)
+
+    if baseline is not None and regressed:
+        sys.exit(1)
+
+    sys.exit(0)
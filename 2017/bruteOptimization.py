@@ -1,18 +1,31 @@
 #!/usr/bin/python
 
-from optimizeLUT import makeLUT, sendEmail, parseTXT, UPDATE_PENALTY
-from subprocess32 import check_call, TimeoutExpired
+from optimizeLUT import makeLUT, sendEmail, UPDATE_PENALTY
+from subprocess32 import Popen, CalledProcessError, TimeoutExpired
 import numpy as np
+import heapq
+import multiprocessing
 from joblib import Parallel, delayed
-from itertools import product
-from cleanupBrute import cleanup
+from jobrunner import runBatch, summarizeRuns, drawSeed
+from categorizeDAT import makeDAT
+from checkpoint import Checkpoint
+from utilities import parseDAT, parseTXT, scratchDir
+from journal import Grid, ProgressJournal, TIMED_OUT, ELIMINATED
+import tracer
+import os
+import signal
 import sys
+import threading
 import time
 
 if __name__ == "__main__":
 
     args = sys.argv
     verbosity = 0
+    halving = False
+    if '-f' in args:
+        halving = True
+        args.remove('-f')
     if '-v' in args:
         try:
             v = args[args.index('-v') + 1]
@@ -22,11 +35,16 @@ if __name__ == "__main__":
             if verbosity < 0 or verbosity > 2:
                 raise ValueError
         except (IndexError, ValueError):
-            print("Usage: ./bruteOptimization.py <datfile> [-v <verbosity (0: default no msgs, 1: update on minimum, 2: every job)>]")
+            print("Usage: ./bruteOptimization.py <datfile> [-v <verbosity (0: default no msgs, 1: update on minimum, 2: every job)>] [-f] [-t tracefile]")
             sys.exit(1)
+    if '-t' in args:
+        # record the time of every phase of every job
+        i = args.index('-t')
+        tracer.use(args[i + 1])
+        del args[i:i + 2]
 
     if len(args) != 2:
-        print("Usage: ./bruteOptimization.py <datfile> [-v <verbosity (0: default no msgs, 1: update on minimum, 2: every job)>]")
+        print("Usage: ./bruteOptimization.py <datfile> [-v <verbosity (0: default no msgs, 1: update on minimum, 2: every job)>] [-f] [-t tracefile]")
         sys.exit(1)
 
     # Use all CPUs minus 1
@@ -41,30 +59,16 @@ if __name__ == "__main__":
     # Values of an A point in the LUT
     Avals = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
 
-    # list of A combinations
-    A_list = [np.array(i) for i in product(Avals, repeat=bins)]
+    # A combinations, decoded from their index when needed
+    A_list = Grid(Avals, bins)
 
     dT = np.ones(bins)
 
-    def saveProgress(progfile, index, success=True):
-        with open(progfile, 'a') as f:
-            if success:
-                f.write("Job {0}/{1} Done\n".format(index + 1, len(A_list)))
-            else:
-                f.write("Job {0}/{1} Timed Out!\n".format(index+1, len(A_list)))
+    # Successive halving (-f): keep the best 1/ETA of the LUTs at each rung, running them on ETA times more instances
+    ETA = 3
 
-    def loadProgress(progfile):
-        indices = []
-        try:
-            with open(progfile, 'r') as f:
-                line = f.readline()
-                while(len(line) > 0):
-                    index = line.split()[1].split('/')[0]
-                    indices.append(int(index)-1)  # save the 0-based index
-                    line = f.readline()
-        except IOError:
-            pass  # No Progress file
-        return indices
+    # Number of LUTs run together in one batch of jobs
+    BATCH_SIZE = 100
 
     datfile = args[1]
     # construct tag from datfile title
@@ -74,30 +78,26 @@ if __name__ == "__main__":
         tag = datfile.split('/')[-1]
     progfile = tag + ".PROGRESS.txt"
 
-    # get finished indices
-    done = loadProgress(progfile)
-
-    # create list of indices to complete
-    indices = range(len(A_list))
-
-    # delete finished indices from index list
-    for i in sorted(done, reverse=True):
-        del indices[i]
-
-    class FileLock:
-        def __init__(self):
-            self.locked = False
-
-        def lock(self):
-            while self.locked:
-                pass
-            self.locked = True
-
-        def unlock(self):
-            self.locked = False
-
-    # create the queue for results saving
-    reslock = FileLock()
+    # one byte of status per job, picking up a sweep started with the old text progress file
+    journalfile = tag + ".PROGRESS.bin"
+    new_journal = not os.path.exists(journalfile)
+    journal = ProgressJournal(journalfile, len(A_list))
+    if new_journal:
+        journal.importText(progfile)
+
+    # indices left to complete
+    indices = journal.pending()
+
+    # common random numbers: every LUT of the sweep runs on the same (instance, seed) pairs, also after a resume,
+    # so the seed is saved along with the journal
+    checkfile = tag + ".CHECKPOINT"
+    resume = not new_journal and os.path.exists(checkfile)
+    checkpoint = Checkpoint(checkfile, resume)
+    if resume:
+        seed = checkpoint.load("run")["seed"]
+    else:
+        seed = drawSeed()
+        checkpoint.save("run", seed=seed)
 
     # file to store the top MAX_LUT results
     resFile = tag + ".RESULTS.txt"
@@ -105,40 +105,13 @@ if __name__ == "__main__":
     # initial timeout in seconds
     CUTOFF_TIME = 120
 
-    """Returns a dictionary of the MAX_LUT best updates"""
-    def getResults(lock):
-        results = {}
-
-        lock.lock()
-
-        try:
-            with open(resFile, 'r') as f:
-                line = f.readline()
-                while(len(line) > 0):
-                    iStr, updateStr, tStr, Astr = line.split(";")
-                    i = int(iStr.split('=')[1])
-                    update = float(updateStr.split('=')[1])
-                    t = float(tStr.rstrip('s').split('=')[1])
-
-                    # save the update from the file
-                    results[i] = (update, t)
-
-                    line = f.readline()
-        except IOError:
-            pass  # No results yet
-
-        lock.unlock()
-
-        return results
-
+    # seconds between writes of the results file
+    FLUSH_INTERVAL = 10
 
     """Returns a dictionary of the MAX_LUT best updates"""
-    def updateResults(index, updates, timeout, lock):
+    def getResults():
         results = {}
 
-        lock.lock()
-
-        new_min_found = False
         try:
             with open(resFile, 'r') as f:
                 line = f.readline()
@@ -153,99 +126,274 @@ if __name__ == "__main__":
                     update = float(updateStr.split('=')[1])
                     t = float(tStr.rstrip('s').split('=')[1])
 
-                    if i == index:
-                        line = f.readline()  # skip if i is given index
-                        continue
-
                     # save the update from the file
                     results[i] = (update, t)
 
-                    if not new_min_found and updates < update:
-                        new_min_found = True
-
                     line = f.readline()
         except IOError:
             pass  # No results yet
 
-        if len(results) < MAX_LUT and index not in results:
-            new_min_found = True
-
-        results[index] = (updates, timeout)
-
-        # only write to results if there is reason to
-        if new_min_found:
-            with open(resFile, 'w') as f:
-                # iterate through results in sorted order by loop time, keeping only the top MAX_LUT results
-                for i, tup in sorted(results.iteritems(), key=lambda x: x[1][0])[0:MAX_LUT]:
-                    update, t = tup
-                    f.write("index={0}; updates={1}; time={2}s; A={3}\n".format(i, update, t, A_list[i]))
-
-            if verbosity > 0:
-                print("New minimum ({0}) added, at A={1}. See ".format(updates, A_list[index]) + resFile + " for details.")
-
-        # set CUTOFF_TIME to the largest timeout in the top MAX_LUT results
-        lastVal = sorted(results.values(), key=lambda x: x[1], reverse=True)[0][1]
-
-        global CUTOFF_TIME
-        if lastVal < CUTOFF_TIME:
-            CUTOFF_TIME = lastVal
-
-            if verbosity > 0:
-                print("Using new timeout of {0}".format(CUTOFF_TIME))
-
-        lock.unlock()
-
         return results
 
 
-    def bruteOptimize(index, A, lock):
-        fulltag = tag + "." + str(index)
-
-        lut = fulltag + ".LUT.txt"
-
-        makeLUT(lut, bins, dT, A, 16*np.ones(bins))
-
-        args = []
-        args.append('./testrun.pl')  # the program to run
-        args.append('./ssmc')
-        args.append(lut)
-        args.append(datfile)
-        args.append(str(1))
-        args.append(fulltag)
-
-        # returns 0 if successful otherwise throws error
-        begin = time.time()
+    """Writes the results in sorted order by updates"""
+    def writeResults(results):
+        tmp = resFile + ".tmp"
+        with open(tmp, 'w') as f:
+            for i, tup in sorted(results.iteritems(), key=lambda x: x[1][0]):
+                update, t = tup
+                f.write("index={0}; updates={1}; time={2}s; A={3}\n".format(i, update, t, A_list[i]))
+        os.rename(tmp, resFile)
+
+
+    """Aggregator process: collects the (index, updates, time) of finished jobs from the queue until it gets None.
+    Keeps the MAX_LUT best in a heap, flushes them to the results file every FLUSH_INTERVAL seconds, and lowers the
+    shared cutoff to the largest time among them once there are MAX_LUT"""
+    def aggregate(queue, cutoff):
+        # a Ctrl-C reaches the whole process group: keep collecting until told to stop, and write what's left
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        # max-heap on updates, so that the worst of the best is popped first
+        heap = [(-update, i, t) for i, (update, t) in getResults().iteritems()]
+        heapq.heapify(heap)
+        while len(heap) > MAX_LUT:
+            heapq.heappop(heap)
+        held = set(i for _, i, _ in heap)
+
+        dirty = False
+        flushed = time.time()
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+
+            index, updates, timeout = item
+            if index not in held and (len(heap) < MAX_LUT or updates < -heap[0][0]):
+                held.add(index)
+                if len(heap) < MAX_LUT:
+                    heapq.heappush(heap, (-updates, index, timeout))
+                else:
+                    held.discard(heapq.heapreplace(heap, (-updates, index, timeout))[1])
+                dirty = True
+
+                if verbosity > 0:
+                    print("New minimum ({0}) added, at A={1}. See ".format(updates, A_list[index]) + resFile + " for details.")
+
+            # set the cutoff to the largest timeout in the top MAX_LUT results
+            if len(heap) == MAX_LUT:
+                lastVal = max(t for _, _, t in heap)
+                if lastVal < cutoff.value:
+                    cutoff.value = lastVal
+
+                    if verbosity > 0:
+                        print("Using new timeout of {0}".format(lastVal))
+
+            if dirty and time.time() - flushed > FLUSH_INTERVAL:
+                writeResults(dict((i, (-u, t)) for u, i, t in heap))
+                dirty = False
+                flushed = time.time()
+
+        if dirty:
+            writeResults(dict((i, (-u, t)) for u, i, t in heap))
+
+    # the aggregator receives results over the queue, and publishes the cutoff in shared memory
+    resqueue = multiprocessing.Queue()
+    cutoff = multiprocessing.Value('d', CUTOFF_TIME)
+    aggregator = multiprocessing.Process(target=aggregate, args=(resqueue, cutoff))
+    aggregator.start()
+
+    """Waits for the aggregator to write the final results"""
+    def stopAggregator():
+        resqueue.put(None)
+        aggregator.join()
+
+    # testrun.pl runs in its own session, out of reach of the terminal's Ctrl-C: the process groups of the running
+    # jobs are kept here, so that an interrupt kills them
+    jobs = threading.Condition()
+    running = set()
+    active = 0  # jobs not unwound yet
+    stopping = False
+
+    """Kills the running jobs and waits for them to unwind and remove their scratch directories. No job starts after"""
+    def stopJobs():
+        global stopping
+        with jobs:
+            stopping = True
+            for pgid in running:
+                try:
+                    os.killpg(pgid, signal.SIGKILL)
+                except OSError:
+                    pass  # already gone
+            while active > 0:
+                jobs.wait()
+
+
+    def bruteOptimize(index, A):
+        global active
+        with jobs:
+            if stopping:
+                return UPDATE_PENALTY
+            active += 1
         try:
-            check_call(args, timeout=CUTOFF_TIME)
-        except TimeoutExpired:
-            if verbosity > 1:
-                print("Job {0}/{1} Timed Out!".format(index+1, len(A_list)))
-            saveProgress(progfile, index, success=False)  # save the index so that we don't have to redo it
-            return UPDATE_PENALTY
-        timeout = time.time() - begin
-
-        txtfile = fulltag + ".txt"
-        hits, updates, factor = parseTXT(txtfile)
+            return runJob(index, A)
+        finally:
+            with jobs:
+                active -= 1
+                jobs.notify_all()
+
+
+    def runJob(index, A):
+        # every job writes its LUT and testrun.pl output in its own scratch directory, removed when it's done
+        with scratchDir() as scratch:
+            fulltag = os.path.join(scratch, tag + "." + str(index))
+
+            lut = fulltag + ".LUT.txt"
+
+            makeLUT(lut, bins, dT, A, 16*np.ones(bins))
+
+            args = []
+            args.append('./testrun.pl')  # the program to run
+            args.append('./ssmc')
+            args.append(lut)
+            args.append(datfile)
+            args.append(str(1))
+            args.append(fulltag)
+            args.append(str(seed))
+
+            # testrun.pl runs in its own process group, so that a timeout kills the ssmc jobs it forked along with it
+            # before the scratch directory goes away
+            begin = time.time()
+            with jobs:
+                if stopping:
+                    return UPDATE_PENALTY
+                proc = Popen(args, start_new_session=True)
+                running.add(proc.pid)
+            timedout = False
+            try:
+                proc.wait(timeout=cutoff.value)
+            except TimeoutExpired:
+                os.killpg(proc.pid, signal.SIGKILL)
+                proc.wait()
+                timedout = True
+            finally:
+                with jobs:
+                    running.discard(proc.pid)
+
+            if stopping:
+                return UPDATE_PENALTY  # interrupted, left pending for the next run
+            if timedout:
+                tracer.record("testrun.pl", begin, time.time(), index=index, timedout=True)
+                if verbosity > 1:
+                    print("Job {0}/{1} Timed Out!".format(index+1, len(A_list)))
+                journal.mark(index, TIMED_OUT)  # save the index so that we don't have to redo it
+                return UPDATE_PENALTY
+            if proc.returncode != 0:
+                raise CalledProcessError(proc.returncode, args)
+            timeout = time.time() - begin
+            tracer.record("testrun.pl", begin, begin + timeout, index=index)
+
+            txtfile = fulltag + ".txt"
+            hits, updates, factor = parseTXT(txtfile)
 
         if hits < 1:
             updates += (1+factor)*UPDATE_PENALTY
 
-        cleanup(fulltag)
-
-        saveProgress(progfile, index)
+        journal.mark(index)
 
-        updateResults(index, updates, timeout, lock)
+        resqueue.put((index, updates, timeout))
 
         if verbosity > 1:
             print("Job {0}/{1} Done".format(index+1, len(A_list)))
 
         return updates
 
+    """Scores every LUT on a growing subset of the instances, keeping the best 1/ETA at each rung until the survivors
+    run on every instance. Runs are never repeated: each rung only runs the survivors on the instances they have not
+    seen yet. Returns the scores of the survivors"""
+    def successiveHalving(indices):
+        files, optima, times = parseDAT(datfile)
+        n = len(files)
+
+        # the instances are added in a fixed random order, so that a resumed search sees the same subsets
+        order = np.random.RandomState(0).permutation(n)
+
+        rungs = int(np.floor(min(np.log(max(len(indices), 1) / float(MAX_LUT)), np.log(n)) / np.log(ETA)))
+        rungs = max(rungs, 0)
+        budgets = [int(np.ceil(n / float(ETA ** (rungs - r)))) for r in range(rungs + 1)]
+
+        runs = dict((i, []) for i in indices)  # results of each LUT so far, one tuple of arrays per rung
+        survivors = list(indices)
+        scores = {}
+        seen = 0
+
+        for rung, budget in enumerate(budgets):
+            new = order[seen:budget]
+            seen = budget
+
+            for b in range(0, len(survivors), BATCH_SIZE):
+                batch = survivors[b:b + BATCH_SIZE]
+
+                with scratchDir() as scratch:
+                    rungdat = os.path.join(scratch, "RUNG.dat")
+                    makeDAT(rungdat, [files[k] for k in new], [optima[k] for k in new], [times[k] for k in new])
+
+                    luts = []
+                    for i in batch:
+                        lut = os.path.join(scratch, "{0}.LUT.txt".format(i))
+                        makeLUT(lut, bins, dT, A_list[i], 16*np.ones(bins))
+                        luts.append(lut)
+
+                    begin = time.time()
+                    res = runBatch(luts, rungdat, 1, seed)
+                    elapsed = (time.time() - begin) / len(batch)
+
+                for c, i in enumerate(batch):
+                    runs[i].append((res[0],) + tuple(matrix[c] for matrix in res[1:]))
+                    hits, updates, factor = summarizeRuns(datfile, *map(np.concatenate, zip(*runs[i])))
+
+                    if hits < 1:
+                        updates += (1+factor)*UPDATE_PENALTY
+                    scores[i] = (updates, elapsed)
+
+                if verbosity > 1:
+                    print("Rung {0}: {1}/{2} LUTs run on {3}/{4} instances".format(rung, b + len(batch),
+                                                                                   len(survivors), budget, n))
+
+            if rung == rungs:
+                break
+
+            # keep the best 1/ETA, but never fewer than MAX_LUT
+            survivors.sort(key=lambda i: scores[i][0])
+            keep = max(len(survivors) // ETA, MAX_LUT)
+            for i in survivors[keep:]:
+                journal.mark(i, ELIMINATED)
+                del runs[i]
+            survivors = survivors[:keep]
+
+            if verbosity > 0:
+                print("Rung {0} done: {1} LUTs left, best updates={2}".format(rung, len(survivors),
+                                                                             scores[survivors[0]][0]))
+
+        # the survivors ran on every instance, like the LUTs of the full search
+        for i in survivors:
+            journal.mark(i)
+            resqueue.put((i, scores[i][0], scores[i][1]))
+
+        return dict((i, scores[i]) for i in survivors)
+
     try:
-        res = Parallel(n_jobs=N_JOBS, verbose=5)(delayed(bruteOptimize)(i, A_list[i], reslock) for i in indices)
+        if halving:
+            res = successiveHalving(indices)
+        else:
+            # the jobs only wait on testrun.pl, so threads are enough and share the queue and cutoff
+            res = Parallel(n_jobs=N_JOBS, verbose=5, backend="threading")(delayed(bruteOptimize)(i, A_list[i]) for i in indices)
+
+        stopAggregator()
+        journal.close()
+        checkpoint.remove()
 
         # Print and save the best A's
-        results = getResults(reslock)
+        results = getResults()
 
         msg = "Optimization Finished!\n"
 
@@ -260,10 +408,9 @@ if __name__ == "__main__":
 
     except KeyboardInterrupt:
 
-        print("Cleaning output files...")
-
-        # Cleans every output file up
-        res = Parallel(n_jobs=-1)(delayed(cleanup)("{0}.{1}".format(tag, i)) for i, A in enumerate(A_list))
-        print("Done!")
+        # the journal is closed once no job can mark it anymore
+        stopJobs()
+        stopAggregator()
+        journal.close()
 
     sys.exit(0)
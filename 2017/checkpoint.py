@@ -0,0 +1,52 @@
+#!/usr/bin/python
+import os
+import pickle
+import random
+import numpy as np
+
+
+class Checkpoint:
+    """State of a running optimization, saved to a file after every step so that an interrupted run can resume where
+    it stopped. Every running optimization loop saves its own frame under a key, and drops it when it finishes.
+    Every save also records the state of the random number generators, which resuming restores.
+    Without a filename nothing is written"""
+
+    def __init__(self, filename=None, resume=False):
+        self.filename = filename
+        self.frames = {}
+
+        if resume:
+            try:
+                with open(filename, 'rb') as f:
+                    self.frames, rng = pickle.load(f)
+            except IOError:
+                raise Exception("No checkpoint to resume from in " + str(filename))
+            np.random.set_state(rng[0])
+            random.setstate(rng[1])
+
+    def save(self, key, **state):
+        self.frames[key] = state
+        self.write()
+
+    def load(self, key):
+        """Returns the saved state of a frame, or None"""
+        return self.frames.get(key)
+
+    def drop(self, key):
+        if key in self.frames:
+            del self.frames[key]
+            self.write()
+
+    def write(self):
+        if self.filename is None:
+            return
+        # write to a temporary file and rename it, so that a crash never leaves a partial checkpoint
+        tmp = self.filename + ".tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump((self.frames, (np.random.get_state(), random.getstate())), f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, self.filename)
+
+    def remove(self):
+        """Deletes the checkpoint file once the run is over"""
+        if self.filename is not None and os.path.exists(self.filename):
+            os.remove(self.filename)
@@ -3,10 +3,11 @@
 from optimizeLUT import tryLUT, makeLUT, sendEmail
 import numpy as np
 from joblib import Parallel, delayed
-from itertools import product
 import os
 import sys
 
+"""Removes the testrun.pl output files of a tag. bruteOptimization.py now runs every job in a scratch directory that
+removes itself, so this only cleans up after older runs"""
 def cleanup(tag):
     try:
         os.remove(tag + ".LUT.txt")
@@ -42,12 +43,12 @@ if __name__ == "__main__":
     # Values of an A point in the LUT
     Avals = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
 
-    # list of A combinations
-    queue = [np.array(i) for i in product(Avals, repeat=bins)]
+    # number of A combinations
+    n = len(Avals) ** bins
 
     dT = np.ones(bins)
 
     # Cleans every output file up
-    res = Parallel(n_jobs=N_JOBS)(delayed(cleanup)("{0}.{1}".format(tag, i)) for i, A in enumerate(queue))
+    res = Parallel(n_jobs=N_JOBS)(delayed(cleanup)("{0}.{1}".format(tag, i)) for i in range(n))
 
     sys.exit(0)
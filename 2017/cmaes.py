@@ -0,0 +1,96 @@
+#!/usr/bin/python
+import numpy as np
+
+SIGMA0 = 0.2  # initial step size, as a fraction of the bounds
+PENALTY = 1.0  # fitness penalty per squared distance outside the bounds, relative to the median fitness
+
+
+"""Minimizes a function of a bounded vector with CMA-ES. Each generation is evaluated by one call of f, which takes the
+list of points of the generation and returns their values, so that it can run them in parallel.
+The search runs in the unit cube of the bounds (of their logs where logscale is set). Points outside the bounds are
+evaluated at the nearest bound, and ranked with a penalty growing with their distance.
+Returns the best point and value"""
+def minimize(f, x0, lower, upper, generations, popsize=None, sigma0=SIGMA0, logscale=None, seed=None, verbose=False):
+    rs = np.random.RandomState(seed)
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    if logscale is None:
+        logscale = np.zeros(len(lower), dtype=bool)
+    logscale = np.asarray(logscale, dtype=bool)
+
+    def log(x):
+        return np.where(logscale, np.log(np.where(logscale, x, 1.0)), x)
+
+    lo = log(lower)
+    hi = log(upper)
+
+    def encode(x):
+        return (log(np.clip(np.asarray(x, dtype=float), lower, upper)) - lo) / (hi - lo)
+
+    def decode(u):
+        v = lo + np.clip(u, 0, 1) * (hi - lo)
+        return np.where(logscale, np.exp(v), v)
+
+    # Strategy parameters, following Hansen's CMA-ES tutorial
+    n = len(lower)
+    lam = popsize if popsize is not None else 4 + int(3 * np.log(n))
+    mu = lam // 2
+    weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+    weights /= weights.sum()
+    mueff = 1.0 / (weights ** 2).sum()
+
+    cc = (4 + mueff / n) / (n + 4 + 2 * mueff / n)
+    cs = (mueff + 2) / (n + mueff + 5)
+    c1 = 2 / ((n + 1.3) ** 2 + mueff)
+    cmu = min(1 - c1, 2 * (mueff - 2 + 1 / mueff) / ((n + 2) ** 2 + mueff))
+    damps = 1 + 2 * max(0, np.sqrt((mueff - 1) / (n + 1)) - 1) + cs
+    chiN = np.sqrt(n) * (1 - 1.0 / (4 * n) + 1.0 / (21 * n ** 2))
+
+    m = encode(x0)
+    sigma = sigma0
+    C = np.eye(n)
+    B = np.eye(n)
+    D = np.ones(n)
+    pc = np.zeros(n)
+    ps = np.zeros(n)
+
+    best_x, best_f = None, np.inf
+
+    for g in range(generations):
+        y = rs.randn(lam, n).dot((B * D).T)
+        u = m + sigma * y
+
+        values = np.asarray(f([decode(x) for x in u]), dtype=float)
+
+        i = int(np.argmin(values))
+        if values[i] < best_f:
+            best_x, best_f = decode(u[i]), values[i]
+
+        # rank with a penalty for leaving the bounds
+        outside = ((u - np.clip(u, 0, 1)) ** 2).sum(1)
+        fitness = values + PENALTY * abs(np.median(values)) * outside
+        y = y[np.argsort(fitness)[:mu]]
+
+        y_w = weights.dot(y)
+        m = m + sigma * y_w
+
+        # evolution paths
+        invsqrtC = B.dot(np.diag(1 / D)).dot(B.T)
+        ps = (1 - cs) * ps + np.sqrt(cs * (2 - cs) * mueff) * invsqrtC.dot(y_w)
+        hsig = np.linalg.norm(ps) / np.sqrt(1 - (1 - cs) ** (2 * (g + 1))) / chiN < 1.4 + 2.0 / (n + 1)
+        pc = (1 - cc) * pc + hsig * np.sqrt(cc * (2 - cc) * mueff) * y_w
+
+        # covariance and step size
+        C = (1 - c1 - cmu) * C + c1 * (np.outer(pc, pc) + (1 - hsig) * cc * (2 - cc) * C) + \
+            cmu * (y.T * weights).dot(y)
+        sigma *= np.exp((cs / damps) * (np.linalg.norm(ps) / chiN - 1))
+
+        C = np.triu(C) + np.triu(C, 1).T
+        D2, B = np.linalg.eigh(C)
+        D = np.sqrt(np.maximum(D2, 1e-20))
+
+        if verbose:
+            print("Generation {0}/{1}: best value={2}, median={3}, sigma={4}".format(g + 1, generations, best_f,
+                                                                                     np.median(values), sigma))
+
+    return best_x, best_f
@@ -0,0 +1,158 @@
+#!/usr/bin/python
+"""
+Binary instance format, read by ssmc in place of DIMACS text (all little-endian):
+    header   (see HEADER) magic, type, variables, header clauses, stored clauses, top weight, number of terms
+    offsets  int64[clauses+1]  start of each clause in the terms
+    weights  int64[clauses]    weight of each clause
+    terms    int32[terms]      the literals of every clause, back to back
+Clauses are stored as they appear in the DIMACS file; ssmc does the deduping and tautology removal on load.
+The type and top weight are those ssmc derives from the "p" line: 0 for cnf (top 1), 1 for partial wcnf
+(top given), 2 for weighted wcnf (top 10).
+"""
+import os
+import numpy as np
+
+MAGIC = b"SSMCCNF1"
+HEADER = np.dtype([("magic", "S8"), ("type", "<i4"), ("nvars", "<i4"), ("ncls", "<i4"), ("nclauses", "<i4"),
+                   ("max_weight", "<i8"), ("nlits", "<i8")])
+EXTENSION = ".bcnf"
+
+
+class Instance:
+    """A CNF instance as flat arrays. When loaded from a binary file, the arrays are memory-mapped views"""
+
+    def __init__(self, type, nvars, ncls, max_weight, offsets, weights, lits):
+        self.type = type
+        self.nvars = nvars
+        self.ncls = ncls
+        self.max_weight = max_weight
+        self.offsets = offsets
+        self.weights = weights
+        self.lits = lits
+
+    def __len__(self):
+        return len(self.weights)
+
+    def clause(self, i):
+        return self.lits[self.offsets[i]:self.offsets[i + 1]]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+
+"""Returns whether the file is a binary instance"""
+def isBinary(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+"""Returns the header of a binary instance as a record"""
+def readHeader(filename):
+    header = np.fromfile(filename, dtype=HEADER, count=1)
+    if len(header) < 1 or header["magic"][0] != MAGIC:
+        raise Exception("Invalid binary instance: {0}".format(filename))
+    return header[0]
+
+
+"""Parses a DIMACS cnf/wcnf file into an Instance"""
+def readCNF(cnf):
+    with open(cnf, 'r') as f:
+        text = f.read()
+
+    # skip down to the parameter line
+    start = 0
+    while not text.startswith('p', start):
+        start = text.index('\n', start) + 1
+    end = text.find('\n', start)
+    if end < 0:
+        end = len(text)
+
+    p = text[start:end].split()
+    fmt, nvars, ncls = p[1], int(p[2]), int(p[3])
+    if fmt == "cnf":
+        type, max_weight = 0, 1
+    elif fmt == "wcnf" and len(p) == 4:
+        type, max_weight = 2, 10
+    elif fmt == "wcnf":
+        type, max_weight = 1, int(p[4])
+    else:
+        raise Exception("Invalid CNF file: {0}".format(cnf))
+
+    body = [line for line in text[end + 1:].splitlines() if len(line.strip()) > 0 and not line.startswith('c')]
+    tokens = np.array(" ".join(body[:ncls]).split(), dtype=np.int64)
+
+    # every clause ends with a 0; weights (when there are any) start every clause and are never 0
+    ends = np.flatnonzero(tokens == 0)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    if type == 0:
+        weights = np.ones(len(ends), dtype=np.int64)
+        keep = tokens != 0
+    else:
+        weights = tokens[starts]
+        keep = tokens != 0
+        keep[starts] = False
+
+    lits = tokens[keep].astype(np.int32)
+    lengths = ends - starts - (type != 0)
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+
+    return Instance(type, nvars, ncls, max_weight, offsets, weights, lits)
+
+
+"""Writes an Instance in the binary format"""
+def writeBinary(filename, inst):
+    header = np.zeros(1, dtype=HEADER)
+    header["magic"] = MAGIC
+    header["type"] = inst.type
+    header["nvars"] = inst.nvars
+    header["ncls"] = inst.ncls
+    header["nclauses"] = len(inst)
+    header["max_weight"] = inst.max_weight
+    header["nlits"] = len(inst.lits)
+
+    tmp = filename + ".tmp"
+    with open(tmp, 'wb') as f:
+        header.tofile(f)
+        np.asarray(inst.offsets, dtype="<i8").tofile(f)
+        np.asarray(inst.weights, dtype="<i8").tofile(f)
+        np.asarray(inst.lits, dtype="<i4").tofile(f)
+    os.rename(tmp, filename)  # so that readers never see a partial file
+
+
+"""Memory-maps a binary instance. The arrays of the returned Instance are zero-copy views of the file"""
+def loadBinary(filename):
+    header = readHeader(filename)
+    n = int(header["nclauses"])
+    nlits = int(header["nlits"])
+
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+    pos = HEADER.itemsize
+    offsets = data[pos:pos + 8 * (n + 1)].view("<i8")
+    pos += 8 * (n + 1)
+    weights = data[pos:pos + 8 * n].view("<i8")
+    pos += 8 * n
+    lits = data[pos:pos + 4 * nlits].view("<i4")
+
+    return Instance(int(header["type"]), int(header["nvars"]), int(header["ncls"]), int(header["max_weight"]),
+                    offsets, weights, lits)
+
+
+"""Loads an instance from either a binary or a DIMACS file"""
+def loadInstance(filename):
+    if isBinary(filename):
+        return loadBinary(filename)
+    return readCNF(filename)
+
+
+"""Returns the binary file name of a DIMACS file"""
+def binaryName(cnf):
+    return os.path.splitext(cnf)[0] + EXTENSION
+
+
+"""Converts a DIMACS file to the binary format, unless an up to date conversion exists. Returns the binary file name"""
+def convertCNF(cnf, out=None):
+    if out is None:
+        out = binaryName(cnf)
+    if not os.path.exists(out) or os.path.getmtime(out) < os.path.getmtime(cnf):
+        writeBinary(out, readCNF(cnf))
+    return out
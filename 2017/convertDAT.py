@@ -0,0 +1,28 @@
+#!/usr/bin/python
+
+import sys
+from joblib import Parallel, delayed
+from utilities import parseDAT
+from categorizeDAT import makeDAT
+from cnfbin import convertCNF
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 3:
+        print("Usage: ./convertDAT.py <DAT> <binary DAT>")
+        sys.exit(1)
+
+    datfile = sys.argv[1]
+    bindatfile = sys.argv[2]
+
+    files, optima, times = parseDAT(datfile)
+
+    # Convert every instance next to its DIMACS file, using all CPUs
+    binfiles = Parallel(n_jobs=-1, verbose=5)(delayed(convertCNF)(cnf) for cnf in files)
+
+    makeDAT(bindatfile, binfiles, optima, times)
+
+    print("Converted {0} files. Written to {1}".format(len(binfiles), bindatfile))
+
+    sys.exit(0)
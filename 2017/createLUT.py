@@ -1,11 +1,18 @@
 #!/usr/bin/python
 import sys
+from tracer import traced
+
+# Bounds of every dT, A and psize entry of a LUT, in the searches over the whole schedule
+DT_BOUNDS = (0.1, 100.0)
+A_BOUNDS = (0.1, 1.0)
+PSIZE_BOUNDS = (16, 128)
 
 # Make a tuple out of a string
 def make_tuple(s, d_type):
     return map(d_type, tuple(s[1:-1].split(',')))
 
 # create the LUT table
+@traced
 def makeLUT(filename, bins, dT, A, psize):
     dT = map(str, dT)
     A = map(str, A)
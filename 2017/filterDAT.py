@@ -1,15 +1,21 @@
 #!/usr/bin/python
 
 import sys
-from utilities import parseDAT, parseOUT, parseLUT, parseCNF
+from utilities import parseDAT, parseCNF
 from categorizeDAT import makeDAT
-from optimizeLUT import tryLUT
+from jobrunner import queryLUT, useRunStore
 
 
 if __name__ == "__main__":
 
+    if '-d' in sys.argv:
+        # answer from the run store, running only what it does not hold yet
+        i = sys.argv.index('-d')
+        useRunStore(sys.argv[i + 1])
+        del sys.argv[i:i + 2]
+
     if len(sys.argv) != 4:
-        print "Usage: ./filterDAT.py <LUT> <DAT> tag"
+        print "Usage: ./filterDAT.py [-d store] <LUT> <DAT> tag"
         sys.exit(1)
 
     lutfile = sys.argv[1]
@@ -40,11 +46,7 @@ if __name__ == "__main__":
     if len(files) > 0:
         makeDAT(datfile, files, optima, times)
 
-    bins, dT, A, psize = parseLUT(lutfile)
-
-    tryLUT("A", tag, datfile, 1, dT, A, psize)
-
-    _files, _optima, _, _, _ = parseOUT(tag + ".out")
+    _files, _optima, _, _, _ = queryLUT(lutfile, datfile, 1)
 
     hard_files = []
     hard_optima = []
@@ -1,16 +1,21 @@
 #!/usr/bin/python
 import sys
 import matplotlib.pyplot as plt
-from subprocess32 import check_call
 import time
 from optimizeLUT import sendEmail
-from utilities import parseOUT
+from jobrunner import queryLUT, useRunStore
 
 
 if __name__ == "__main__":
 
+    if '-d' in sys.argv:
+        # answer from the run store, running only what it does not hold yet
+        i = sys.argv.index('-d')
+        useRunStore(sys.argv[i + 1])
+        del sys.argv[i:i + 2]
+
     if len(sys.argv) != 5:
-        print "Usage: ./histAnalysis.py <LUT> <DAT> trials tag"
+        print "Usage: ./histAnalysis.py [-d store] <LUT> <DAT> trials tag"
         sys.exit(1)
 
     lut = sys.argv[1]
@@ -18,25 +23,15 @@ if __name__ == "__main__":
     trials = int(sys.argv[3])
     tag = sys.argv[4]
 
-    args = []
-    args.append('./testrun.pl')  # the program to run
-    args.append('./ssmc')
-    args.append(lut)
-    args.append(datfile)
-    args.append(str(trials))
-    args.append(tag)
-
     begin = time.time()
-    # run testrun.pl with the given args
-    check_call(args)
+    # run every trial of the DAT file concurrently
+    _, _, times, loops, updates = queryLUT(lut, datfile, trials)
     elapsed = time.time() - begin
 
     print("Elapsed: {0} seconds".format(elapsed))
 
     sendEmail("Histogram analysis done.")
 
-    _, _, times, loops, updates = parseOUT(tag + ".out")
-
     plt.figure(0)
     plt.hist(times, 100)
     plt.title("Times Histogram for {0}".format(tag))
@@ -0,0 +1,504 @@
+#!/usr/bin/python
+import atexit
+import multiprocessing
+import random
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from subprocess32 import Popen, PIPE, CalledProcessError, TimeoutExpired
+from utilities import parseDAT
+from runstore import RunStore, hashLUTFile
+import tracer
+
+SSMC = './ssmc'  # the solver to run
+N_JOBS = multiprocessing.cpu_count()  # run as many jobs as there are cores
+MAX_RESIDENT = 8  # max number of instances each worker keeps loaded
+DONE = 'c Done'  # marks the end of a job in worker mode
+
+pool = None  # WorkerPool used by runLUT, if any
+store = None  # RunStore recording every run, if any
+
+
+"""Returns a random base seed, as testrun.pl picks one"""
+def drawSeed():
+    return random.randint(0, 999999999)
+
+
+"""Returns the list of (file, optimum, seed) jobs described by a DAT file, listed in the same order as testrun.pl lists
+them before shuffling them. The same base seed always gives the same (instance, seed) pairs"""
+def makeJobs(datfile, trials, seed=None):
+    files, optima, _ = parseDAT(datfile)
+
+    if seed is None:
+        seed = drawSeed()
+    seed = int(seed)
+
+    jobs = []
+    for i, cnf in enumerate(files):
+        for t in range(seed, seed + int(trials)):
+            jobs.append((cnf, optima[i], t))
+
+    return jobs
+
+
+"""Returns the order in which to run a list of jobs: a random permutation, as testrun.pl shuffles its jobs, drawn from
+their base seed, so that every LUT evaluated on the same jobs runs them in the same order"""
+def shuffleJobs(jobs):
+    if len(jobs) == 0:
+        return []
+    rs = np.random.RandomState(min(job[2] for job in jobs) % (1 << 32))
+    return list(rs.permutation(len(jobs)))
+
+
+"""Parses ssmc output line by line as it streams in, until the end of the stream or the given marker line. Returns the optimum, time, loops and updates.
+Raises EOFError if the stream ends before the marker line, when ssmc died.
+Given a marks dictionary, records in it when the problem loaded line came in, and the load time it reports"""
+def parseSSMC(stream, until=None, marks=None):
+    opt = -1
+    t = -1
+    loops = -1
+    updates = -1
+
+    for line in iter(stream.readline, ''):
+        if until is not None and line.startswith(until):
+            break
+        if marks is not None and line.startswith('c Problem loaded'):
+            marks["loaded"] = time.time()
+            marks["load"] = float(line.split()[3])
+        elif line.startswith('o'):
+            opt = int(line.split()[1])
+        elif 'Walltime' in line:
+            c = line.split()
+            t = float(c[2])
+            loops = int(c[4])
+            updates = int(c[6])
+    else:
+        if until is not None:
+            raise EOFError("ssmc exited before " + until)
+
+    return opt, t, loops, updates
+
+
+class Eliminated(Exception):
+    """Raised when the stop callback of a run ends it early. Holds the results so far and which jobs finished"""
+
+    def __init__(self, results, finished):
+        Exception.__init__(self, "Stopped after {0}/{1} jobs".format(np.count_nonzero(finished), len(finished)))
+        self.results = results
+        self.finished = finished
+
+
+class JobRunner:
+    """Runs ssmc jobs concurrently, one per core, and collects their results in memory"""
+
+    def __init__(self, n_jobs=None, command=SSMC):
+        if n_jobs is None or n_jobs < 1:
+            n_jobs = N_JOBS
+        self.n_jobs = n_jobs
+        self.command = command
+        self.procs = set()
+        self.lock = threading.Lock()
+        self.aborted = False
+        self.slots = threading.local()
+
+    def args(self, lut, job, weight=None, runtime=None):
+        cnf, optimum, seed = job
+        args = [self.command, lut, cnf, str(optimum), str(seed)]
+        if weight and runtime:
+            args.append(str(weight))
+            args.append(str(runtime))
+        return args
+
+    def runOne(self, lut, job, weight=None, runtime=None, marks=None):
+        """Run a single job, returning its optimum, time, loops and updates. marks are passed on to parseSSMC"""
+        proc = Popen(self.args(lut, job, weight, runtime), stdout=PIPE, universal_newlines=True)
+
+        with self.lock:
+            if self.aborted:
+                proc.kill()
+            self.procs.add(proc)
+
+        try:
+            result = parseSSMC(proc.stdout, marks=marks)
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            with self.lock:
+                self.procs.discard(proc)
+
+        return result
+
+    def schedule(self, jobs):
+        """Returns the pending job indices, the next one to run last. They run shuffled, so that a timeout or an
+        early stop cuts a random subset of the jobs rather than the last instances of the DAT file"""
+        pending = shuffleJobs(jobs)
+        pending.reverse()
+        return pending
+
+    def nextJob(self, slot, jobs, pending):
+        """Returns the index of the next job for the given worker slot, or None if there are none left"""
+        if len(pending) == 0:
+            return None
+        return pending.pop()
+
+    def trace(self, slot, job, queued, start, marks, result):
+        """Traces the phases of a job: loading the instance, if it did, then solving it"""
+        loaded = marks.get("loaded", start)
+        if loaded > start:
+            tracer.record("load", start, loaded, slot, instance=job[0], load=marks["load"])
+        tracer.record("solve", loaded, time.time(), slot, instance=job[0], seed=job[2], wait=start - queued,
+                      walltime=result[1], updates=result[3])
+
+    def abort(self):
+        """Kill every outstanding process"""
+        with self.lock:
+            self.aborted = True
+            for proc in self.procs:
+                try:
+                    proc.kill()
+                except OSError:
+                    pass  # already finished
+
+    def run(self, lut, jobs, weight=None, runtime=None, timeout=None, stop=None):
+        """Runs every job against the given LUT file, or against the LUT file of each job when given a list.
+        Returns the files, optima, times, loops and updates as arrays.
+        stop(finished, optima, times, loops, updates) is called as each job finishes; when it returns True the
+        outstanding jobs are killed and Eliminated is raised"""
+        n = len(jobs)
+        if isinstance(lut, list):
+            luts = lut
+        else:
+            luts = [lut] * n
+        optima = -np.ones(n, dtype=int)
+        times = -np.ones(n)
+        loops = -np.ones(n, dtype=int)
+        updates = -np.ones(n, dtype=int)
+        finished = np.zeros(n, dtype=bool)
+
+        pending = self.schedule(jobs)
+        errors = []
+        eliminated = []
+        self.aborted = False
+        queued = time.time()
+
+        def worker(slot):
+            self.slots.slot = slot
+            while True:
+                with self.lock:
+                    if self.aborted:
+                        return
+                    i = self.nextJob(slot, jobs, pending)
+                    if i is None:
+                        return
+                marks = {} if tracer.tracer is not None else None
+                start = time.time()
+                try:
+                    result = self.runOne(luts[i], jobs[i], weight, runtime, marks)
+                except Exception as e:
+                    with self.lock:
+                        if self.aborted:
+                            return  # the job was killed
+                    errors.append(e)
+                    self.abort()
+                    return
+                if marks is not None:
+                    self.trace(slot, jobs[i], queued, start, marks, result)
+
+                with self.lock:
+                    if self.aborted:
+                        return  # the job was killed
+                    optima[i], times[i], loops[i], updates[i] = result
+                    finished[i] = True
+                    lost = stop is not None and stop(finished, optima, times, loops, updates)
+                if lost:
+                    eliminated.append(i)
+                    self.abort()
+                    return
+
+        threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(min(self.n_jobs, n))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        begin = time.time()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.1)
+                if timeout is not None and time.time() - begin > timeout:
+                    self.abort()
+                    for th in threads:
+                        th.join()
+                    raise TimeoutExpired(self.command, timeout)
+
+        if len(errors) > 0:
+            raise errors[0]
+
+        files = np.array([job[0] for job in jobs])
+
+        if len(eliminated) > 0:
+            raise Eliminated((files, optima, times, loops, updates), finished)
+
+        return files, optima, times, loops, updates
+
+
+class WorkerPool(JobRunner):
+    """Runs jobs on long-lived ssmc workers (ssmc -w) that keep their instance loaded across jobs and evaluations.
+    Each worker slot keeps up to max_resident instances loaded, and picks jobs for those instances first."""
+
+    def __init__(self, n_jobs=None, command=SSMC, max_resident=MAX_RESIDENT):
+        JobRunner.__init__(self, n_jobs, command)
+        self.max_resident = max_resident
+        self.resident = [OrderedDict() for _ in range(self.n_jobs)]
+        atexit.register(self.close)
+
+    def schedule(self, jobs):
+        # the instances, and the jobs of each, come in the shuffled order of JobRunner
+        pending = OrderedDict()
+        for i in shuffleJobs(jobs):
+            pending.setdefault(jobs[i][0], []).append(i)
+        for indices in pending.values():
+            indices.reverse()
+        return pending
+
+    def nextJob(self, slot, jobs, pending):
+        if len(pending) == 0:
+            return None
+
+        # prefer an instance this slot already holds, then one no slot holds, then the one with most jobs left
+        held = [cnf for cnf in self.resident[slot] if cnf in pending]
+        if len(held) > 0:
+            cnf = held[-1]
+        else:
+            loaded = set()
+            for resident in self.resident:
+                loaded.update(resident)
+            free = [cnf for cnf in pending if cnf not in loaded]
+            if len(free) > 0:
+                cnf = free[0]
+            else:
+                cnf = max(pending, key=lambda c: len(pending[c]))
+
+        indices = pending[cnf]
+        i = indices.pop()
+        if len(indices) == 0:
+            del pending[cnf]
+        return i
+
+    def worker(self, slot, cnf, marks=None):
+        """Returns the worker process of the slot holding the instance, starting one if needed. marks are passed on to
+        parseSSMC when it starts one"""
+        resident = self.resident[slot]
+
+        with self.lock:
+            proc = resident.pop(cnf, None)
+        if proc is not None and proc.poll() is not None:
+            proc = None  # the worker died, start a new one
+
+        if proc is None:
+            args = [self.command, '-w', cnf]
+            proc = Popen(args, stdin=PIPE, stdout=PIPE, universal_newlines=True, bufsize=1)
+            try:
+                parseSSMC(proc.stdout, DONE, marks)  # wait until the instance is loaded
+            except EOFError:
+                self.stop(proc)
+                raise CalledProcessError(proc.returncode, args)
+
+        evicted = []
+        with self.lock:
+            while len(resident) >= self.max_resident:
+                evicted.append(resident.popitem(last=False)[1])
+            resident[cnf] = proc  # most recently used last
+
+        for old in evicted:
+            self.stop(old)
+
+        return proc
+
+    def stop(self, proc):
+        try:
+            proc.stdin.close()
+            proc.stdout.close()
+        except IOError:
+            pass
+        proc.wait()
+
+    def runOne(self, lut, job, weight=None, runtime=None, marks=None):
+        """Run a single job on the worker holding its instance, returning its optimum, time, loops and updates.
+        When the worker dies, reruns the job once on a new worker, then raises CalledProcessError"""
+        cnf, optimum, seed = job
+        slot = self.slots.slot
+
+        for attempt in range(2):
+            proc = self.worker(slot, cnf, marks)
+
+            with self.lock:
+                if self.aborted:
+                    proc.kill()
+                self.procs.add(proc)
+
+            try:
+                proc.stdin.write("{0} {1} {2}\n".format(lut, optimum, seed))
+                proc.stdin.flush()
+                return parseSSMC(proc.stdout, DONE)
+            except (IOError, EOFError):
+                pass  # the worker died
+            finally:
+                with self.lock:
+                    self.procs.discard(proc)
+
+            with self.lock:
+                if self.resident[slot].get(cnf) is proc:
+                    del self.resident[slot][cnf]
+            self.stop(proc)
+
+            if self.aborted:
+                break
+
+        raise CalledProcessError(proc.returncode, [self.command, '-w', cnf])
+
+    def close(self):
+        """Stop every worker"""
+        for resident in self.resident:
+            while len(resident) > 0:
+                _, proc = resident.popitem()
+                self.stop(proc)
+
+
+"""Makes runLUT run its jobs on a WorkerPool that keeps instances loaded between evaluations"""
+def useWorkerPool(n_jobs=None, max_resident=MAX_RESIDENT):
+    global pool
+    pool = WorkerPool(n_jobs, max_resident=max_resident)
+    return pool
+
+
+"""Makes runLUT and runBatch record every run in a RunStore at the given path"""
+def useRunStore(path):
+    global store
+    store = RunStore(path)
+    return store
+
+
+"""Records the results of a set of jobs in the run store, if one is in use"""
+def recordRuns(lut, jobs, optima, times, loops, updates):
+    if store is not None:
+        files = [job[0] for job in jobs]
+        seeds = [job[2] for job in jobs]
+        store.append(hashLUTFile(lut), files, seeds, optima, times, loops, updates)
+
+
+"""Runs a LUT file against every instance of a DAT file. Returns the files, optima, times, loops and updates as arrays"""
+@tracer.traced
+def runLUT(lut, datfile, trials, seed=None, weight=None, runtime=None, timeout=None, n_jobs=None, stop=None):
+    jobs = makeJobs(datfile, trials, seed)
+    if pool is not None:
+        runner = pool
+    else:
+        runner = JobRunner(n_jobs)
+    results = runner.run(lut, jobs, weight, runtime, timeout, stop)
+
+    # runs with a custom step weight or runtime are not comparable to the others
+    if weight is None and runtime is None:
+        recordRuns(lut, jobs, *results[1:])
+
+    return results
+
+
+"""Returns the runs of a LUT file on every instance of a DAT file like runLUT, but from the run store when it already
+holds that many trials of every instance"""
+def queryLUT(lut, datfile, trials):
+    files, _, _ = parseDAT(datfile)
+    trials = int(trials)
+
+    if store is not None:
+        runs = store.query(hashLUTFile(lut), files)
+        order = np.argsort(runs["instance"], kind='mergesort')
+        instances, starts, counts = np.unique(runs["instance"][order], return_index=True, return_counts=True)
+        found = dict(zip(instances, zip(starts, counts)))
+
+        if all(cnf in found and found[cnf][1] >= trials for cnf in files):
+            # the first trials of each instance, in DAT order
+            rows = np.concatenate([order[found[cnf][0]:found[cnf][0] + trials] for cnf in files])
+            return (np.repeat(files, trials), runs["optimum"][rows], runs["walltime"][rows], runs["loops"][rows],
+                    runs["updates"][rows])
+
+    return runLUT(lut, datfile, trials)
+
+
+"""Runs several LUT files against every instance of a DAT file as one set of jobs, grouped by instance.
+Returns the files of the DAT jobs, and the optima, times, loops and updates as (LUT x job) matrices"""
+@tracer.traced
+def runBatch(luts, datfile, trials, seed=None, weight=None, runtime=None, timeout=None, n_jobs=None):
+    jobs = makeJobs(datfile, trials, seed)
+
+    # every LUT runs the same jobs; all the runs of an instance are queued together
+    order = []
+    for cnf in OrderedDict.fromkeys(job[0] for job in jobs):
+        block = [j for j, job in enumerate(jobs) if job[0] == cnf]
+        for c in range(len(luts)):
+            order.extend((c, j) for j in block)
+
+    batch_luts = [luts[c] for c, _ in order]
+    batch_jobs = [jobs[j] for _, j in order]
+
+    if pool is not None:
+        runner = pool
+    else:
+        runner = JobRunner(n_jobs)
+    _, optima, times, loops, updates = runner.run(batch_luts, batch_jobs, weight, runtime, timeout)
+
+    shape = (len(luts), len(jobs))
+    c, j = np.array(order, dtype=int).reshape(-1, 2).T
+    results = []
+    for res in (optima, times, loops, updates):
+        matrix = np.empty(shape, dtype=res.dtype)
+        matrix[c, j] = res
+        results.append(matrix)
+
+    if weight is None and runtime is None:
+        for k in range(len(luts)):
+            recordRuns(luts[k], jobs, *[matrix[k] for matrix in results])
+
+    files = np.array([job[0] for job in jobs])
+
+    return (files,) + tuple(results)
+
+
+"""Returns the hit fraction, avg updates and factor of each LUT of a runBatch, as arrays"""
+def summarizeBatch(datfile, files, optima, times, loops, updates):
+    summary = [summarizeRuns(datfile, files, optima[c], times[c], loops[c], updates[c]) for c in range(len(optima))]
+    hit, avg_updates, factor = map(np.array, zip(*summary))
+    return hit, avg_updates, factor
+
+
+"""Returns the hit fraction, avg updates and factor of a set of results, as in the last line of a testrun.pl report"""
+@tracer.traced
+def summarizeRuns(datfile, files, optima, times, loops, updates):
+    dat_files, dat_optima, _ = parseDAT(datfile)
+    opt = dict(zip(dat_files, dat_optima))
+    targets = np.array([opt[cnf] for cnf in files])
+
+    hits = optima <= targets
+    nhits = np.count_nonzero(hits)
+
+    hit = float(nhits) / len(files)
+    if nhits > 0:
+        avg_updates = updates[hits].sum() / float(nhits)
+    else:
+        avg_updates = 0.0
+    factor = np.where(optima == -1, 1000.0, (1.0 + optima) / (1.0 + targets)).sum()
+
+    return hit, avg_updates, factor
+
+
+"""Returns the standard error of the avg updates of summarizeRuns, measured over the trials that hit their target.
+Returns 0.0 with fewer than two hits, when it can't be measured"""
+def updatesError(datfile, files, optima, updates):
+    dat_files, dat_optima, _ = parseDAT(datfile)
+    opt = dict(zip(dat_files, dat_optima))
+    hits = optima <= np.array([opt[cnf] for cnf in files])
+
+    nhits = np.count_nonzero(hits)
+    if nhits < 2:
+        return 0.0
+    return updates[hits].std(ddof=1) / np.sqrt(nhits)
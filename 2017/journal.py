@@ -0,0 +1,78 @@
+#!/usr/bin/python
+import os
+import numpy as np
+
+# Job status, one byte per job
+PENDING = 0
+DONE = 1
+TIMED_OUT = 2
+ELIMINATED = 3
+
+
+class Grid:
+    """The points of itertools.product(values, repeat=dims), in the same order, decoded from their index on demand"""
+
+    def __init__(self, values, dims):
+        self.values = np.asarray(values)
+        self.dims = dims
+
+    def __len__(self):
+        return len(self.values) ** self.dims
+
+    def __getitem__(self, index):
+        if index < 0 or index >= len(self):
+            raise IndexError("Grid index out of range: {0}".format(index))
+        n = len(self.values)
+        digits = [(index // n ** (self.dims - 1 - k)) % n for k in range(self.dims)]
+        return self.values[digits]
+
+
+class ProgressJournal:
+    """Status of every job of a sweep, kept in a memory-mapped file of one byte per job.
+    Marking a job is a single byte write, and reloading the sweep reads the file in one go.
+    An existing journal of another number of jobs, from another sweep, is never overwritten"""
+
+    def __init__(self, filename, n):
+        self.filename = filename
+        if not os.path.exists(filename):
+            with open(filename, 'wb') as f:
+                f.truncate(n)
+        elif os.path.getsize(filename) != n:
+            raise ValueError("{0} is the journal of {1} jobs, not {2}: remove it to start a new sweep".format(
+                filename, os.path.getsize(filename), n))
+        self.status = np.memmap(filename, dtype=np.uint8, mode='r+', shape=(n,))
+
+    def __len__(self):
+        return len(self.status)
+
+    def mark(self, index, status=DONE):
+        self.status[index] = status
+
+    def pending(self):
+        """Returns the indices of the jobs left to do"""
+        return np.flatnonzero(self.status == PENDING)
+
+    def count(self, status=DONE):
+        return np.count_nonzero(self.status == status)
+
+    def importText(self, progfile):
+        """Marks the jobs listed in an old "Job i/N ..." progress file"""
+        try:
+            with open(progfile, 'r') as f:
+                for line in f:
+                    c = line.split()
+                    if len(c) < 3:
+                        continue
+                    index = int(c[1].split('/')[0]) - 1
+                    if c[2] == "Done":
+                        self.status[index] = DONE
+                    elif c[2] == "Eliminated":
+                        self.status[index] = ELIMINATED
+                    else:
+                        self.status[index] = TIMED_OUT
+        except IOError:
+            pass  # No progress file
+
+    def close(self):
+        self.status.flush()
+        del self.status
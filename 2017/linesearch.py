@@ -0,0 +1,128 @@
+#!/usr/bin/python
+import numpy as np
+
+POINTS = 5  # interior points evaluated together in every round, odd so that the best point is reused
+MAX_ROUNDS = 50  # max number of rounds of a line search
+
+# Error flags of a line search
+CONVERGED = 0
+MAX_ROUNDS_REACHED = 1
+FLAT = 2  # every point of a round had the same value
+
+
+class LineSearch:
+    """Bounded line search evaluating several points per round. Every round evaluates points equally spaced inside
+    the bracket and shrinks it to the neighbours of the best point, until the bracket is within xtol of it or the
+    values of the round differ by less than their noise: ftol, or without it the standard error measured at the best
+    point when the values come with one. A round whose values are all equal tells nothing about where the minimum is,
+    and stops the search as FLAT rather than converged"""
+
+    def __init__(self, x1, x2, xtol=1e-5, points=POINTS, ftol=None, maxrounds=MAX_ROUNDS):
+        if x1 > x2:
+            raise ValueError("The lower bound exceeds the upper bound.")
+        self.xtol = xtol
+        self.points = points
+        self.ftol = ftol
+        self.maxrounds = maxrounds
+
+        self.values = {}
+        self.errors = {}
+        self.grid = np.linspace(float(x1), float(x2), points + 2)
+        self.rounds = 0
+        self.done = False
+        self.ierr = MAX_ROUNDS_REACHED
+
+    def ask(self):
+        """Returns the points of the round left to evaluate"""
+        xs = []
+        for x in self.grid[1:-1]:
+            if x not in self.values and x not in xs:
+                xs.append(x)
+        return xs
+
+    def tell(self, xs, fxs, errs=None):
+        """Records the values of the points of the round, and their standard errors if measured, and moves on to the
+        next round"""
+        for x, fx in zip(xs, fxs):
+            self.values[x] = fx
+        if errs is not None:
+            self.errors.update(zip(xs, errs))
+
+        inner = list(self.grid[1:-1])
+        fvals = np.array([self.values[x] for x in inner])
+        j = int(np.argmin(fvals)) + 1
+        a, b = self.grid[j - 1], self.grid[j + 1]
+        self.rounds += 1
+
+        spread = fvals.max() - fvals.min()
+        noise = self.ftol if self.ftol is not None else self.errors.get(self.grid[j])
+
+        if (b - a) / 2.0 <= self.xtol:
+            self.done = True
+            self.ierr = CONVERGED
+        elif spread == 0:
+            self.done = True
+            self.ierr = FLAT
+        elif noise is not None and spread <= noise:
+            self.done = True
+            self.ierr = CONVERGED
+        elif self.rounds >= self.maxrounds:
+            self.done = True
+        else:
+            # the next round is centred on the best point, which keeps its value
+            best = self.grid[j]
+            self.grid = np.linspace(a, b, self.points + 2)
+            if self.points % 2 == 1:
+                self.grid[(self.points + 1) // 2] = best
+
+    def result(self):
+        """Returns the best point, its value, an error flag and the number of evaluations"""
+        xopt = min(self.values, key=self.values.get)
+        return xopt, self.values[xopt], self.ierr, len(self.values)
+
+
+"""Bounded minimization of a scalar function in place of scipy.optimize.fminbound, evaluating several points per
+round so that they can run in parallel. func takes the list of points of a round as its first argument and returns
+their values, or with errors a pair of lists of their values and of their standard errors.
+Returns the best point, and with full_output also its value, an error flag (0 if converged, 1 if maxrounds was
+reached, 2 if a round was flat) and the number of evaluations, as fminbound does"""
+def fminbound(func, x1, x2, args=(), xtol=1e-5, full_output=False, points=POINTS, ftol=None, errors=False,
+              maxrounds=MAX_ROUNDS):
+    search = LineSearch(x1, x2, xtol, points, ftol, maxrounds)
+    while not search.done:
+        xs = search.ask()
+        if len(xs) == 0:
+            search.tell(xs, [])
+        elif errors:
+            search.tell(xs, *func(xs, *args))
+        else:
+            search.tell(xs, func(xs, *args))
+
+    if full_output:
+        return search.result()
+    return search.result()[0]
+
+
+"""Runs a line search within each of the (x1, x2) bounds at once, every round of all of them evaluated together.
+func takes the list of (search index, point) pairs of a round and returns their values, or with errors a pair of
+lists of their values and of their standard errors.
+Returns the fminbound full output of every search"""
+def fminboundBlock(func, bounds, xtol=1e-5, points=POINTS, ftol=None, errors=False, maxrounds=MAX_ROUNDS):
+    searches = [LineSearch(x1, x2, xtol, points, ftol, maxrounds) for x1, x2 in bounds]
+
+    while not all(search.done for search in searches):
+        pairs = [(k, x) for k, search in enumerate(searches) if not search.done for x in search.ask()]
+        fxs, errs = [], None
+        if len(pairs) > 0:
+            if errors:
+                fxs, errs = func(pairs)
+            else:
+                fxs = func(pairs)
+
+        for k, search in enumerate(searches):
+            if not search.done:
+                mine = [c for c, (i, _) in enumerate(pairs) if i == k]
+                search.tell([pairs[c][1] for c in mine], [fxs[c] for c in mine],
+                            None if errs is None else [errs[c] for c in mine])
+
+    return [search.result() for search in searches]
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+import hashlib
+import json
+import sqlite3
+import time
+import numpy as np
+from jobrunner import runLUT, runBatch
+from runstore import hashLUT, hashFile
+
+MAX_ENTRIES = 100000  # max number of evaluations kept on disk
+
+
+"""Returns the cache key of an evaluation of a LUT over a DAT file"""
+def makeKey(dT, A, psize, datfile, trials, seed, weight=None, runtime=None):
+    h = hashlib.sha1()
+    h.update(hashLUT(dT, A, psize).encode())
+    h.update(hashFile(datfile).encode())
+    h.update("{0};{1};{2};{3}".format(int(trials), seed, weight, runtime).encode())
+    return h.hexdigest()
+
+
+class EvaluationCache:
+    """Persistent LRU cache of LUT evaluations, stored in an SQLite file"""
+
+    def __init__(self, path, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS evaluations "
+                        "(key TEXT PRIMARY KEY, results TEXT, last_used REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS evaluations_lru ON evaluations (last_used)")
+        self.db.commit()
+
+    def get(self, key):
+        """Returns the cached files, optima, times, loops and updates, or None if the key is missing"""
+        row = self.db.execute("SELECT results FROM evaluations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.db.execute("UPDATE evaluations SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+
+        res = json.loads(row[0])
+        return (np.array(res["files"]), np.array(res["optima"], dtype=int), np.array(res["times"]),
+                np.array(res["loops"], dtype=int), np.array(res["updates"], dtype=int))
+
+    def put(self, key, results):
+        """Stores the results of an evaluation, evicting the least recently used ones past max_entries"""
+        files, optima, times, loops, updates = results
+        res = json.dumps({"files": list(map(str, files)), "optima": np.asarray(optima).tolist(),
+                          "times": np.asarray(times).tolist(), "loops": np.asarray(loops).tolist(),
+                          "updates": np.asarray(updates).tolist()})
+
+        self.db.execute("INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?)", (key, res, time.time()))
+        self.db.execute("DELETE FROM evaluations WHERE key IN (SELECT key FROM evaluations "
+                        "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+
+    def stats(self):
+        return "Cache: {0} hits, {1} misses, {2} entries".format(self.hits, self.misses, len(self))
+
+    def close(self):
+        self.db.close()
+
+
+"""Runs the LUT through runLUT unless the same evaluation is already cached. Only seeded, complete runs are cached"""
+def cachedRunLUT(cache, lut, dT, A, psize, datfile, trials, seed=None, weight=None, runtime=None, stop=None):
+    if cache is None or seed is None:
+        return runLUT(lut, datfile, trials, seed, weight, runtime, stop=stop)
+
+    key = makeKey(dT, A, psize, datfile, trials, seed, weight, runtime)
+    results = cache.get(key)
+    if results is None:
+        results = runLUT(lut, datfile, trials, seed, weight, runtime, stop=stop)
+        cache.put(key, results)
+
+    return results
+
+
+"""Runs the LUTs through runBatch, skipping those whose evaluation is already cached. Only seeded runs are cached.
+The candidates are the (dT, A, psize) of each LUT file"""
+def cachedRunBatch(cache, luts, candidates, datfile, trials, seed=None, weight=None, runtime=None):
+    if cache is None or seed is None:
+        return runBatch(luts, datfile, trials, seed, weight, runtime)
+
+    keys = [makeKey(dT, A, psize, datfile, trials, seed, weight, runtime) for dT, A, psize in candidates]
+    cached = [cache.get(key) for key in keys]
+    missing = [c for c in range(len(luts)) if cached[c] is None]
+
+    if len(missing) > 0:
+        res = runBatch([luts[c] for c in missing], datfile, trials, seed, weight, runtime)
+        for k, c in enumerate(missing):
+            cached[c] = (res[0],) + tuple(matrix[k] for matrix in res[1:])
+            cache.put(keys[c], cached[c])
+
+    files = cached[0][0]
+    return (files,) + tuple(np.array([res[k] for res in cached]) for k in range(1, 5))
@@ -0,0 +1,173 @@
+#!/usr/bin/python
+import json
+import os
+import sys
+import timeit
+import numpy as np
+from collections import OrderedDict
+from categorizeDAT import makeDAT
+from createLUT import makeLUT
+from utilities import parseCNF, parseDAT, parseLUT, parseOUT, loadDAT, loadOUT, scratchDir
+
+# Sizes of the synthetic inputs, at scale 1
+OUT_LINES = 1000000  # runs in the .out file
+DAT_LINES = 5000  # instances in the DAT file
+LUT_BINS = 100  # rows of the LUT
+CNF_FILES = 1000  # CNF files read by parseCNF
+CNF_VARS = 120  # variables of each CNF file
+CNF_CLAUSES = 1200  # clauses of each CNF file
+
+MIN_TIME = 0.2  # min seconds of every timed repeat, the number of calls is raised until then
+REPEATS = 5  # timed repeats, the best one is kept
+TOLERANCE = 1.5  # slowdown over the baseline counted as a regression
+
+
+"""Returns the list of the paths of n synthetic instances"""
+def instanceNames(n):
+    return ["./ms_random/synthetic/s{0}v{1}c-{2}.cnf".format(CNF_VARS, CNF_CLAUSES, k) for k in range(n)]
+
+
+"""Writes a .out file of n runs spread over the instances, as testrun.pl does"""
+def writeOUT(filename, n, instances, rs):
+    files = rs.randint(len(instances), size=n)
+    optima = rs.randint(0, 300, size=n)
+    times = rs.exponential(1.0, size=n)
+    loops = rs.randint(0, 1000, size=n)
+    updates = rs.randint(0, 10000000, size=n)
+
+    with open(filename, 'w') as f:
+        for k in range(n):
+            f.write("{0} {1} {2:.6f} {3} {4}\n".format(instances[files[k]], optima[k], times[k], loops[k], updates[k]))
+
+
+"""Writes n random CNF files, and returns their paths"""
+def writeCNFs(directory, n, rs):
+    cnfs = []
+    for k in range(n):
+        cnf = os.path.join(directory, "s{0}.cnf".format(k))
+        lits = rs.randint(1, CNF_VARS + 1, size=(CNF_CLAUSES, 2)) * rs.choice([-1, 1], size=(CNF_CLAUSES, 2))
+        with open(cnf, 'w') as f:
+            f.write("c synthetic instance {0}\np cnf {1} {2}\n".format(k, CNF_VARS, CNF_CLAUSES))
+            f.write("".join("{0} {1} 0\n".format(a, b) for a, b in lits))
+        cnfs.append(cnf)
+    return cnfs
+
+
+"""Returns the best time of one call of func(*args) over the repeats"""
+def timeCall(func, args):
+    number = 1
+    while True:
+        elapsed = timeit.timeit(lambda: func(*args), number=number)
+        if elapsed >= MIN_TIME:
+            break
+        number *= 2
+
+    best = elapsed / number
+    for _ in range(REPEATS - 1):
+        best = min(best, timeit.timeit(lambda: func(*args), number=number) / number)
+    return best
+
+
+"""Returns the (name, function, arguments, units per call, unit) of every benchmark, over synthetic inputs written
+into directory at the given scale"""
+def makeBenchmarks(directory, scale=1.0, seed=0):
+    rs = np.random.RandomState(seed)
+    n_out = max(int(OUT_LINES * scale), 1)
+    n_dat = max(int(DAT_LINES * scale), 1)
+    n_cnf = max(int(CNF_FILES * scale), 1)
+    bins = LUT_BINS
+
+    instances = instanceNames(n_dat)
+    optima = rs.randint(0, 300, size=n_dat)
+    times = np.round(rs.exponential(1.0, size=n_dat), 2)
+
+    dat = os.path.join(directory, "bench.dat")
+    makeDAT(dat, instances, optima, times)
+
+    out = os.path.join(directory, "bench.out")
+    writeOUT(out, n_out, instances, rs)
+
+    lut = os.path.join(directory, "bench.lut")
+    dT = rs.uniform(0.1, 2.0, bins)
+    A = rs.uniform(0.0, 1.0, bins)
+    psize = rs.randint(16, 128, bins)
+    makeLUT(lut, bins, dT, A, psize)
+
+    cnfs = writeCNFs(directory, n_cnf, rs)
+
+    def parseCNFs(cnfs):
+        for cnf in cnfs:
+            parseCNF(cnf)
+
+    return [("makeLUT", makeLUT, (os.path.join(directory, "write.lut"), bins, dT, A, psize), bins, "rows"),
+            ("parseLUT", parseLUT, (lut,), bins, "rows"),
+            ("parseOUT", parseOUT, (out,), n_out, "lines"),
+            ("loadOUT", loadOUT, (out,), n_out, "lines"),
+            ("parseDAT", parseDAT, (dat,), n_dat, "lines"),
+            ("loadDAT", loadDAT, (dat,), n_dat, "lines"),
+            ("makeDAT", makeDAT, (os.path.join(directory, "write.dat"), instances, optima, times), n_dat, "lines"),
+            ("parseCNF", parseCNFs, (cnfs,), n_cnf, "files")]
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+    scale = 1.0
+    selected = None
+    baseline = None
+    save = None
+
+    if '-x' in args:
+        i = args.index('-x')
+        scale = float(args[i + 1])
+        del args[i:i + 2]
+    if '-k' in args:
+        i = args.index('-k')
+        selected = args[i + 1].split(',')
+        del args[i:i + 2]
+    if '-b' in args:
+        i = args.index('-b')
+        with open(args[i + 1], 'r') as f:
+            baseline = json.load(f)
+        del args[i:i + 2]
+    if '--save' in args:
+        i = args.index('--save')
+        save = args[i + 1]
+        del args[i:i + 2]
+
+    if len(args) != 1:
+        print("Usage: ./microbench.py [-x scale] [-k name,name,...] [-b baseline] [--save baseline]")
+        sys.exit(1)
+
+    if baseline is not None and baseline["scale"] != scale:
+        print("Warning: the baseline ran at scale {0}".format(baseline["scale"]))
+
+    results = OrderedDict()
+    regressed = False
+
+    print("{0:<12}{1:>14}{2:>20}{3:>12}".format("function", "s/call", "throughput", "baseline"))
+    with scratchDir("microbench.") as scratch:
+        for name, func, fargs, units, unit in makeBenchmarks(scratch, scale):
+            if selected is not None and name not in selected:
+                continue
+
+            seconds = timeCall(func, fargs)
+            results[name] = seconds
+
+            line = "{0:<12}{1:>14.6g}{2:>14.4g} {3:<5}".format(name, seconds, units / seconds, unit + "/s")
+            if baseline is not None and name in baseline["results"]:
+                ratio = seconds / baseline["results"][name]
+                line += "{0:>11.2f}x".format(ratio)
+                if ratio > TOLERANCE:
+                    line += "  REGRESSION"
+                    regressed = True
+            print(line)
+
+    if save is not None:
+        with open(save, 'w') as f:
+            json.dump({"scale": scale, "results": results}, f, indent=1)
+
+    if regressed:
+        sys.exit(1)
+
+    sys.exit(0)
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+import Queue
+import asyncore
+import atexit
+import os
+import smtpd
+import smtplib
+import sys
+import threading
+import time
+
+RATE_LIMIT = 60.0  # min seconds between two notifications, the messages queued meanwhile are sent together
+SMTP_TIMEOUT = 30.0  # seconds before giving up on the mail server
+FLUSH_TIMEOUT = 60.0  # max seconds waited at exit for the pending messages to be sent
+
+SMTP_HOST = "smtp.gmail.com"  # mail server, unless NOTIFY_SMTP_HOST says otherwise
+SMTP_PORT = 587
+NOTIFY_FILE = "notifications.txt"  # where the notifications go without a mail account in the environment
+
+
+class SMTPSink:
+    """Sends every message as an email. Without a password it doesn't log in, and without tls it doesn't STARTTLS"""
+
+    def __init__(self, host, port, sender, recipient, password=None, tls=True):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipient = recipient
+        self.password = password
+        self.tls = tls
+
+    def send(self, msg):
+        server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            if self.tls:
+                server.starttls()
+            if self.password is not None:
+                server.login(self.sender, self.password)
+            server.sendmail(self.sender, self.recipient, '\n' + msg)
+        finally:
+            server.close()
+
+
+class FileSink:
+    """Appends every message to a file, with the time it was sent"""
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def send(self, msg):
+        with open(self.filename, 'a') as f:
+            f.write("[{0}]\n{1}\n\n".format(time.strftime("%Y-%m-%d %H:%M:%S"), msg))
+
+
+class LocalServer(smtpd.SMTPServer):
+    """SMTP server on localhost keeping every message it receives, a stand-in for the mail server in tests.
+    It serves from a background thread until stopped"""
+
+    def __init__(self, port=0):
+        smtpd.SMTPServer.__init__(self, ("localhost", port), None)
+        self.port = self.socket.getsockname()[1]
+        self.messages = []
+        self.thread = threading.Thread(target=asyncore.loop, kwargs={"timeout": 0.1})
+        self.thread.daemon = True
+        self.thread.start()
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        self.messages.append(data)
+
+    def sink(self):
+        """Returns a sink sending to this server"""
+        return SMTPSink("localhost", self.port, "notifier@localhost", "notifier@localhost", tls=False)
+
+    def stop(self):
+        self.close()
+        self.thread.join()
+
+
+class Notifier:
+    """Sends messages to a list of sinks from a background thread, so that a slow or failing sink never holds up the
+    caller. At most one notification goes out every interval seconds: the messages queued meanwhile are coalesced into
+    it. A sink that fails is reported, and its notification dropped"""
+
+    def __init__(self, sinks, interval=RATE_LIMIT):
+        self.sinks = sinks
+        self.interval = interval
+        self.queue = Queue.Queue()
+        self.last = -float("inf")
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def notify(self, msg):
+        """Queues a message, and returns at once"""
+        self.queue.put(msg)
+
+    def run(self):
+        closing = False
+        while not closing:
+            msg = self.queue.get()
+            if msg is None:
+                break
+            pending = [msg]
+
+            # wait out the rate limit, collecting the messages that come in meanwhile, but send at once when closing
+            while True:
+                wait = self.last + self.interval - time.time()
+                try:
+                    msg = self.queue.get(timeout=wait) if wait > 0 else self.queue.get_nowait()
+                except Queue.Empty:
+                    break
+                if msg is None:
+                    closing = True
+                    break
+                pending.append(msg)
+
+            self.deliver(pending)
+
+    def deliver(self, messages):
+        if len(messages) == 1:
+            msg = messages[0]
+        else:
+            msg = "{0} notifications:\n\n".format(len(messages)) + "\n\n".join(messages)
+
+        self.last = time.time()
+        for sink in self.sinks:
+            try:
+                sink.send(msg)
+            except Exception as e:
+                sys.stderr.write("Notification to {0} failed: {1}\n".format(sink.__class__.__name__, e))
+
+    def close(self, timeout=FLUSH_TIMEOUT):
+        """Sends the pending messages and stops, waiting at most timeout seconds for them"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout)
+
+
+notifier = None
+lock = threading.Lock()
+
+
+"""Returns the sinks of notify when not configured: emails through the account given by the NOTIFY_SENDER,
+NOTIFY_PASSWORD and NOTIFY_RECIPIENT environment variables (and NOTIFY_SMTP_HOST, NOTIFY_SMTP_PORT), or without
+them the NOTIFY_FILE file"""
+def defaultSinks():
+    env = os.environ
+    if not all(name in env for name in ("NOTIFY_SENDER", "NOTIFY_PASSWORD", "NOTIFY_RECIPIENT")):
+        return [FileSink(NOTIFY_FILE)]
+    return [SMTPSink(env.get("NOTIFY_SMTP_HOST", SMTP_HOST), int(env.get("NOTIFY_SMTP_PORT", SMTP_PORT)),
+                     env["NOTIFY_SENDER"], env["NOTIFY_RECIPIENT"], env["NOTIFY_PASSWORD"])]
+
+
+"""Sends the notifications of notify to the given sinks from now on, after sending the pending ones"""
+def configure(sinks, interval=RATE_LIMIT):
+    global notifier
+    with lock:
+        if notifier is not None:
+            notifier.close()
+        notifier = Notifier(sinks, interval)
+
+
+"""Queues a message to be sent in the background, to the default sinks unless configured otherwise"""
+def notify(msg):
+    global notifier
+    with lock:
+        if notifier is None:
+            notifier = Notifier(defaultSinks())
+    notifier.notify(msg)
+
+
+@atexit.register
+def flush():
+    if notifier is not None:
+        notifier.close()
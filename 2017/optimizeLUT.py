@@ -1,12 +1,21 @@
 #!/usr/bin/python
+import os
 import sys
-from createLUT import makeLUT
-from subprocess32 import check_call, TimeoutExpired
+from createLUT import makeLUT, DT_BOUNDS, A_BOUNDS, PSIZE_BOUNDS
+from subprocess32 import TimeoutExpired
+from jobrunner import summarizeRuns, summarizeBatch, updatesError, useWorkerPool, drawSeed
+from lutcache import EvaluationCache, cachedRunLUT, cachedRunBatch
+import bayesopt
+import cmaes
+from checkpoint import Checkpoint
+import notifier
+import plotter
+import tracer
+from plotter import plotLUT, plotPsize
 import numpy as np
-from scipy.optimize import fminbound
-import matplotlib.pyplot as plt
+from linesearch import fminbound, fminboundBlock
 import datetime
-from utilities import sendEmail, parseTXT, parseLUT
+from utilities import sendEmail, parseLUT, scratchDir
 
 BOUND_CAP = 0.1  # cap on the bounds
 BOUND_MULTIPLIER = 1.1  # fraction over which the bound can extend
@@ -14,56 +23,37 @@ UPDATE_PENALTY = 10000000  # penalty to give scripts which timeout
 N_ITERS_CAP = 5  # max number of optimization iterations
 RECURSION_LIMIT = 5  # max levels optimizer can branch LUT
 
+cache = None  # EvaluationCache of previous LUT evaluations
+seed = None  # fixed base seed of every evaluation, drawn once per run when not given
+evaluations = 0  # number of LUTs to evaluate in a Bayesian optimization, 0 for the coordinate-wise search
+generations = 0  # number of CMA-ES generations, 0 for the coordinate-wise search
+block = 1  # number of non-adjacent bins line searched at the same time
+checkpoint = Checkpoint()  # saved state of the running optimization loops
+snapshot = None  # image the plots are rendered into without a display, None for an interactive window
 
 
-def plotLUT(dT, A):
-    # Plot A vs t
-    t = np.cumsum(dT)
-    t = t - np.ediff1d(t, to_begin=t[0]) / 2.0  # staggers the time so that it falls in between the bins
-    plt.hold(False)
-    plt.plot(t, A)
-    plt.ylabel("A-Values")
-    plt.xlabel("Time")
-    plt.title("A vs. T")
-    ax = plt.gca()
-    ax.relim()
-    ax.autoscale_view()
-    plt.draw()
-
 
 """Returns the avg updates of a set of conf files using given LUT"""
+@tracer.traced
 def tryLUT(var, tag, filename, trials, dT, A, psize, weight=None, runtime=None, plotenabled=False, verbose=False):
     if len(dT) != len(A) or len(psize) != len(dT) or len(psize) != len(A):
         raise Exception("Vectors dT, A and psize are not the same length!")
 
     bins = len(dT)
-    lut = tag + ".lut"
 
     psize = map(round, psize)
     psize = map(int, psize)
 
-    makeLUT(lut, bins, dT, A, psize)
-
-    args = []
-    args.append('./testrun.pl')  # the program to run
-    args.append('./ssmc')
-    args.append(lut)
-    args.append(filename)
-    args.append(str(trials))
-    args.append(tag)
-
-    if weight and runtime:
-        args.append(weight)
-        args.append(runtime)
-
-    # returns 0 if successful otherwise throws error
+    # runs every trial concurrently and returns the results as arrays, the LUT file lives only as long as the runs
     try:
-        check_call(args)
+        with scratchDir() as scratch:
+            lut = os.path.join(scratch, "lut")
+            makeLUT(lut, bins, dT, A, psize)
+            results = cachedRunLUT(cache, lut, dT, A, psize, filename, trials, seed, weight, runtime)
     except TimeoutExpired:
         return UPDATE_PENALTY
 
-    txtfile = tag + ".txt"
-    hits, updates, factor = parseTXT(txtfile)
+    hits, updates, factor = summarizeRuns(filename, *results)
 
     if hits < 1:
         updates += factor*UPDATE_PENALTY
@@ -80,6 +70,46 @@ def tryLUT(var, tag, filename, trials, dT, A, psize, weight=None, runtime=None,
     return updates
 
 
+"""Returns the avg updates of each (dT, A, psize) candidate, running every candidate in one batch of jobs.
+With errors, also returns the standard error of each, as measured over its trials"""
+@tracer.traced
+def tryLUTBatch(tag, filename, trials, candidates, weight=None, runtime=None, verbose=False, errors=False):
+    rounded = []
+    for dT, A, psize in candidates:
+        if len(dT) != len(A) or len(psize) != len(dT) or len(psize) != len(A):
+            raise Exception("Vectors dT, A and psize are not the same length!")
+
+        rounded.append((dT, A, map(int, map(round, psize))))
+
+    # runs every trial of every candidate concurrently and returns the results as matrices
+    try:
+        with scratchDir() as scratch:
+            luts = []
+            for i, (dT, A, psize) in enumerate(rounded):
+                lut = os.path.join(scratch, "{0}.lut".format(i))
+                makeLUT(lut, len(dT), dT, A, psize)
+                luts.append(lut)
+
+            results = cachedRunBatch(cache, luts, rounded, filename, trials, seed, weight, runtime)
+    except TimeoutExpired:
+        if errors:
+            return UPDATE_PENALTY * np.ones(len(candidates)), np.zeros(len(candidates))
+        return UPDATE_PENALTY * np.ones(len(candidates))
+
+    hits, updates, factor = summarizeBatch(filename, *results)
+
+    updates = np.where(hits < 1, updates + factor*UPDATE_PENALTY, updates)
+
+    if verbose:
+        for i, (dT, A, psize) in enumerate(rounded):
+            print("Tried dT=" + str(dT) + ", A=" + str(A) + ", Psize=" + str(psize) + "  with updates=" + str(updates[i]))
+
+    if errors:
+        files, optima, _, _, runs = results
+        return updates, np.array([updatesError(filename, files, optima[c], runs[c]) for c in range(len(candidates))])
+    return updates
+
+
 def getABounds(bins, row, varvector):
     if row == 0 or row == bins - 1:
         if row == 0:
@@ -113,20 +143,71 @@ def getABounds(bins, row, varvector):
 
 
 def main():
+    global seed
     args = sys.argv
     email = False
     verbose = False
     plotenabled = False
+    resume = False
 
+    if '--resume' in args:
+        resume = True
+        args.remove('--resume')
     if '-m' in args:
         email = True
         args.remove('-m')
+    if '-n' in args:
+        # the notifications go to a file instead of by email
+        i = args.index('-n')
+        notifier.configure([notifier.FileSink(args[i + 1])])
+        email = True
+        del args[i:i + 2]
     if '-v' in args:
         verbose = True
         args.remove('-v')
     if '-p' in args:
         plotenabled = True
         args.remove('-p')
+    if '-g' in args:
+        # plot without a display, into a PNG/SVG snapshot
+        i = args.index('-g')
+        global snapshot
+        snapshot = args[i + 1]
+        plotenabled = True
+        del args[i:i + 2]
+    if '-t' in args:
+        # record the time of every phase of every evaluation
+        i = args.index('-t')
+        tracer.use(args[i + 1])
+        del args[i:i + 2]
+    if '-c' in args:
+        i = args.index('-c')
+        global cache
+        cache = EvaluationCache(args[i + 1])
+        del args[i:i + 2]
+    if '-s' in args:
+        i = args.index('-s')
+        seed = int(args[i + 1])
+        del args[i:i + 2]
+    if '-w' in args:
+        # keep every instance loaded in long-lived ssmc workers
+        useWorkerPool()
+        args.remove('-w')
+    if '-b' in args:
+        i = args.index('-b')
+        global evaluations
+        evaluations = int(args[i + 1])
+        del args[i:i + 2]
+    if '-e' in args:
+        i = args.index('-e')
+        global generations
+        generations = int(args[i + 1])
+        del args[i:i + 2]
+    if '-j' in args:
+        i = args.index('-j')
+        global block
+        block = int(args[i + 1])
+        del args[i:i + 2]
     if len(args) == 7 or len(args) == 9:
         global var
         var = args[1]
@@ -134,7 +215,7 @@ def main():
         xpmt = int(args[2])
 
         if xpmt < 0 or xpmt > 2:
-            print("Usage: ./optimizeLUT dT|A|psize|both <experiment_type (0:fwd/bwd, 1:2 rnd, 2:2 no-cons rnd)> [-v] [-m] [-p] <initialLUT> <filelist.dat> trials tag [\"step weight\" \"runtime\"]\n")
+            print("Usage: ./optimizeLUT dT|A|psize|both <experiment_type (0:fwd/bwd, 1:2 rnd, 2:2 no-cons rnd)> [-v] [-m] [-n notifyfile] [-p] [-g snapshot] [-t tracefile] [-c cachefile] [-s seed] [-w] [-b evaluations] [-e generations] [-j bins] [--resume] <initialLUT> <filelist.dat> trials tag [\"step weight\" \"runtime\"]\n")
             return 1
 
         lutfile = args[3]
@@ -149,10 +230,39 @@ def main():
             runtime = args[8]
 
     else:
-        print("Usage: ./optimizeLUT dT|A|psize|both <experiment_type (0:fwd/bwd, 1:2 rnd, 2:2 no-cons rnd)> [-v] [-m] [-p] <initialLUT> <filelist.dat> trials tag [\"step weight\" \"runtime\"]\n")
+        print("Usage: ./optimizeLUT dT|A|psize|both <experiment_type (0:fwd/bwd, 1:2 rnd, 2:2 no-cons rnd)> [-v] [-m] [-n notifyfile] [-p] [-g snapshot] [-t tracefile] [-c cachefile] [-s seed] [-w] [-b evaluations] [-e generations] [-j bins] [--resume] <initialLUT> <filelist.dat> trials tag [\"step weight\" \"runtime\"]\n")
         return 1
 
-    optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_level=0, email=email, verbose=verbose, plotenabled=plotenabled)
+    # every step of the search is checkpointed, so that rerunning with --resume continues where it stopped
+    global checkpoint
+    checkpoint = Checkpoint(tag + ".CHECKPOINT", resume)
+
+    # common random numbers: every LUT of this run is evaluated on the same (instance, seed) pairs
+    if resume:
+        seed = checkpoint.load("run")["seed"]
+    elif seed is None:
+        seed = drawSeed()
+    checkpoint.save("run", seed=seed)
+    if verbose:
+        print("Seed: {0}".format(seed))
+
+    if evaluations > 0:
+        fmin, dT, A, psize = optimizeBayes(var, lutfile, datfile, trials, tag, weight, runtime, evaluations, verbose=verbose)
+        if email:
+            sendEmail("Bayesian optimization finished!\nOptimal dT: {0}\nOptimal A: {1}\nOptimal psize: {2}\nOptimum # updates: {3}\n".format(dT, A, psize, fmin))
+    elif generations > 0:
+        fmin, dT, A, psize = optimizeCMA(var, lutfile, datfile, trials, tag, weight, runtime, generations, verbose=verbose)
+        if email:
+            sendEmail("CMA-ES optimization finished!\nOptimal dT: {0}\nOptimal A: {1}\nOptimal psize: {2}\nOptimum # updates: {3}\n".format(dT, A, psize, fmin))
+    else:
+        optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_level=0, email=email, verbose=verbose, plotenabled=plotenabled)
+
+    checkpoint.remove()
+
+    if cache is not None:
+        if verbose:
+            print(cache.stats())
+        cache.close()
 
 
     return 0
@@ -161,8 +271,8 @@ def main():
 def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_level=0, email=False, verbose=False, plotenabled=False, start=datetime.datetime.now()):
     if recursion_level == 0:
         if plotenabled:
-            # Turn on interactive plotting
-            plt.ion()
+            # plots are drawn by a renderer process, in a window or into the snapshot image
+            plotter.start(snapshot)
         if verbose:
             print("########## STARTING OPTIMIZATION - " + datetime.datetime.now().strftime(
                 "%a %d/%m/%y %H:%M:%S") + " ##########")
@@ -179,11 +289,18 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
             msg = "Found new minimum: " + str(fval)
             sendEmail(msg)
 
+    # continue from the checkpoint of this loop when resuming
+    key = (recursion_level, var)
+    saved = checkpoint.load(key)
+
     # set initial minimum to initial LUT performance
-    fmin = tryLUT(var, tag, datfile, trials, dT, A, psize, weight, runtime, plotenabled, verbose)
+    if saved is None:
+        fmin = tryLUT(var, tag, datfile, trials, dT, A, psize, weight, runtime, plotenabled, verbose)
+    else:
+        fmin, dT, A, psize = saved["fmin"], saved["dT"], saved["A"], saved["psize"]
 
     if recursion_level >= RECURSION_LIMIT:
-        return fmin, dT, A, psize
+        return fmin, dT, A
 
     if var == 'dT':
         varmin = dT.copy()
@@ -191,6 +308,8 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
         varmin = A.copy()
     elif var == 'psize':
         varmin = psize.copy()
+    if saved is not None and var != "both":
+        varmin = saved["varmin"]
 
     if xpmt == 0:
         indices = np.concatenate((np.arange(bins), np.arange(bins-1)[::-1]))  # [0 1 2 .. bins-1 .. 2 1 0]
@@ -199,19 +318,46 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
 
     if var != "both":
 
-        newLUT = False
+        newLUT = False if saved is None else saved["newLUT"]
 
         # i -> iteration
-        for i in range(N_ITERS_CAP):
+        for i in range(0 if saved is None else saved["i"], N_ITERS_CAP):
             fval = 0
 
-            if xpmt != 0:
-                np.random.shuffle(indices)  # shuffles the indices array for random choice of index to optimize
+            if saved is not None and saved["i"] == i:
+                # pick up the interrupted iteration at the next group of rows
+                indices, groups, position, minFound = saved["indices"], saved["groups"], saved["position"], saved["minFound"]
+            else:
+                if xpmt != 0:
+                    np.random.shuffle(indices)  # shuffles the indices array for random choice of index to optimize
 
-            minFound = False
+                minFound = False
 
-            for row in indices:
-                if var == "dT":
+                if block > 1:
+                    # the last edge has no line search
+                    rows = [row for row in indices if not (var == "dT" and xpmt == 1 and row == bins - 1)]
+                    groups = blockRows(rows, block)
+                else:
+                    groups = [[row] for row in indices]
+                position = 0
+
+            for g in range(position, len(groups)):
+                group = groups[g]
+                row = group[0]
+
+                if len(group) > 1:
+                    fval, dT, A, psize, numfunc = searchBlock(var, group, tag, datfile, trials, dT, A, psize, fmin,
+                                                              weight, runtime, verbose)
+                    if var == "dT":
+                        varvector = dT
+                    elif var == "A":
+                        varvector = A
+                    else:
+                        varvector = psize
+                    x0 = varvector[group]
+                    row = group
+
+                elif var == "dT":
 
                     if xpmt == 1:
                         # skip for the last edge
@@ -226,7 +372,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
 
                         x0, fval, ierr, numfunc = fminbound(f, lbound, ubound, args=(
                             row, tag, datfile, trials, varvector, othervector, psize, weight, runtime),
-                                                            full_output=True, xtol=0.01)
+                                                            full_output=True, xtol=0.01, errors=True)
 
                         edges[row+1] = x0
 
@@ -240,7 +386,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                         x0, fval, ierr, numfunc = fminbound(f, lbound, ubound, args=(
                             row, np.delete(varvector, row), tag, datfile, trials, othervector, psize, weight,
                             runtime, verbose, plotenabled),
-                                                            full_output=True, xtol=0.01)
+                                                            full_output=True, xtol=0.01, errors=True)
                         varvector[row] = x0
 
                 elif var == "A":
@@ -251,7 +397,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                     x0, fval, ierr, numfunc = fminbound(f, lbound, ubound, args=(
                     row, np.delete(varvector, row), tag, datfile, trials, othervector, np.ones(bins)*16, weight,
                     runtime, verbose, plotenabled),
-                                                        full_output=True, xtol=0.01)
+                                                        full_output=True, xtol=0.01, errors=True)
                     varvector[row] = x0
 
                 elif var == "psize":
@@ -262,7 +408,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                     x0, fval, ierr, numfunc = fminbound(f, lbound, ubound, args=(
                         row, np.delete(varvector, row), tag, datfile, trials, othervector, A, weight,
                         runtime, verbose, plotenabled),
-                                                        full_output=True, xtol=0.01)
+                                                        full_output=True, xtol=0.01, errors=True)
                     varvector[row] = x0
 
                 if fval < fmin:
@@ -283,7 +429,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
 
 
                     if plotenabled:
-                        plt.savefig(tag + ".OPTIMAL." + var + ".png")
+                        plotter.savefig(tag + ".OPTIMAL." + var + ".png")
 
                     newLUT = minFound = True
 
@@ -292,6 +438,9 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                     "---------- Found {0}[{1}]={2}".format(var, row, x0) + " at updates " + str(fval) + " after " + str(
                         numfunc) + " tries, {0}/{1} iterations ----------".format(i + 1, N_ITERS_CAP))
 
+                checkpoint.save(key, fmin=fmin, dT=dT, A=A, psize=psize, varmin=varmin, newLUT=newLUT, i=i,
+                                indices=indices, groups=groups, position=g + 1, minFound=minFound)
+
             if email:
                 msg = "Progress: {0}/{1} iterations complete.".format(i + 1, N_ITERS_CAP) + "\n"
                 msg += "Level: {0}\n".format(recursion_level)
@@ -313,6 +462,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                          print(msg)
                     if email:
                          sendEmail(msg)
+                    checkpoint.drop(key)
                     return fmin, dT, A
                 break
 
@@ -320,19 +470,31 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
         fmin1 = fmin2 = fmin
 
         changedLUT = False
+        stage = "A"
 
         lut = tag + ".lut"
         makeLUT(lut, bins, dT, A, np.ones(bins)*16)
 
-        while True:
+        if saved is not None:
+            fmin1, fmin2, changedLUT, stage = saved["fmin1"], saved["fmin2"], saved["changedLUT"], saved["stage"]
+            makeLUT(lut, *saved["lut"])
 
-            fmin1, new_dT, new_A = optimizeLUT('A', lut, datfile, trials, tag, weight, runtime,
-                                                   recursion_level=recursion_level, email=email, verbose=verbose,
-                                                   plotenabled=plotenabled, start=start)
+        while stage != "branch":
 
-            if fmin1 < fmin2 and fmin1 < fmin:
-                makeLUT(lut, bins, new_dT, new_A, np.ones(bins)*16)
-                changedLUT = True
+            if stage == "A":
+                checkpoint.save(key, fmin=fmin, dT=dT, A=A, psize=psize, fmin1=fmin1, fmin2=fmin2,
+                                changedLUT=changedLUT, stage="A", lut=parseLUT(lut))
+
+                fmin1, new_dT, new_A = optimizeLUT('A', lut, datfile, trials, tag, weight, runtime,
+                                                       recursion_level=recursion_level, email=email, verbose=verbose,
+                                                       plotenabled=plotenabled, start=start)
+
+                if fmin1 < fmin2 and fmin1 < fmin:
+                    makeLUT(lut, bins, new_dT, new_A, np.ones(bins)*16)
+                    changedLUT = True
+
+            checkpoint.save(key, fmin=fmin, dT=dT, A=A, psize=psize, fmin1=fmin1, fmin2=fmin2, changedLUT=changedLUT,
+                            stage="dT", lut=parseLUT(lut))
 
             fmin2, new_dT, new_A = optimizeLUT('dT', lut, datfile, trials, tag, weight, runtime,
                                                recursion_level=recursion_level, email=email, verbose=verbose,
@@ -342,23 +504,28 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                 makeLUT(lut, bins, new_dT, new_A, np.ones(bins)*16)
                 changedLUT = True
 
-            if fmin1 > fmin and fmin2 > fmin:
+            stage = "A"
+
+            if fmin1 >= fmin and fmin2 >= fmin:
                 if changedLUT:
                     # if it cannot improve it past the fmin, save the best schedule and break the loop
                     if verbose:
                         print("Cannot improve past fmin. Breaking out of loop...")
-                    break
+                    stage = "branch"
                 else:
                     # if it hasn't improved the given schedule at all, return and break out of the recursion...our job
                     #  is done.
                     if verbose:
                         print("No improvements detected. Returning fmin = {0}".format(fmin))
+                    checkpoint.drop(key)
                     return fmin, dT, A
             else:
                 fmin = min([fmin1, fmin2])
 
     if var == "both":
         lut = tag + ".lut"
+        checkpoint.save(key, fmin=fmin, dT=dT, A=A, psize=psize, fmin1=fmin1, fmin2=fmin2, changedLUT=changedLUT,
+                        stage="branch", lut=parseLUT(lut))
         fmin, dT, A = branchLUT(lut, tag, datfile, trials, weight, runtime, recursion_level, email, plotenabled, verbose, start)
     elif var == 'A':
         A = varmin.copy()
@@ -387,49 +554,210 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                       "!\nOptimal " + var + ": " + str(varmin) + "\nOptimum # updates: " + str(fmin) + "\n"
             sendEmail(msg)
 
+    checkpoint.drop(key)
     return fmin, dT, A
 
 
-def plotPsize(dT, psize):
-    # Plot psize vs t
-    t = np.cumsum(dT)
-    t = t - np.ediff1d(t, to_begin=t[0]) / 2.0  # staggers the time so that it falls in between the bins
-    plt.hold(False)
-    plt.plot(t, psize)
-    plt.ylabel("Population Size")
-    plt.xlabel("Time")
-    plt.title("P-size vs. T")
-    ax = plt.gca()
-    ax.relim()
-    ax.autoscale_view()
-    plt.draw()
+"""Optimizes var globally with a Gaussian process surrogate of log(updates), evaluating the LUTs it proposes by
+expected improvement in batches. Returns the best updates, dT, A and psize"""
+def optimizeBayes(var, lutfile, datfile, trials, tag, weight, runtime, evaluations, verbose=False):
+    bins, dT, A, psize = parseLUT(lutfile)
+
+    if var == 'dT':
+        x0, bounds = dT, [DT_BOUNDS] * bins
+    elif var == 'A':
+        x0, bounds = A, [A_BOUNDS] * bins
+    elif var == 'psize':
+        x0, bounds = psize, [PSIZE_BOUNDS] * bins
+    elif var == 'both':
+        x0, bounds = np.concatenate((dT, A)), [DT_BOUNDS] * bins + [A_BOUNDS] * bins
+    else:
+        raise Exception("Invalid variable argument! Must be \"dT\", \"A\", \"psize\" or \"both\"")
+
+    def schedule(x):
+        if var == 'dT':
+            return x, A, psize
+        elif var == 'A':
+            return dT, x, psize
+        elif var == 'psize':
+            return dT, A, x
+        return x[:bins], x[bins:], psize
+
+    # updates span orders of magnitude once penalties kick in, so the surrogate models their log
+    f = lambda points: np.log(tryLUTBatch(tag, datfile, trials, map(schedule, points), weight, runtime, verbose))
+
+    lower, upper = np.array(bounds, dtype=float).T
+    x, fx, _, _ = bayesopt.minimize(f, lower, upper, evaluations, x0, seed=seed, verbose=verbose)
+
+    dT, A, psize = schedule(x)
+    makeLUT(tag + ".OPTIMAL." + var + ".lut", bins, dT, A, map(int, np.round(psize)))
+
+    if verbose:
+        print("Best # updates: " + str(np.exp(fx)))
+
+    return np.exp(fx), dT, A, psize
+
+
+"""Optimizes var with CMA-ES, evaluating every generation in one batch. With "both", dT, A and psize are searched
+jointly. dT is searched on a log scale. Returns the best updates, dT, A and psize"""
+def optimizeCMA(var, lutfile, datfile, trials, tag, weight, runtime, generations, verbose=False):
+    bins, dT, A, psize = parseLUT(lutfile)
+
+    if var == 'dT':
+        x0, bounds, logscale = dT, [DT_BOUNDS] * bins, [True] * bins
+    elif var == 'A':
+        x0, bounds, logscale = A, [A_BOUNDS] * bins, [False] * bins
+    elif var == 'psize':
+        x0, bounds, logscale = psize, [PSIZE_BOUNDS] * bins, [False] * bins
+    elif var == 'both':
+        x0 = np.concatenate((dT, A, psize))
+        bounds = [DT_BOUNDS] * bins + [A_BOUNDS] * bins + [PSIZE_BOUNDS] * bins
+        logscale = [True] * bins + [False] * (2 * bins)
+    else:
+        raise Exception("Invalid variable argument! Must be \"dT\", \"A\", \"psize\" or \"both\"")
+
+    def schedule(x):
+        if var == 'dT':
+            return x, A, psize
+        elif var == 'A':
+            return dT, x, psize
+        elif var == 'psize':
+            return dT, A, x
+        return x[:bins], x[bins:2 * bins], x[2 * bins:]
+
+    # CMA-ES only ranks the points of a generation, so the updates need no rescaling
+    f = lambda points: tryLUTBatch(tag, datfile, trials, map(schedule, points), weight, runtime, verbose)
+
+    lower, upper = np.array(bounds, dtype=float).T
+    x, fx = cmaes.minimize(f, x0, lower, upper, generations, logscale=logscale, seed=seed, verbose=verbose)
+
+    dT, A, psize = schedule(x)
+    makeLUT(tag + ".OPTIMAL." + var + ".lut", bins, dT, A, map(int, np.round(psize)))
+
+    if verbose:
+        print("Best # updates: " + str(fx))
+
+    return fx, dT, A, psize
+
+
+"""Splits the rows into groups of at most size rows with no two adjacent or equal rows, putting every row in the first
+group it fits in, so that the groups keep roughly the order of the rows"""
+def blockRows(rows, size):
+    groups = []
+    for row in rows:
+        for group in groups:
+            if len(group) < size and all(abs(row - other) > 1 for other in group):
+                group.append(row)
+                break
+        else:
+            groups.append([row])
+    return groups
+
+
+"""Line searches several non-adjacent rows of var at once from the same LUT, every round of all the searches run
+as one batch. The improvements found are then applied in order of gain, and the best of these combined LUTs is kept.
+Returns its updates, dT, A and psize, and the number of LUTs tried"""
+def searchBlock(var, rows, tag, datfile, trials, dT, A, psize, fmin, weight, runtime, verbose=False):
+    bins = len(dT)
+
+    def schedule(row, x, dT, A, psize):
+        # the LUT with var[row], or the edge after it, moved to x
+        if var == "dT":
+            if xpmt == 1:
+                edges = np.insert(np.cumsum(dT), 0, 0)
+                edges[row + 1] = x
+                return np.diff(edges), A, psize
+            dT = dT.copy()
+            dT[row] = x
+        elif var == "A":
+            A = A.copy()
+            A[row] = x
+        else:
+            psize = psize.copy()
+            psize[row] = x
+        return dT, A, psize
+
+    def evaluate(candidates, errors=False):
+        # A is optimized with populations of 16, as in the row by row search
+        if var == "A":
+            candidates = [(c[0], c[1], np.ones(bins) * 16) for c in candidates]
+        return tryLUTBatch(tag, datfile, trials, candidates, weight, runtime, verbose, errors)
+
+    bounds = []
+    for row in rows:
+        if var == "dT":
+            if xpmt == 1:
+                edges = np.insert(np.cumsum(dT), 0, 0)
+                bounds.append((edges[row], edges[row + 2]))
+            else:
+                bounds.append((0.1, 2.0))
+        elif var == "A":
+            bounds.append(getABounds(bins, row, A))
+        else:
+            bounds.append((0.5 * psize[row], 2 * psize[row]))
+
+    # the rounds stop once the updates differ by less than their standard error
+    results = fminboundBlock(lambda pairs: evaluate([schedule(rows[k], x, dT, A, psize) for k, x in pairs], True),
+                             bounds, xtol=0.01, errors=True)
+    numfunc = sum(result[3] for result in results)
+
+    # apply the improvements one by one, largest gain first
+    gains = sorted(((fmin - fx, k, x) for k, (x, fx, _, _) in enumerate(results) if fx < fmin), reverse=True)
+    if len(gains) == 0:
+        return fmin, dT, A, psize, numfunc
+
+    combined = [schedule(rows[gains[0][1]], gains[0][2], dT, A, psize)]
+    for gain, k, x in gains[1:]:
+        combined.append(schedule(rows[k], x, *combined[-1]))
+
+    fvals = [fmin - gains[0][0]]
+    if len(combined) > 1:
+        fvals.extend(evaluate(combined[1:]))
+        numfunc += len(combined) - 1
+
+    best = int(np.argmin(fvals))
+    if verbose:
+        print("Merged {0}/{1} improvements of rows {2} at updates {3}".format(best + 1, len(gains), rows, fvals[best]))
+
+    return (fvals[best],) + tuple(combined[best]) + (numfunc,)
 
 
 def getMinimizer(var):
-    # Minimize var
+    # Minimize var, evaluating every point of a line search round in one batch. Returns their updates and standard
+    # errors, so that the line search stops once the updates differ by less than their noise
+    def batch(candidates, tag, filename, trials, weight, runtime, v, p):
+        updates, errors = tryLUTBatch(tag, filename, trials, candidates, weight, runtime, verbose=v, errors=True)
+        if p:
+            dT, A, psize = candidates[int(np.argmin(updates))]
+            if var == 'psize':
+                plotPsize(dT, psize)
+            else:
+                plotLUT(dT, A)
+        return updates, errors
+
     if var == 'dT':
         if xpmt == 1:
-            def f(edge, edgeI, tag, filename, trials, dT, A, psize, weight, runtime, p=False, v=False):
-                edges = np.insert(np.cumsum(dT), 0, 0)
+            def f(edgelist, edgeI, tag, filename, trials, dT, A, psize, weight, runtime, p=False, v=False):
+                candidates = []
+                for edge in edgelist:
+                    edges = np.insert(np.cumsum(dT), 0, 0)
 
-                edges[edgeI + 1] = edge
+                    edges[edgeI + 1] = edge
 
-                dT = np.diff(edges)
+                    candidates.append((np.diff(edges), A, psize))
 
-                return tryLUT(var, tag, filename, trials, dT, A, psize, weight, runtime, p, v)
+                return batch(candidates, tag, filename, trials, weight, runtime, v, p)
         else:
-            f = lambda x1, i, x2, a1, a2, a3, a4, psize, a5, a6, v, p: tryLUT(var, a1, a2, a3, np.insert(x2, i, x1),
-                                                                       a4, psize, a5,
-                                                                       a6, verbose=v,
-                                                                       plotenabled=p)  # rearranging the arguments for dT
+            f = lambda x1s, i, x2, a1, a2, a3, a4, psize, a5, a6, v, p: batch(
+                [(np.insert(x2, i, x1), a4, psize) for x1 in x1s], a1, a2, a3, a5, a6, v, p)  # rearranging the arguments for dT
     elif var == 'A':
-        f = lambda x1, i, x2, a1, a2, a3, a4, psize, a5, a6, v, p: tryLUT(var, a1, a2, a3, a4, np.insert(x2, i, x1), psize, a5,
-                                                                   a6, verbose=v,
-                                                                   plotenabled=p)  # rearranging the arguments for A
+        f = lambda x1s, i, x2, a1, a2, a3, a4, psize, a5, a6, v, p: batch(
+            [(a4, np.insert(x2, i, x1), psize) for x1 in x1s], a1, a2, a3, a5, a6, v, p)  # rearranging the arguments for A
     elif var == 'both':
         return None
     elif var == 'psize':
-        f = lambda x1, i, x2, a1, a2, a3, a4, a5, a6, a7, v, p: tryLUT(var, a1, a2, a3, a4, a5, np.insert(x2, i, x1), a6, a7, verbose=v, plotenabled=p)
+        f = lambda x1s, i, x2, a1, a2, a3, a4, a5, a6, a7, v, p: batch(
+            [(a4, a5, np.insert(x2, i, x1)) for x1 in x1s], a1, a2, a3, a6, a7, v, p)
     else:
         raise Exception("Invalid variable argument! Must be \"dT\", \"A\", \"psize\" or \"both\"")
     return f
@@ -1,15 +1,21 @@
 #!/usr/bin/python
 
-from optimizeLUT import plotLUT, plotPsize
+from plotter import plotLUT, plotPsize
 from scipy import stats
-from subprocess32 import check_call, TimeoutExpired
+from subprocess32 import TimeoutExpired
+from jobrunner import Eliminated, useWorkerPool, drawSeed
+from lutcache import EvaluationCache, cachedRunLUT, cachedRunBatch
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.optimize import fminbound
+from linesearch import fminbound
 import datetime
+import os
 import sys
 from createLUT import makeLUT
-from utilities import parseOUT, parseLUT, sendEmail
+from utilities import parseDAT, parseLUT, sendEmail, scratchDir
+from checkpoint import Checkpoint
+import notifier
+import plotter
+import tracer
 
 BOUND_CAP = 0.1  # cap on the bounds
 BOUND_MULTIPLIER = 1.1  # fraction over which the bound can extend
@@ -17,22 +23,73 @@ UPDATE_PENALTY = 10000000  # penalty to give scripts which timeout
 N_ITERS_CAP = 5  # max number of optimization iterations
 RECURSION_LIMIT = 5  # max levels optimizer can branch LUT
 THRESHOLD = 0.25  # min threshold before accepting new minimum
+RACE_THRESHOLD = 0.01  # max p-value at which a racing LUT is eliminated as worse
+TSTAT_TOL = 1.0  # t-stats of a line search round closer than this, one standard error, are taken as noise
+RACE_MIN_RUNS = 10  # min number of finished runs before a racing LUT can be eliminated
+RACE_MIN_INSTANCES = 5  # min number of instances the finished runs span, at most all of them, before an elimination
+
+cache = None  # EvaluationCache of previous LUT evaluations
+seed = None  # fixed base seed of every evaluation, drawn once per run when not given
+racing = False  # stop evaluating a LUT as soon as it is confidently worse than the best one
+tried_updates = {}  # updates of every point tried by the current line search
+checkpoint = Checkpoint()  # saved state of the running optimization loops
+snapshot = None  # image the plots are rendered into without a display, None for an interactive window
 
 def main():
+    global seed
     args = sys.argv
     email = False
     verbose = False
     plotenabled = False
+    resume = False
 
+    if '--resume' in args:
+        resume = True
+        args.remove('--resume')
     if '-m' in args:
         email = True
         args.remove('-m')
+    if '-n' in args:
+        # the notifications go to a file instead of by email
+        i = args.index('-n')
+        notifier.configure([notifier.FileSink(args[i + 1])])
+        email = True
+        del args[i:i + 2]
     if '-v' in args:
         verbose = True
         args.remove('-v')
     if '-p' in args:
         plotenabled = True
         args.remove('-p')
+    if '-g' in args:
+        # plot without a display, into a PNG/SVG snapshot
+        i = args.index('-g')
+        global snapshot
+        snapshot = args[i + 1]
+        plotenabled = True
+        del args[i:i + 2]
+    if '-t' in args:
+        # record the time of every phase of every evaluation
+        i = args.index('-t')
+        tracer.use(args[i + 1])
+        del args[i:i + 2]
+    if '-c' in args:
+        i = args.index('-c')
+        global cache
+        cache = EvaluationCache(args[i + 1])
+        del args[i:i + 2]
+    if '-s' in args:
+        i = args.index('-s')
+        seed = int(args[i + 1])
+        del args[i:i + 2]
+    if '-w' in args:
+        # keep every instance loaded in long-lived ssmc workers
+        useWorkerPool()
+        args.remove('-w')
+    if '-r' in args:
+        global racing
+        racing = True
+        args.remove('-r')
     if len(args) == 7 or len(args) == 9:
         global var
         var = args[1]
@@ -40,7 +97,7 @@ def main():
         xpmt = int(args[2])
 
         if xpmt < 0 or xpmt > 2:
-            print("Usage: ./optimizer2 dT|A|psize|both <experiment_type (0:fwd/bwd, 1:2 rnd, 2:2 no-cons rnd)> [-v] [-m] [-p] <initialLUT> <filelist.dat> trials tag [\"step weight\" \"runtime\"]\n")
+            print("Usage: ./optimizer2 dT|A|psize|both <experiment_type (0:fwd/bwd, 1:2 rnd, 2:2 no-cons rnd)> [-v] [-m] [-n notifyfile] [-p] [-g snapshot] [-t tracefile] [-c cachefile] [-s seed] [-w] [-r] [--resume] <initialLUT> <filelist.dat> trials tag [\"step weight\" \"runtime\"]\n")
             return 1
 
         lutfile = args[3]
@@ -55,54 +112,81 @@ def main():
             runtime = args[8]
 
     else:
-        print("Usage: ./optimizer2 dT|A|psize|both <experiment_type (0:fwd/bwd, 1:2 rnd, 2:2 no-cons rnd)> [-v] [-m] [-p] <initialLUT> <filelist.dat> trials tag [\"step weight\" \"runtime\"]\n")
+        print("Usage: ./optimizer2 dT|A|psize|both <experiment_type (0:fwd/bwd, 1:2 rnd, 2:2 no-cons rnd)> [-v] [-m] [-n notifyfile] [-p] [-g snapshot] [-t tracefile] [-c cachefile] [-s seed] [-w] [-r] [--resume] <initialLUT> <filelist.dat> trials tag [\"step weight\" \"runtime\"]\n")
         return 1
 
+    # every step of the search is checkpointed, so that rerunning with --resume continues where it stopped
+    global checkpoint
+    checkpoint = Checkpoint(tag + ".CHECKPOINT", resume)
+
+    # common random numbers: every LUT of this run is evaluated on the same (instance, seed) pairs
+    if resume:
+        seed = checkpoint.load("run")["seed"]
+    elif seed is None:
+        seed = drawSeed()
+    checkpoint.save("run", seed=seed)
+    if verbose:
+        print("Seed: {0}".format(seed))
+
     optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_level=0, email=email, verbose=verbose, plotenabled=plotenabled)
 
+    checkpoint.remove()
+
+    if cache is not None:
+        if verbose:
+            print(cache.stats())
+        cache.close()
+
     return 0
 
 
-"""Returns the negative t-statistic from a t-test from this set of conf files using given LUT to the previous best LUT"""
+"""Returns the negative t-statistic from a paired t-test from this set of conf files using given LUT to the previous best LUT.
+The runs are paired by job, since every evaluation of a run uses the same (instance, seed) pairs"""
+@tracer.traced
 def tryLUT(tag, filename, trials, dT, A, psize, weight=None, runtime=None, plotenabled=False, verbose=False):
     if len(dT) != len(A) or len(psize) != len(dT) or len(psize) != len(A):
         raise Exception("Vectors dT, A and psize are not the same length!")
 
     bins = len(dT)
-    lut = tag + ".lut"
 
     psize = map(round, psize)
     psize = map(int, psize)
 
-    makeLUT(lut, bins, dT, A, psize)
-
-    args = []
-    args.append('./testrun.pl')  # the program to run
-    args.append('./ssmc')
-    args.append(lut)
-    args.append(filename)
-    args.append(str(trials))
-    args.append(tag)
+    global best_updates
 
-    if weight and runtime:
-        args.append(weight)
-        args.append(runtime)
+    # when racing, compare the runs as they finish against the best LUT's runs of the same jobs
+    stop = None
+    if racing and best_updates is not None:
+        files = np.repeat(parseDAT(filename)[0], int(trials))  # the instance of every job
+        stop = lambda finished, optima, times, loops, updates: raceLost(updates[finished], best_updates[finished],
+                                                                        files[finished], len(set(files)))
 
-    # returns 0 if successful otherwise throws error
+    # runs every trial concurrently and returns the results as arrays, the LUT file lives only as long as the runs
     try:
-        check_call(args)
+        with scratchDir() as scratch:
+            lut = os.path.join(scratch, "lut")
+            makeLUT(lut, bins, dT, A, psize)
+            results = cachedRunLUT(cache, lut, dT, A, psize, filename, trials, seed, weight, runtime, stop)
     except TimeoutExpired:
         return UPDATE_PENALTY
+    except Eliminated as e:
+        # censored score: the t-statistic of the runs that finished
+        updates = e.results[4][e.finished]
+        tstat, p = stats.ttest_rel(updates, best_updates[e.finished])
+        if verbose:
+            print("Eliminated dT=" + str(dT) + ", A=" + str(A) + ", Psize=" + str(psize) + " after {0}/{1} runs with a t-stat={2}, p={3}".format(len(updates), len(e.finished), tstat, p))
+        return tstat
 
-    outfile = tag + ".out"
-    _, _, times, loops, updates = parseOUT(outfile)
+    _, _, times, loops, updates = results
+
+    global last_updates
+    last_updates = updates
 
-    global best_updates
     if best_updates is None:
         best_updates = updates
         return 0.0
     else:
-        tstat, p = stats.ttest_ind(updates, best_updates)
+        tstat, p = stats.ttest_rel(updates, best_updates)
 
     if plotenabled:
         global var
@@ -120,11 +204,58 @@ def tryLUT(tag, filename, trials, dT, A, psize, weight=None, runtime=None, plote
         return 0.0
 
 
+"""Returns the score of tryLUT of each (dT, A, psize) candidate against the previous best LUT, running every candidate
+in one batch of jobs. The updates of each candidate are kept in tried_updates under its key"""
+@tracer.traced
+def tryLUTBatch(tag, filename, trials, candidates, keys, weight=None, runtime=None, verbose=False):
+    rounded = []
+    for dT, A, psize in candidates:
+        if len(dT) != len(A) or len(psize) != len(dT) or len(psize) != len(A):
+            raise Exception("Vectors dT, A and psize are not the same length!")
+
+        rounded.append((dT, A, map(int, map(round, psize))))
+
+    # runs every trial of every candidate concurrently and returns the results as matrices
+    try:
+        with scratchDir() as scratch:
+            luts = []
+            for i, (dT, A, psize) in enumerate(rounded):
+                lut = os.path.join(scratch, "{0}.lut".format(i))
+                makeLUT(lut, len(dT), dT, A, psize)
+                luts.append(lut)
+
+            _, _, _, _, updates = cachedRunBatch(cache, luts, rounded, filename, trials, seed, weight, runtime)
+    except TimeoutExpired:
+        return UPDATE_PENALTY * np.ones(len(candidates))
+
+    scores = np.zeros(len(candidates))
+    for i, (dT, A, psize) in enumerate(rounded):
+        tried_updates[keys[i]] = updates[i]
+        tstat, p = stats.ttest_rel(updates[i], best_updates)
+
+        if verbose:
+            print("Tried dT=" + str(dT) + ", A=" + str(A) + ", Psize=" + str(psize) + "  with a t-stat=" + str(tstat) + ", p={0}".format(p))
+
+        if p < THRESHOLD:
+            scores[i] = tstat
+
+    return scores
+
+
+"""Returns whether the updates are confidently worse than the best LUT's updates of the same jobs. Only decides once
+the runs span enough of the instances, so that a LUT is never eliminated for the corpus on a few of them"""
+def raceLost(updates, best, files, instances):
+    if len(updates) < RACE_MIN_RUNS or len(set(files)) < min(RACE_MIN_INSTANCES, instances):
+        return False
+    tstat, p = stats.ttest_rel(updates, best)
+    return tstat > 0 and p < RACE_THRESHOLD
+
+
 def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_level=0, email=False, verbose=False, plotenabled=False, start=datetime.datetime.now()):
     if recursion_level == 0:
         if plotenabled:
-            # Turn on interactive plotting
-            plt.ion()
+            # plots are drawn by a renderer process, in a window or into the snapshot image
+            plotter.start(snapshot)
         if verbose:
             print("########## STARTING OPTIMIZATION - " + datetime.datetime.now().strftime(
                 "%a %d/%m/%y %H:%M:%S") + " ##########")
@@ -141,10 +272,17 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
             msg = "Found new minimum: " + str(fval)
             sendEmail(msg)
 
+    # continue from the checkpoint of this loop when resuming
+    key = (recursion_level, var)
+    saved = checkpoint.load(key)
+
     # set initial minimum to initial LUT performance
     global best_updates
     best_updates = None
-    fmin = tryLUT(tag, datfile, trials, dT, A, psize, weight, runtime, plotenabled, verbose)
+    if saved is None:
+        fmin = tryLUT(tag, datfile, trials, dT, A, psize, weight, runtime, plotenabled, verbose)
+    else:
+        fmin, dT, A, psize, best_updates = saved["fmin"], saved["dT"], saved["A"], saved["psize"], saved["best_updates"]
 
     if recursion_level >= RECURSION_LIMIT:
         return fmin, dT, A, psize
@@ -155,6 +293,8 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
         varmin = A.copy()
     elif var == "psize":
         varmin = psize.copy()
+    if saved is not None and var != "both":
+        varmin = saved["varmin"]
 
     if xpmt == 0:
         indices = np.concatenate((np.arange(bins), np.arange(bins-1)[::-1]))  # [0 1 2 .. bins-1 .. 2 1 0]
@@ -163,18 +303,26 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
 
     if var != "both":
 
-        newLUT = False
+        newLUT = False if saved is None else saved["newLUT"]
 
         # i -> iteration
-        for i in range(N_ITERS_CAP):
+        for i in range(0 if saved is None else saved["i"], N_ITERS_CAP):
             fval = 0
 
-            if xpmt != 0:
-                np.random.shuffle(indices)  # shuffles the indices array for random choice of index to optimize
+            if saved is not None and saved["i"] == i:
+                # pick up the interrupted iteration at the next row
+                indices, position, minFound = saved["indices"], saved["position"], saved["minFound"]
+            else:
+                if xpmt != 0:
+                    np.random.shuffle(indices)  # shuffles the indices array for random choice of index to optimize
+
+                minFound = False
+                position = 0
 
-            minFound = False
+            for k in range(position, len(indices)):
+                row = indices[k]
+                tried_updates.clear()
 
-            for row in indices:
                 if var == "dT":
 
                     if xpmt == 1:
@@ -190,7 +338,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
 
                         x0, fval, ierr, numfunc = fminbound(f, lbound, ubound, args=(
                             row, tag, datfile, trials, varvector, othervector, psize, weight, runtime),
-                                                            full_outplotPsizeput=True, xtol=0.01)
+                                                            full_output=True, xtol=0.01, ftol=TSTAT_TOL)
 
                         edges[row+1] = x0
 
@@ -203,7 +351,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
 
                         x0, fval, ierr, numfunc = fminbound(f, lbound, ubound, args=(
                             row, np.delete(varvector, row), tag, datfile, trials, othervector, psize, weight,
-                            runtime, verbose, plotenabled), full_output=True, xtol=0.01)
+                            runtime, verbose, plotenabled), full_output=True, xtol=0.01, ftol=TSTAT_TOL)
                         varvector[row] = x0
 
                 elif var == "A":
@@ -213,7 +361,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
 
                     x0, fval, ierr, numfunc = fminbound(f, lbound, ubound, args=(
                         row, np.delete(varvector, row), tag, datfile, trials, othervector, psize, weight,
-                        runtime, verbose, plotenabled), full_output=True, xtol=0.01)
+                        runtime, verbose, plotenabled), full_output=True, xtol=0.01, ftol=TSTAT_TOL)
                     varvector[row] = x0
 
                 elif var == "psize":
@@ -223,7 +371,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
 
                     x0, fval, ierr, numfunc = fminbound(f, lbound, ubound, args=(
                         row, np.delete(varvector, row), tag, datfile, trials, othervector, A, weight,
-                        runtime, verbose, plotenabled), full_output=True, xtol=1)
+                        runtime, verbose, plotenabled), full_output=True, xtol=1, ftol=TSTAT_TOL)
 
                     if fval < 0:
                         varvector[row] = int(round(x0))
@@ -231,7 +379,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                 if fval < 0:
                     fmin = fval
 
-                    _, _, _, _, best_updates = parseOUT(tag + ".out")
+                    best_updates = tried_updates[x0]
 
                     varmin = varvector.copy()
 
@@ -247,7 +395,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                         makeLUT(lut, bins, dT, varmin, psize)
 
                     if plotenabled:
-                        plt.savefig(tag + ".OPTIMAL." + var + ".png")
+                        plotter.savefig(tag + ".OPTIMAL." + var + ".png")
 
                     newLUT = minFound = True
 
@@ -256,6 +404,9 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                         "---------- Found {0}[{1}]={2}".format(var, row, varvector[row]) + " at updates " + str(fval) + " after " + str(
                             numfunc) + " tries, {0}/{1} iterations ----------".format(i + 1, N_ITERS_CAP))
 
+                checkpoint.save(key, fmin=fmin, dT=dT, A=A, psize=psize, best_updates=best_updates, varmin=varmin,
+                                newLUT=newLUT, i=i, indices=indices, position=k + 1, minFound=minFound)
+
             if email:
                 msg = "Progress: {0}/{1} iterations complete.".format(i + 1, N_ITERS_CAP) + "\n"
                 msg += "Level: {0}\n".format(recursion_level)
@@ -277,6 +428,7 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                         print(msg)
                     if email:
                         sendEmail(msg)
+                    checkpoint.drop(key)
                     return fmin, dT, A, psize
                 break
 
@@ -284,19 +436,31 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
         fmin1 = fmin2 = fmin
 
         changedLUT = False
+        stage = "A"
 
         lut = tag + ".lut"
         makeLUT(lut, bins, dT, A, psize)
 
-        while True:
+        if saved is not None:
+            fmin1, fmin2, changedLUT, stage = saved["fmin1"], saved["fmin2"], saved["changedLUT"], saved["stage"]
+            makeLUT(lut, *saved["lut"])
 
-            fmin1, new_dT, new_A, new_psize = optimizeLUT('A', lut, datfile, trials, tag, weight, runtime,
-                                               recursion_level=recursion_level, email=email, verbose=verbose,
-                                               plotenabled=plotenabled, start=start)
+        while stage != "branch":
 
-            if fmin1 < fmin2 and fmin1 < fmin:
-                makeLUT(lut, bins, new_dT, new_A, new_psize)
-                changedLUT = True
+            if stage == "A":
+                checkpoint.save(key, fmin=fmin, dT=dT, A=A, psize=psize, best_updates=best_updates, fmin1=fmin1,
+                                fmin2=fmin2, changedLUT=changedLUT, stage="A", lut=parseLUT(lut))
+
+                fmin1, new_dT, new_A, new_psize = optimizeLUT('A', lut, datfile, trials, tag, weight, runtime,
+                                                   recursion_level=recursion_level, email=email, verbose=verbose,
+                                                   plotenabled=plotenabled, start=start)
+
+                if fmin1 < fmin2 and fmin1 < fmin:
+                    makeLUT(lut, bins, new_dT, new_A, new_psize)
+                    changedLUT = True
+
+            checkpoint.save(key, fmin=fmin, dT=dT, A=A, psize=psize, best_updates=best_updates, fmin1=fmin1,
+                            fmin2=fmin2, changedLUT=changedLUT, stage="dT", lut=parseLUT(lut))
 
             fmin2, new_dT, new_A, new_psize = optimizeLUT('dT', lut, datfile, trials, tag, weight, runtime,
                                                recursion_level=recursion_level, email=email, verbose=verbose,
@@ -306,24 +470,29 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                 makeLUT(lut, bins, new_dT, new_A, new_psize)
                 changedLUT = True
 
-            if fmin1 > fmin and fmin2 > fmin:
+            stage = "A"
+
+            if fmin1 >= fmin and fmin2 >= fmin:
                 if changedLUT:
                     # if it cannot improve it past the fmin, save the best schedule and break the loop
                     if verbose:
                         print("Cannot improve past fmin. Breaking out of loop...")
-                    break
+                    stage = "branch"
                 else:
                     # if it hasn't improved the given schedule at all, return and break out of the recursion...our job
                     #  is done.
                     if verbose:
                         print("No improvements detected. Returning fmin = {0}".format(fmin))
+                    checkpoint.drop(key)
                     return fmin, dT, A, psize
             else:
                 fmin = min([fmin1, fmin2])
 
     if var == "both":
         lut = tag + ".lut"
-        fmin, dT, A = branchLUT(lut, tag, datfile, trials, weight, runtime, recursion_level, email, plotenabled, verbose, start)
+        checkpoint.save(key, fmin=fmin, dT=dT, A=A, psize=psize, best_updates=best_updates, fmin1=fmin1, fmin2=fmin2,
+                        changedLUT=changedLUT, stage="branch", lut=parseLUT(lut))
+        fmin, dT, A, psize = branchLUT(lut, tag, datfile, trials, weight, runtime, recursion_level, email, plotenabled, verbose, start)
     elif var == 'A':
         A = varmin.copy()
     elif var == 'psize':
@@ -351,35 +520,53 @@ def optimizeLUT(var, lutfile, datfile, trials, tag, weight, runtime, recursion_l
                       "!\nOptimal " + var + ": " + str(varmin) + "\nOptimum # updates: " + str(fmin) + "\n"
             sendEmail(msg)
 
+    checkpoint.drop(key)
     return fmin, dT, A, psize
 
 
 def getMinimizer(var):
-    # Minimize var
+    # Minimize var, evaluating every point of a line search round in one batch
+    def batch(xs, candidates, tag, filename, trials, weight, runtime, v, p):
+        if racing:
+            # racing stops each LUT early instead, which only works one LUT at a time
+            scores = []
+            for x, (dT, A, psize) in zip(xs, candidates):
+                scores.append(tryLUT(tag, filename, trials, dT, A, psize, weight, runtime, p, v))
+                tried_updates[x] = last_updates
+            return scores
+
+        scores = tryLUTBatch(tag, filename, trials, candidates, xs, weight, runtime, verbose=v)
+        if p:
+            dT, A, psize = candidates[int(np.argmin(scores))]
+            if var == 'psize':
+                plotPsize(dT, psize)
+            else:
+                plotLUT(dT, A)
+        return scores
+
     if var == 'dT':
         if xpmt == 1:
-            def f(edge, edgeI, tag, filename, trials, dT, A, psize, weight, runtime, p=False, v=False):
-                edges = np.insert(np.cumsum(dT), 0, 0)
+            def f(edgelist, edgeI, tag, filename, trials, dT, A, psize, weight, runtime, p=False, v=False):
+                candidates = []
+                for edge in edgelist:
+                    edges = np.insert(np.cumsum(dT), 0, 0)
 
-                edges[edgeI + 1] = edge
+                    edges[edgeI + 1] = edge
 
-                dT = np.diff(edges)
+                    candidates.append((np.diff(edges), A, psize))
 
-                return tryLUT(tag, filename, trials, dT, A, psize, weight, runtime, p, v)
+                return batch(edgelist, candidates, tag, filename, trials, weight, runtime, v, p)
         else:
-            f = lambda x1, i, x2, a1, a2, a3, a4, psize, a5, a6, v, p: tryLUT(a1, a2, a3, np.insert(x2, i, x1),
-                                                                              a4, psize, a5,
-                                                                              a6, verbose=v,
-                                                                              plotenabled=p)  # rearranging the arguments for dT
+            f = lambda x1s, i, x2, a1, a2, a3, a4, psize, a5, a6, v, p: batch(
+                x1s, [(np.insert(x2, i, x1), a4, psize) for x1 in x1s], a1, a2, a3, a5, a6, v, p)  # rearranging the arguments for dT
     elif var == 'A':
-        f = lambda x1, i, x2, a1, a2, a3, a4, psize, a5, a6, v, p: tryLUT(a1, a2, a3, a4, np.insert(x2, i, x1), psize, a5,
-                                                                          a6, verbose=v,
-                                                                          plotenabled=p)  # rearranging the arguments for A
+        f = lambda x1s, i, x2, a1, a2, a3, a4, psize, a5, a6, v, p: batch(
+            x1s, [(a4, np.insert(x2, i, x1), psize) for x1 in x1s], a1, a2, a3, a5, a6, v, p)  # rearranging the arguments for A
     elif var == 'both':
         return None
     elif var == 'psize':
-        f = lambda x1, i, x2, a1, a2, a3, a4, a5, a6, a7, v, p: tryLUT(a1, a2, a3, a4, a5, np.insert(x2, i, x1), a6, a7,
-                                                                       verbose=v, plotenabled=p)
+        f = lambda x1s, i, x2, a1, a2, a3, a4, a5, a6, a7, v, p: batch(
+            x1s, [(a4, a5, np.insert(x2, i, x1)) for x1 in x1s], a1, a2, a3, a6, a7, v, p)
     else:
         raise Exception("Invalid variable argument! Must be \"dT\", \"A\" or \"both\"")
     return f
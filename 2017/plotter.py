@@ -0,0 +1,122 @@
+#!/usr/bin/python
+import Queue
+import atexit
+import multiprocessing
+import time
+import numpy as np
+
+REDRAW_INTERVAL = 1.0  # min seconds between two redraws, only the latest LUT is drawn
+STOP_TIMEOUT = 10.0  # max seconds waited at exit for the renderer to draw what's left
+
+TITLES = {"lut": ("A-Values", "A vs. T"), "psize": ("Population Size", "P-size vs. T")}
+
+
+"""Draws a ("lut", dT, A) or ("psize", dT, psize) request on the current figure"""
+def draw(plt, request):
+    kind, dT, values = request
+
+    t = np.cumsum(dT)
+    t = t - np.ediff1d(t, to_begin=t[0]) / 2.0  # staggers the time so that it falls in between the bins
+
+    ylabel, title = TITLES[kind]
+    plt.cla()
+    plt.plot(t, values)
+    plt.ylabel(ylabel)
+    plt.xlabel("Time")
+    plt.title(title)
+
+
+"""Main loop of the renderer process. Draws the latest plot request at most every interval seconds, in an
+interactive window, or into the snapshot image (PNG, SVG, ... by its extension) without a display"""
+def render(queue, snapshot, interval):
+    import matplotlib
+    if snapshot is not None:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    if snapshot is None:
+        plt.ion()
+
+    latest = None  # latest plot request, not drawn yet
+    last = 0.0
+    running = True
+    while running:
+        wait = interval if latest is None else max(last + interval - time.time(), 0)
+        try:
+            request = queue.get(True, wait)
+        except Queue.Empty:
+            request = ("draw",)
+
+        if request[0] in TITLES:
+            latest = request
+            if time.time() < last + interval:
+                continue
+
+        if latest is not None:
+            draw(plt, latest)
+            latest = None
+            last = time.time()
+            if snapshot is not None:
+                plt.savefig(snapshot)
+
+        if request[0] == "save":
+            plt.savefig(request[1])
+        elif request[0] == "stop":
+            running = False
+
+        if snapshot is None:
+            plt.pause(0.001)  # keeps the window responsive
+
+
+class Plotter:
+    """Sends plot requests to a renderer process, so that plotting never holds up the optimizer"""
+
+    def __init__(self, snapshot=None, interval=REDRAW_INTERVAL):
+        self.queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=render, args=(self.queue, snapshot, interval))
+        self.process.daemon = True
+        self.process.start()
+
+    def plot(self, kind, dT, values):
+        self.queue.put((kind, np.array(dT, dtype=float), np.array(values, dtype=float)))
+
+    def savefig(self, filename):
+        """Saves the figure, with every LUT plotted so far drawn"""
+        self.queue.put(("save", filename))
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        if self.process.is_alive():
+            self.queue.put(("stop",))
+            self.process.join(timeout)
+
+
+plotter = None  # Plotter of the running optimization, None when plotting is off
+
+
+"""Starts plotting, interactively or into a snapshot image"""
+def start(snapshot=None, interval=REDRAW_INTERVAL):
+    global plotter
+    if plotter is None:
+        plotter = Plotter(snapshot, interval)
+
+
+def plotLUT(dT, A):
+    if plotter is not None:
+        plotter.plot("lut", dT, A)
+
+
+def plotPsize(dT, psize):
+    if plotter is not None:
+        plotter.plot("psize", dT, psize)
+
+
+def savefig(filename):
+    if plotter is not None:
+        plotter.savefig(filename)
+
+
+@atexit.register
+def stop():
+    global plotter
+    if plotter is not None:
+        plotter.stop()
+        plotter = None
@@ -1,15 +1,21 @@
 #!/usr/bin/python
 
-from optimizeLUT import tryLUT
-from utilities import parseLUT, parseOUT
+from jobrunner import queryLUT, useRunStore
+from utilities import parseCNF
 import matplotlib.pyplot as plt
 import sys
 import numpy as np
 
 if __name__ == "__main__":
 
+    if '-d' in sys.argv:
+        # answer from the run store, running only what it does not hold yet
+        i = sys.argv.index('-d')
+        useRunStore(sys.argv[i + 1])
+        del sys.argv[i:i + 2]
+
     if len(sys.argv) != 4:
-        print "Usage: ./ratioX.py <LUT> <DAT> tag"
+        print "Usage: ./ratioX.py [-d store] <LUT> <DAT> tag"
         sys.exit(1)
 
     lut = sys.argv[1]
@@ -34,27 +40,12 @@ if __name__ == "__main__":
             line = f.readline()
 
     for cnf in optima.keys():
-        with open(cnf, 'r') as f:
-            line = f.readline()
-            while len(line) > 0:
-                if line.startswith('p'):
-                    p, fmt, varStr, cStr = line.split()
-
-                    var = float(varStr)
-                    clauses = float(cStr)
-
-                    ratio[cnf] = var/clauses
-
-                line = f.readline()
-
-
-    bins, dT, A, psize = parseLUT(lut)
+        var, clauses = parseCNF(cnf)
 
-    tryLUT(var, tag, datfile, 1, dT, A, psize)
+        ratio[cnf] = var/clauses
 
-    outfile = tag + ".out"
 
-    files, _optima, _times, _loops, updates = parseOUT(outfile)
+    files, _optima, _times, _loops, updates = queryLUT(lut, datfile, 1)
 
     x = []
     y = []
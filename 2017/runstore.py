@@ -0,0 +1,161 @@
+#!/usr/bin/python
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from utilities import parseLUT
+
+ROUND_DIGITS = 4  # dT and A are rounded to this many decimals before hashing
+MAX_CHUNKS = 32  # chunks an append leaves before compacting the store
+
+# Columns of every run: the instance file, the LUT hash, the seed, and what ssmc reported
+COLUMNS = ["instance", "lut", "seed", "optimum", "walltime", "loops", "updates"]
+DTYPES = {"seed": np.int64, "optimum": np.int64, "walltime": np.float64, "loops": np.int64, "updates": np.int64}
+
+
+"""Returns a hash of the LUT contents, after rounding dT, A and psize"""
+def hashLUT(dT, A, psize):
+    h = hashlib.sha1()
+    for row in zip(dT, A, psize):
+        h.update("{0:.{3}f}\t{1:.{3}f}\t{2:d}\n".format(float(row[0]), float(row[1]), int(round(row[2])),
+                                                         ROUND_DIGITS).encode())
+    return h.hexdigest()
+
+
+"""Returns the hash of the LUT in a LUT file"""
+def hashLUTFile(lut):
+    _, dT, A, psize = parseLUT(lut)
+    return hashLUT(dT, A, psize)
+
+
+"""Returns the hash of a file's contents"""
+def hashFile(filename):
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        block = f.read(1 << 16)
+        while len(block) > 0:
+            h.update(block)
+            block = f.read(1 << 16)
+    return h.hexdigest()
+
+
+@contextmanager
+def locked(filename, mode):
+    with open(filename, 'a') as f:
+        fcntl.flock(f, mode)
+        yield
+
+
+class RunStore:
+    """Append-only columnar store of ssmc runs. Every append writes a chunk directory holding one .npy file per
+    column; queries memory-map only the columns they need. Once there are more than MAX_CHUNKS chunks, the appends
+    merge them, so that a query never opens more than a few"""
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        # queries hold it shared, and compactions exclusive while they swap chunks
+        self.lock = os.path.join(path, "LOCK")
+
+    def chunks(self):
+        """Returns the finished chunk directories, oldest first"""
+        return sorted(os.path.join(self.path, d) for d in os.listdir(self.path)
+                      if d.startswith("chunk-") and not d.endswith(".tmp"))
+
+    def append(self, lut, files, seeds, optima, times, loops, updates):
+        """Records a set of runs of the LUT with the given hash"""
+        n = len(files)
+        if n == 0:
+            return
+
+        columns = {"instance": np.array(files, dtype=str), "lut": np.array([lut] * n, dtype=str),
+                   "seed": seeds, "optimum": optima, "walltime": times, "loops": loops, "updates": updates}
+
+        # write into a temporary directory and rename it, so that readers never see a partial chunk
+        chunk = os.path.join(self.path, "chunk-{0:017.6f}-{1}-{2}".format(time.time(), os.getpid(),
+                                                                          threading.current_thread().ident))
+        tmp = chunk + ".tmp"
+        os.makedirs(tmp)
+        for name in COLUMNS:
+            np.save(os.path.join(tmp, name + ".npy"), np.asarray(columns[name], dtype=DTYPES.get(name, str)))
+        os.rename(tmp, chunk)
+
+        if len(self.chunks()) > MAX_CHUNKS:
+            self.compact(tiered=True)
+
+    def compact(self, tiered=False):
+        """Merges every chunk into one holding their runs in the same order. Tiered, only once there are more than
+        MAX_CHUNKS, and then the chunks after the oldest while they are smaller than it, all of them once they are
+        not: every run is rewritten a logarithmic number of times. Does nothing while another process is compacting"""
+        with open(os.path.join(self.path, "COMPACT"), 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                return
+
+            # only compactions remove chunks, so that none go away from now on
+            chunks = self.chunks()
+            if tiered:
+                if len(chunks) <= MAX_CHUNKS:
+                    return  # another compaction just merged them
+                sizes = [os.path.getsize(os.path.join(c, "seed.npy")) for c in chunks]
+                if sizes[0] >= sum(sizes[1:]):
+                    chunks = chunks[1:]
+            if len(chunks) < 2:
+                return
+
+            # named after the newest chunk merged, so that it sorts in its place
+            merged = chunks[-1] + "-merged"
+            tmp = merged + ".tmp"
+            os.makedirs(tmp)
+            for name in COLUMNS:
+                np.save(os.path.join(tmp, name + ".npy"), np.concatenate([self.column(c, name) for c in chunks]))
+
+            with locked(self.lock, fcntl.LOCK_EX):
+                os.rename(tmp, merged)
+                for c in chunks:
+                    shutil.rmtree(c)
+
+    def column(self, chunk, name):
+        return np.load(os.path.join(chunk, name + ".npy"), mmap_mode='r')
+
+    def query(self, lut=None, instances=None, columns=COLUMNS):
+        """Returns a dictionary of column arrays of the stored runs, only those of a LUT hash and of a list of
+        instances when given"""
+        parts = dict((name, []) for name in columns)
+
+        with locked(self.lock, fcntl.LOCK_SH):
+            for chunk in self.chunks():
+                mask = None
+                if lut is not None:
+                    mask = self.column(chunk, "lut") == lut
+                    if not mask.any():
+                        continue
+                if instances is not None:
+                    found = np.in1d(self.column(chunk, "instance"), instances)
+                    mask = found if mask is None else mask & found
+
+                for name in columns:
+                    values = self.column(chunk, name)
+                    parts[name].append(np.array(values if mask is None else values[mask]))
+
+        results = {}
+        for name in columns:
+            if len(parts[name]) > 0:
+                results[name] = np.concatenate(parts[name])
+            else:
+                results[name] = np.array([], dtype=DTYPES.get(name, str))
+        return results
+
+    def luts(self):
+        """Returns the hashes of every LUT with stored runs"""
+        return np.unique(self.query(columns=["lut"])["lut"])
+
+    def __len__(self):
+        with locked(self.lock, fcntl.LOCK_SH):
+            return sum(len(self.column(chunk, "seed")) for chunk in self.chunks())
@@ -6,6 +6,7 @@
 
 #include <string.h>
 #include <math.h>
+#include <stdint.h>
 #include "sat.h"
 
 
@@ -114,11 +115,150 @@ int parseHeader(char *line, int *nv, int *nc, potential_t *mw){
 }
 
 
+/**
+ * The clause in \a buf is deduped and copied into the i-th clause of the SAT instance, unless it is a tautology.
+ * @param sat is the SAT instance being loaded.
+ * @param i is the index of the clause.
+ * @param buf holds the terms of the clause (it is modified).
+ * @param len is the number of terms in the clause.
+ * @param w is the weight of the clause.
+ * @return One if the clause was stored, zero if it was a tautology.
+ */
+static int storeClause(SAT sat, int i, int *buf, int len, potential_t w){
+  int j;
+  
+  // Some files were not preprocessed and so need tautology removal.
+  if ( (len = dedupe(buf,len)) == 0 )
+    return 0;
+  
+  sat->clause_weight[i] = w;
+  sat->clause_length[i] = len;
+  sat->clause[i] = (int *) malloc(len*sizeof(int));
+  for (j=0; j<len; ++j)
+    sat->clause[i][j] = buf[j];
+  
+  return 1;
+}
+
+
+/**
+ * Once all the clauses are stored, this computes the total weight and sets the problem type and top weight.
+ * @param sat is the loaded SAT instance.
+ * @param type is the type of file (0: unweighted, 1: partial, 2: weighted), as returned by \a parseHeader.
+ * @param ncls is the number of clauses in the file header (before tautology removal).
+ * @param max_weight is the top weight of the file header.
+ * @return Zero if successful, error code(s) if failed.
+ */
+static int finalizeSAT(SAT sat, int type, int ncls, potential_t max_weight){
+  int i;
+  int max_cls_length = 0;
+  potential_t weight_sum = 0;
+  double avg_cls_length = 0.0;
+#if TRACK_GLOBAL_BIASES
+  int j,k;
+  potential_t w, *total_weight;
+  
+  if ( (total_weight = (potential_t *) calloc(sat->num_vars,sizeof(potential_t))) == NULL ) {
+    return MEMORY_ERROR;
+  }
+#endif
+  
+  for (i=0; i<sat->num_clauses; ++i) {
+    weight_sum += sat->clause_weight[i];
+    avg_cls_length += (double) sat->clause_length[i];
+    if ( sat->clause_length[i] > max_cls_length )
+      max_cls_length = sat->clause_length[i];
+    
+#if TRACK_GLOBAL_BIASES
+    w = sat->clause_weight[i];
+    for (j=0; j<sat->clause_length[i]; ++j) {
+      k = sat->clause[i][j];
+      if( k > 0 ){ // then this variable prefers to be true in this clause...
+        sat->global_bias[k-1] += -w; // so it gets a penalty if it is set to false.
+        total_weight[k-1] += labs(w);
+      } else {          // then it would rather be false...
+        sat->global_bias[(-k)-1] += w; // so it gets a penalty if it is set to true.
+        total_weight[(-k)-1] += labs(w);
+      }
+    }
+#endif
+  }
+  
+#if TRACK_GLOBAL_BIASES
+  for (j=0; j<sat->num_vars; ++j) {
+    if ( total_weight[j] > 0 ) {
+      sat->global_bias[j] = (total_weight[j] + INITIAL_BUILD_RELAXATION*sat->global_bias[j])/(2*total_weight[j]);
+    } else{
+      sat->global_bias[j] = 0.5;
+    }
+  }
+  free(total_weight);
+#endif
+  
+  sat->total_weight = weight_sum;
+  
+  // Finalize our problem type.
+  
+  problem_type = UNKNOWN;
+  avg_cls_length /= ncls;
+  
+  if ( type == 0 ) { // This is an unweighted max-sat problem.
+    
+    topweight = weight_sum;
+    
+    if ( avg_cls_length < 4.01)
+      problem_type = UNWEIGHTED_4_SAT;
+    
+    if ( avg_cls_length < 3.01)
+      problem_type = UNWEIGHTED_3_SAT;
+    
+    if ( avg_cls_length < 2.01)
+      problem_type = UNWEIGHTED_2_SAT;
+    
+  }
+  
+  if ( type == 1 ) { // This is a partial max-sat problem.
+    
+    topweight = max_weight;
+    
+    // Min-sat problems create some strange issues with average clause density.
+    if ( avg_cls_length <= 3.1 ){
+      problem_type = PARTIAL_3_SAT;
+    }
+    
+    if ( avg_cls_length <= 2.1 ){
+      problem_type = PARTIAL_2_SAT;
+    }
+    
+  }
+  
+  if ( type == 2 ){ // This is a weighted max-sat problem.
+    
+    topweight = weight_sum;
+    
+    if ( max_cls_length <= 4) {
+      problem_type = WEIGHTED_4_SAT;
+    }
+    
+    if ( max_cls_length <= 3) {
+      problem_type = WEIGHTED_3_SAT;
+    }
+    
+    if ( max_cls_length <= 2) {
+      problem_type = WEIGHTED_2_SAT;
+    }
+    
+  }
+  
+  return 0;
+}
+
+
 /**
  * This ((un)weighted/partial) SAT instance must be given in DIMACS-CNF format.
  * @param fp points to the file to be read.
  * @param sat_ptr points to the SAT instance to be created.
- * @return Number of variables if successful, zero if failed.
+ * @return Zero if successful, error code(s) if failed.
  */
 int loadDIMACSFile(FILE *fp, SAT *sat_ptr){
   int i,j,k,off,type;
@@ -128,14 +268,7 @@ int loadDIMACSFile(FILE *fp, SAT *sat_ptr){
   size_t linecap = 0;
   ssize_t linelen;
   int nvars,ncls;
-  int max_cls_length = 0;
-  int min_cls_length;
-  potential_t weight_sum = 0;
-  double avg_cls_length = 0.0;
   potential_t w,max_weight;
-#if TRACK_GLOBAL_BIASES
-  potential_t *total_weight;
-#endif
   
   // First skip down until the parameter line is found.
   while ( (linelen = getline(&line, &linecap, fp)) > 0 ){
@@ -159,26 +292,19 @@ int loadDIMACSFile(FILE *fp, SAT *sat_ptr){
       return MEMORY_ERROR;
     }
     
-#if TRACK_GLOBAL_BIASES
-    if ( (total_weight = (potential_t *) calloc(nvars,sizeof(potential_t))) == NULL ) {
-      free(buf);
-      *sat_ptr = NULL;
-      return MEMORY_ERROR;
-    }
-#endif
-    
-    min_cls_length = nvars;
     break;
   }
   
+  if ( sat == NULL ) {
+    *sat_ptr = NULL;
+    return IO_ERROR;
+  }
+  
   // Now start reading in clause lines.
   for (i=0; i<sat->num_clauses; ++i) {
     if ( (linelen = getline(&line, &linecap, fp)) <= 0 ) {
       freeSAT(&sat);
       free(buf);
-#if TRACK_GLOBAL_BIASES
-      free(total_weight);
-#endif
       *sat_ptr = NULL;
       return IO_ERROR;
     }
@@ -204,109 +330,117 @@ int loadDIMACSFile(FILE *fp, SAT *sat_ptr){
       if (buf[j] == 0) break;
     }
     
-    // Some files were not preprocessed and so need tautology removal.
-    if ( j < min_cls_length )
-      min_cls_length = j;
-    j = dedupe(buf,j);
-    
-    
-    if (j == 0) {                 // Then this clause is tautology and can be removed.
+    if ( !storeClause(sat, i, buf, j, w) ) { // Then this clause is tautology and can be removed.
       --i;
       --(sat->num_clauses);
-    } else {                      // Otherwise copy the buffer into the instance.
-      sat->clause_weight[i] = w;
-      weight_sum += w;
-      sat->clause_length[i] = j;
-      avg_cls_length += (double) j;
-      if ( j > max_cls_length )
-        max_cls_length = j;
-      sat->clause[i] = (int *) malloc(j*sizeof(int));
-      for (j=0; j<sat->clause_length[i]; ++j) {
-        sat->clause[i][j] = buf[j];
-        
-#if TRACK_GLOBAL_BIASES
-        if( buf[j] > 0 ){ // then this variable prefers to be true in this clause...
-          sat->global_bias[buf[j]-1] += -w; // so it gets a penalty if it is set to false.
-          total_weight[buf[j]-1] += labs(w);
-        } else {          // then it would rather be false...
-          sat->global_bias[(-buf[j])-1] += w; // so it gets a penalty if it is set to true.
-          total_weight[(-buf[j])-1] += labs(w);
-        }
-#endif
-        
-      }
     }
   }
   
-#if TRACK_GLOBAL_BIASES
-  for (j=0; j<sat->num_vars; ++j) {
-    if ( total_weight[j] > 0 ) {
-      sat->global_bias[j] = (total_weight[j] + INITIAL_BUILD_RELAXATION*sat->global_bias[j])/(2*total_weight[j]);
-    } else{
-      sat->global_bias[j] = 0.5;
-    }
+  // Free the buffer memory and point to our newly minted instance.
+  free(buf);
+  free(line);
+  
+  if ( finalizeSAT(sat, type, ncls, max_weight) ) {
+    freeSAT(&sat);
+    *sat_ptr = NULL;
+    return MEMORY_ERROR;
   }
-  free(total_weight);
-#endif
   
-  // Point to our newly minted instance and free the buffer memory.
-  sat->total_weight = weight_sum;
   *sat_ptr = sat;
-  free(buf);
   
-  // Finalize our problem type.
+  return 0;
+}
+
+
+/**
+ * Checks whether the file starts with the binary instance magic string. The file is rewound.
+ * @param fp points to the file to be checked.
+ * @return One if the file is a binary instance, zero otherwise.
+ */
+int isBinaryFile(FILE *fp){
+  char magic[BINARY_MAGIC_LENGTH];
+  int n;
   
-  problem_type = UNKNOWN;
-  avg_cls_length /= ncls;
+  n = fread(magic, 1, BINARY_MAGIC_LENGTH, fp);
+  rewind(fp);
   
-  if ( type == 0 ) { // This is an unweighted max-sat problem.
-    
-    topweight = weight_sum;
-    
-    if ( avg_cls_length < 4.01)
-      problem_type = UNWEIGHTED_4_SAT;
-    
-    if ( avg_cls_length < 3.01)
-      problem_type = UNWEIGHTED_3_SAT;
-    
-    if ( avg_cls_length < 2.01)
-      problem_type = UNWEIGHTED_2_SAT;
-    
+  return (n == BINARY_MAGIC_LENGTH) && (memcmp(magic, BINARY_MAGIC, BINARY_MAGIC_LENGTH) == 0);
+}
+
+
+/**
+ * This SAT instance must be given in the binary format written by cnfbin.py:
+ * a header (magic, type, variables, header clauses, stored clauses, top weight, number of terms),
+ * followed by the clause offsets (int64, one more than the clauses), the clause weights (int64) and the terms (int32).
+ * Clauses are stored exactly as in the DIMACS file, so deduping and tautology removal are done here as for text.
+ * @param fp points to the file to be read.
+ * @param sat_ptr points to the SAT instance to be created.
+ * @return Zero if successful, error code(s) if failed.
+ */
+int loadBinaryFile(FILE *fp, SAT *sat_ptr){
+  int i,j,len;
+  int *buf;
+  SAT sat = NULL;
+  char magic[BINARY_MAGIC_LENGTH];
+  int32_t type, nvars, ncls, nstored;
+  int64_t max_weight, nlits;
+  int64_t *offsets, *weights;
+  int32_t *lits;
+  
+  if ( fread(magic, 1, BINARY_MAGIC_LENGTH, fp) != BINARY_MAGIC_LENGTH
+      || memcmp(magic, BINARY_MAGIC, BINARY_MAGIC_LENGTH) != 0
+      || fread(&type, sizeof(int32_t), 1, fp) != 1
+      || fread(&nvars, sizeof(int32_t), 1, fp) != 1
+      || fread(&ncls, sizeof(int32_t), 1, fp) != 1
+      || fread(&nstored, sizeof(int32_t), 1, fp) != 1
+      || fread(&max_weight, sizeof(int64_t), 1, fp) != 1
+      || fread(&nlits, sizeof(int64_t), 1, fp) != 1 ) {
+    *sat_ptr = NULL;
+    return IO_ERROR;
   }
   
-  if ( type == 1 ) { // This is a partial max-sat problem.
-    
-    topweight = max_weight;
-    
-    // Min-sat problems create some strange issues with average clause density.
-    if ( avg_cls_length <= 3.1 ){
-      problem_type = PARTIAL_3_SAT;
-    }
-    
-    if ( avg_cls_length <= 2.1 ){
-      problem_type = PARTIAL_2_SAT;
-    }
-    
+  offsets = (int64_t *) malloc((nstored+1)*sizeof(int64_t));
+  weights = (int64_t *) malloc((nstored+1)*sizeof(int64_t));
+  lits = (int32_t *) malloc((nlits+1)*sizeof(int32_t));
+  buf = (int *) malloc((nvars+1)*sizeof(int));
+  if ( offsets == NULL || weights == NULL || lits == NULL || buf == NULL ) {
+    free(offsets); free(weights); free(lits); free(buf);
+    *sat_ptr = NULL;
+    return MEMORY_ERROR;
   }
   
-  if ( type == 2 ){ // This is a weighted max-sat problem.
-    
-    topweight = weight_sum;
-    
-    if ( max_cls_length <= 4) {
-      problem_type = WEIGHTED_4_SAT;
-    }
-    
-    if ( max_cls_length <= 3) {
-      problem_type = WEIGHTED_3_SAT;
-    }
-    
-    if ( max_cls_length <= 2) {
-      problem_type = WEIGHTED_2_SAT;
-    }
+  if ( fread(offsets, sizeof(int64_t), nstored+1, fp) != (size_t) (nstored+1)
+      || fread(weights, sizeof(int64_t), nstored, fp) != (size_t) nstored
+      || fread(lits, sizeof(int32_t), nlits, fp) != (size_t) nlits
+      || initSAT(&sat, nvars, nstored) ) {
+    free(offsets); free(weights); free(lits); free(buf);
+    *sat_ptr = NULL;
+    return IO_ERROR;
+  }
+  
+  for (i=j=0; j<nstored; ++j) {
+    // Terms past the number of variables are dropped, as when reading a text file.
+    len = offsets[j+1] - offsets[j];
+    if ( len > nvars )
+      len = nvars;
+    memcpy(buf, lits + offsets[j], len*sizeof(int));
     
+    if ( storeClause(sat, i, buf, len, weights[j]) )
+      ++i;
+    else                          // Then this clause is tautology and can be removed.
+      --(sat->num_clauses);
   }
   
+  free(offsets); free(weights); free(lits); free(buf);
+  
+  if ( finalizeSAT(sat, type, ncls, max_weight) ) {
+    freeSAT(&sat);
+    *sat_ptr = NULL;
+    return MEMORY_ERROR;
+  }
+  
+  *sat_ptr = sat;
+  
   return 0;
 }
 
@@ -17,6 +17,9 @@
 #include "gmp.h"
 #endif
 
+#define BINARY_MAGIC "SSMCCNF1"  ///< First bytes of a binary instance file.
+#define BINARY_MAGIC_LENGTH 8
+
 int problem_type;
 int clen;           /// The length of clause strings (in words).
 int tlen;           /// The length of clause strings (in numbs).
@@ -45,6 +48,8 @@ struct sat_st {
 // Constuctors and I/O routines. Potentials are expected to be loaded from files.
 int initSAT(SAT *sat_ptr, int nvars, int ncls); ///< Initialize memory for a sat instance.
 int loadDIMACSFile(FILE *fp, SAT *sat_ptr);     ///< Create a SAT instance from a file.
+int isBinaryFile(FILE *fp);                     ///< Whether the file is a binary instance (see cnfbin.py).
+int loadBinaryFile(FILE *fp, SAT *sat_ptr);     ///< Create a SAT instance from a binary file.
 void freeSAT(SAT *sat_ptr);                     ///< Deallocation routine for a SAT instance.
 void printSAT(FILE *fp, SAT sat);               ///< Print in DIMACS format.
 
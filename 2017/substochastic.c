@@ -30,7 +30,7 @@ extern potential_t topweight;
 extern int lenW;
 extern int *W;
 
-static int popsize,runmode;
+static int popsize,runmode,default_popsize;
 static double weight, end_weight, runtime, runstep;
 static potential_t optimal;
 
@@ -39,25 +39,25 @@ static potential_t optimal;
 
 void update(double a, double b, double mean, Population P, int parity);
 int parseCommand(int argc, char **argv, Population *Pptr, LUT *lut);
+int loadLUT(char *filename, LUT *lut);
+int loadInstance(char *filename, Population *Pptr);
+int solve(Population pop, LUT lut, Bitstring solution, clock_t beg);
+int serve(int argc, char **argv);
 int descend(Population P);
+void resetBits();
 void shuffleBits();
 
 int main(int argc, char **argv){
-  int parity, try, err, updates;
-  double mean;
-  double a, b, t, dt;
+  int err;
   Population pop;
-  potential_t local_min, min = -1;      //the best minimum from different trials
   Bitstring solution;   //the corresponding bitstring
   clock_t beg, end;     //for code timing
   double time_spent;    //for code timing
   LUT lut;
   
-#if TRACK_GLOBAL_BIASES
-  int i;
-  word_t u;
-#endif
-  
+  if ( argc >= 2 && strcmp(argv[1], "-w") == 0 ) {
+    return serve(argc, argv);
+  }
   
   beg = clock();
   
@@ -74,6 +74,39 @@ int main(int argc, char **argv){
     return err;
   }
   
+  err = solve(pop, lut, solution, beg);
+  
+  freeBitstring(&solution);
+
+  return err;
+}
+
+
+/**
+ * Runs the substochastic schedule of the LUT on the population until the target optimum is reached or time runs out.
+ * Every new minimum is reported on stdout as it is found.
+ * @param pop is the population, already loaded with the SAT instance.
+ * @param lut is the schedule to follow.
+ * @param solution holds the best bitstring found.
+ * @param beg is the clock time the run started at.
+ * @return Zero if the target was reached, one if time ran out, error code(s) if failed.
+ */
+int solve(Population pop, LUT lut, Bitstring solution, clock_t beg){
+  int parity, try, updates;
+  double mean;
+  double a, b, t, dt;
+  potential_t local_min, min = -1;      //the best minimum from different trials
+  clock_t end;          //for code timing
+  double time_spent = 0;    //for code timing
+  
+#if GREEDY_DESCENT
+  int err;
+#endif
+#if TRACK_GLOBAL_BIASES
+  int i;
+  word_t u;
+#endif
+  
   
   randomPopulation(pop,popsize);
 #if GREEDY_DESCENT
@@ -92,7 +125,7 @@ int main(int argc, char **argv){
   }
   fflush(stdout);
   min = pop->winner->potential;
-  if (min <= optimal) exit(0);
+  if (min <= optimal) return 0;
   
   try = 0;
   updates = 0;
@@ -207,22 +240,18 @@ int main(int argc, char **argv){
 #endif
 
   }
-  
-  freeBitstring(&solution);
 
   return 0;
 }
 
 
 int parseCommand(int argc, char **argv, Population *Pptr, LUT *lut) {
-  SAT sat;
-  int i, seed;
-  FILE *fp;
-  Population pop;
+  int err, seed;
   
   if ( argc < 3 || argc > 5 ) {
     fprintf(stderr, "Usage: %s <LUT.txt> <instance.cnf> \n",argv[0]);
     fprintf(stderr, "Usage: %s <LUT.txt> <instance.cnf> [<target optimum> [<seed>]]\n",argv[0]);
+    fprintf(stderr, "Usage: %s -w <instance.cnf>   (worker mode, reads \"<LUT.txt> <target optimum> <seed>\" jobs from stdin)\n",argv[0]);
     return 2;
   }
   
@@ -238,26 +267,91 @@ int parseCommand(int argc, char **argv, Population *Pptr, LUT *lut) {
   printf("c LUT: %s\n", argv[1]);
   printf("c Input: %s\n", argv[2]);
 
-  if ( (fp = fopen(argv[1], "r")) == NULL ){
-    fprintf(stderr,"Could not open file %s, error: %s\n",argv[1],strerror(errno));
+  if ( (err = loadLUT(argv[1], lut)) ){
+    return err;
+  }
+  
+  if ( argc >= 4 ) {
+    
+    optimal = atoi(argv[3]);
+    
+    if ( argc == 5 )
+      seed = atoi(argv[4]);
+    else
+      seed = time(0);
+
+  } else {
+      
+    optimal = 0;
+    seed = time(0);
+    
+  }
+  
+  srand48(seed);
+  
+  if ( (err = loadInstance(argv[2], Pptr)) ){
+    return err;
+  }
+  
+  printf("c Target potential: %ld\n", optimal);
+  printf("c Top potential: %ld\n", topweight);
+  printf("c Seed: %i\n", seed);
+  
+  return 0;
+}
+
+
+/**
+ * @param filename is the path of the LUT file.
+ * @param lut points to the LUT instance to be created.
+ * @return Zero if successful, error code(s) if failed.
+ */
+int loadLUT(char *filename, LUT *lut) {
+  FILE *fp;
+  
+  if ( (fp = fopen(filename, "r")) == NULL ){
+    fprintf(stderr,"Could not open file %s, error: %s\n",filename,strerror(errno));
     return IO_ERROR;
   }
 
   // Create LUT here
   if ( ( initLUT(fp, lut)) ){
-      fprintf(stderr,"Error reading in LUT file %s\n",argv[1]);
+      fprintf(stderr,"Error reading in LUT file %s\n",filename);
+      fclose(fp);
       return IO_ERROR;
   }
 
   fclose(fp);
+  
+  return 0;
+}
+
 
-  if ( (fp = fopen(argv[2], "r")) == NULL ){
-    fprintf(stderr,"Could not open file %s, error: %s\n",argv[2], strerror(errno));
+/**
+ * Loads the SAT instance, sets the run parameters for its problem type and creates the population.
+ * @param filename is the path of the DIMACS file, or of a binary instance written by cnfbin.py.
+ * @param Pptr points to the population to be created.
+ * @return Zero if successful, error code(s) if failed.
+ */
+int loadInstance(char *filename, Population *Pptr) {
+  SAT sat;
+  FILE *fp;
+  Population pop;
+  
+  if ( (fp = fopen(filename, "r")) == NULL ){
+    fprintf(stderr,"Could not open file %s, error: %s\n",filename, strerror(errno));
     return IO_ERROR;
   }
   
-  if ( loadDIMACSFile(fp,&sat) ){
-    fprintf(stderr,"Error reading in DIMACS SAT file %s\n",argv[2]);
+  if ( isBinaryFile(fp) ) {
+    if ( loadBinaryFile(fp,&sat) ){
+      fprintf(stderr,"Error reading in binary SAT file %s\n",filename);
+      fclose(fp);
+      return IO_ERROR;
+    }
+  } else if ( loadDIMACSFile(fp,&sat) ){
+    fprintf(stderr,"Error reading in DIMACS SAT file %s\n",filename);
+    fclose(fp);
     return IO_ERROR;
   }
   
@@ -369,33 +463,15 @@ int parseCommand(int argc, char **argv, Population *Pptr, LUT *lut) {
   }
   
   
-  if ( argc >= 4 ) {
-    
-    optimal = atoi(argv[3]);
-    
-    if ( argc == 5 )
-      seed = atoi(argv[4]);
-    else
-      seed = time(0);
-
-  } else {
-      
-    optimal = 0;
-    seed = time(0);
-    
-  }
-
   // Initialize the array of indices where walkers will walk.
   // Right now this is set to all the variables.
-  lenW = sat->num_vars;
+  W = (int *) malloc(sat->num_vars*sizeof(int));
+  resetBits();
   
   // Optimize over at most 300 variables
 /*  if (lenW > 300) {
 	lenW=300;
   } */
-  W = (int *) malloc(lenW*sizeof(int));
-  for (i=0; i<lenW; ++i)
-    W[i] = i;
   
   
   // Break out of attempt to put way too large a problem into the system.
@@ -414,12 +490,8 @@ int parseCommand(int argc, char **argv, Population *Pptr, LUT *lut) {
   //  printf("c Starting runtime: %.0f\n", runtime);
   //  printf("c Runtime step per loop: %.0f\n", runstep);
   //  printf("c Step weight: %.3f\n", weight);
-  printf("c Target potential: %ld\n", optimal);
-  printf("c Top potential: %ld\n", topweight);
+  default_popsize = popsize;
   arraysize = 3*popsize;
-  
-  srand48(seed);
-  printf("c Seed: %i\n", seed);
 
   if ( initPopulation(&pop, sat, runmode) ) {
     fprintf(stderr,"Could not initialize potential.\n");
@@ -432,6 +504,82 @@ int parseCommand(int argc, char **argv, Population *Pptr, LUT *lut) {
 }
 
 
+/**
+ * Worker mode: the instance is loaded once, then jobs are read from stdin, one per line, as
+ * "<LUT.txt> <target optimum> <seed>". Each job is solved exactly as a standalone run with the same
+ * arguments would be, and its output is terminated by a "c Done" line. Runs until stdin is closed.
+ * @return Zero if successful, error code(s) if failed.
+ */
+int serve(int argc, char **argv) {
+  int err, seed;
+  Population pop;
+  Bitstring solution;
+  LUT lut;
+  clock_t beg, end;
+  char *line = NULL;
+  size_t linecap = 0;
+  char lutfile[4096];
+  
+  if ( argc != 3 ) {
+    fprintf(stderr, "Usage: %s -w <instance.cnf>\n",argv[0]);
+    return 2;
+  }
+  
+  printf("c Input: %s\n", argv[2]);
+  
+  beg = clock();
+  
+  if ( (err = loadInstance(argv[2], &pop)) ){
+    return err;
+  }
+  
+  end = clock();
+  printf("c Problem loaded: %f seconds\n", (double)(end - beg)/CLOCKS_PER_SEC);
+  printf("c Top potential: %ld\n", topweight);
+  printf("c Done\n");
+  fflush(stdout);
+  
+  if ( (err = initBitstring(&solution)) ){
+    fprintf(stderr, "Could not initialize answerspace.\n");
+    return err;
+  }
+  
+  while ( getline(&line, &linecap, stdin) > 0 ) {
+    if ( sscanf(line, "%4095s %ld %d", lutfile, &optimal, &seed) < 3 ) {
+      fprintf(stderr, "Invalid job: %s", line);
+      printf("c Done\n");
+      fflush(stdout);
+      continue;
+    }
+    
+    beg = clock();
+    
+    if ( loadLUT(lutfile, &lut) == 0 ) {
+      printf("c LUT: %s\n", lutfile);
+      printf("c Target potential: %ld\n", optimal);
+      printf("c Seed: %i\n", seed);
+      
+      // Start from the same state as a fresh process would.
+      srand48(seed);
+      popsize = default_popsize;
+      resetBits();
+      
+      solve(pop, lut, solution, beg);
+      freeLUT(&lut);
+    }
+    
+    printf("c Done\n");
+    fflush(stdout);
+  }
+  
+  free(line);
+  freeBitstring(&solution);
+  freePopulation(&pop);
+  
+  return 0;
+}
+
+
 void update(double a, double b, double mean, Population P, int parity){
   int i,j,k;
   double p,e;
@@ -557,6 +705,15 @@ int descend(Population P){
   return 0;
 }
 
+// Walk over all the variables, in order.
+void resetBits(){
+  int i;
+  
+  lenW = nbts;
+  for (i=0; i<lenW; ++i)
+    W[i] = i;
+}
+
 // Fisher-Yates
 void shuffleBits(){
   int i,r,temp;
@@ -0,0 +1,462 @@
+#!/usr/bin/python
+"""
+Substochastic Monte Carlo in NumPy, following solve() and update() in substochastic.c.
+
+Every trial of an instance runs at once: the walkers of all trials are kept in one flat array of bit-packed
+words, sorted by trial, and each update advances every walker of every trial in a handful of array operations.
+Trials keep their own schedule clock, so they move through the LUT rows and restart loops independently.
+A trial that hits its target or runs out of time drops its walkers, so the others no longer pay for them.
+
+Unlike ssmc, the walltime reported for a trial is its share of the batch's time, in proportion to its walkers,
+and random numbers come from NumPy rather than drand48, so runs are not bit-for-bit reproductions of ssmc runs
+with the same seed. It is an experimental engine: it is still several times slower than ssmc per update, and no
+optimizer evaluates with it.
+"""
+import sys
+import time
+import numpy as np
+from cnfbin import loadInstance
+from utilities import parseDAT, parseLUT
+
+MAX_TIME = 60  # seconds before a trial gives up, like ssmc
+WORD_BITS = 64
+
+# Problem types, as in macros.h
+UNKNOWN = 0
+UNWEIGHTED_2_SAT = 10
+UNWEIGHTED_3_SAT = 11
+UNWEIGHTED_4_SAT = 12
+PARTIAL_2_SAT = 20
+PARTIAL_3_SAT = 21
+WEIGHTED_2_SAT = 30
+WEIGHTED_3_SAT = 31
+WEIGHTED_4_SAT = 32
+
+instances = {}  # Problems already loaded, by file name
+
+
+class Problem:
+    """A SAT instance after tautology removal, with the run parameters ssmc would use for it"""
+
+    def __init__(self, inst):
+        self.nvars = inst.nvars
+        self.nwords = (inst.nvars - 1) // WORD_BITS + 1
+
+        lits, offsets, weights = dedupe(inst)
+        self.weights = weights
+        self.starts = offsets[:-1]
+        self.lengths = np.diff(offsets)
+        var = np.abs(lits) - 1
+        self.lit_word = var // WORD_BITS
+        self.lit_shift = (var % WORD_BITS).astype(np.uint64)
+        self.lit_pos = lits > 0
+
+        # Literals of every variable, grouped by variable, and the clause of each
+        self.lit_clause = np.repeat(np.arange(len(self.lengths)), self.lengths)
+        self.occ_lits = np.argsort(var, kind='mergesort')
+        self.occ_count = np.bincount(var, minlength=self.nvars)
+        self.occ_start = np.concatenate(([0], np.cumsum(self.occ_count)[:-1]))
+
+        self.classify(inst.type, inst.ncls, inst.max_weight, np.diff(offsets))
+        self.parameters()
+
+    def classify(self, type, ncls, max_weight, lengths):
+        """Sets the problem type and top weight, as finalizeSAT does"""
+        total_weight = self.weights.sum()
+        avg_cls_length = lengths.sum() / float(ncls)
+        max_cls_length = lengths.max()
+
+        self.total_weight = total_weight
+        self.problem_type = UNKNOWN
+
+        if type == 0:
+            self.topweight = total_weight
+            if avg_cls_length < 2.01:
+                self.problem_type = UNWEIGHTED_2_SAT
+            elif avg_cls_length < 3.01:
+                self.problem_type = UNWEIGHTED_3_SAT
+            elif avg_cls_length < 4.01:
+                self.problem_type = UNWEIGHTED_4_SAT
+        elif type == 1:
+            self.topweight = max_weight
+            if avg_cls_length <= 2.1:
+                self.problem_type = PARTIAL_2_SAT
+            elif avg_cls_length <= 3.1:
+                self.problem_type = PARTIAL_3_SAT
+        else:
+            self.topweight = total_weight
+            if max_cls_length <= 2:
+                self.problem_type = WEIGHTED_2_SAT
+            elif max_cls_length <= 3:
+                self.problem_type = WEIGHTED_3_SAT
+            elif max_cls_length <= 4:
+                self.problem_type = WEIGHTED_4_SAT
+
+    def parameters(self):
+        """Sets the step weight, runtime and initial population size, as loadInstance does"""
+        n = self.nvars
+        w = self.total_weight
+        t = self.problem_type
+
+        if t == UNWEIGHTED_2_SAT:
+            weight, runtime, popsize = w / 5000.0, np.exp(0.022 * n + 4.8), 16
+        elif t == PARTIAL_2_SAT:
+            weight, runtime, popsize = w / 60000.0, np.exp(0.018 * n + 3.7), 16
+        elif t == WEIGHTED_2_SAT:
+            weight, runtime, popsize = w / 5000.0, np.exp(0.022 * n + 5.9), 16
+        elif t == UNWEIGHTED_3_SAT:
+            weight, runtime, popsize = w / 5000.0, np.exp(0.035 * n + 6.1), 64
+        elif t == PARTIAL_3_SAT:
+            weight, runtime, popsize = w / 16000.0, np.exp(0.031 * n + 4.4), 16
+        elif t == WEIGHTED_3_SAT:
+            weight, runtime, popsize = w / 5000.0, np.exp(0.028 * n + 6.2), 16
+        elif t == UNWEIGHTED_4_SAT or t == WEIGHTED_4_SAT:
+            weight, runtime, popsize = w / 8000.0, np.exp(0.032 * n + 9.3), 128
+        else:
+            weight, runtime, popsize = w / 5000.0, float(n * n // 100), 1024
+
+        # Break out of attempt to put way too large a problem into the system.
+        if runtime > 8000000:
+            runtime = 8000000
+            weight = 0.1
+        if runtime < 500:
+            runtime = 500
+
+        self.weight, self.runtime, self.popsize = weight, runtime, popsize
+
+    def potentials(self, words):
+        """Returns the total weight of the clauses each walker (row of packed words) fails"""
+        bits = (words[:, self.lit_word] >> self.lit_shift) & np.uint64(1)
+        true = bits.astype(bool) == self.lit_pos
+        sat = np.logical_or.reduceat(true, self.starts, axis=1)
+        return (~sat).astype(np.int64).dot(self.weights)
+
+    def literals(self, words, walker, lit):
+        """Returns whether each literal is true for its walker"""
+        bits = (words[walker, self.lit_word[lit]] >> self.lit_shift[lit]) & np.uint64(1)
+        return bits.astype(bool) == self.lit_pos[lit]
+
+    def flipped(self, words, var):
+        """Returns the change in potential of each walker (row of packed words, already flipped) from flipping the
+        given variable. Only the clauses of that variable are evaluated, which makes a step much cheaper than
+        recomputing the potential"""
+        # one pair per walker and clause of its variable, lit being the literal of the variable in that clause
+        walker = np.repeat(np.arange(len(var)), self.occ_count[var])
+        lit = self.occ_lits[ranges(self.occ_start[var], self.occ_count[var])]
+        clause = self.lit_clause[lit]
+
+        # number of true literals of each clause, after the flip
+        pair = np.repeat(np.arange(len(lit)), self.lengths[clause])
+        true = self.literals(words, walker[pair], ranges(self.starts[clause], self.lengths[clause]))
+        count = np.bincount(pair, weights=true, minlength=len(lit))
+
+        # a clause with no true literal was just broken, one whose only true literal is the flipped one just fixed
+        broken = count == 0
+        fixed = (count == 1) & self.literals(words, walker, lit)
+        delta = self.weights[clause] * (broken.astype(np.int64) - fixed)
+        return np.bincount(walker, weights=delta, minlength=len(var)).astype(np.int64)
+
+
+"""Returns the concatenation of the index ranges [starts[i], starts[i] + lengths[i])"""
+def ranges(starts, lengths):
+    ends = np.cumsum(lengths)
+    return np.arange(ends[-1] if len(ends) > 0 else 0) + np.repeat(starts - ends + lengths, lengths)
+
+
+"""Returns the literals, offsets and weights of an instance after deduping and tautology removal, as ssmc does"""
+def dedupe(inst):
+    lits = np.asarray(inst.lits, dtype=np.int64)
+    lengths = inst.lengths()
+    clause = np.repeat(np.arange(len(lengths)), lengths)
+
+    order = np.lexsort((lits, np.abs(lits), clause))
+    lits, clause = lits[order], clause[order]
+
+    same_var = np.concatenate(([False], (clause[1:] == clause[:-1]) & (np.abs(lits[1:]) == np.abs(lits[:-1]))))
+    tautology = np.zeros(len(lengths), dtype=bool)
+    tautology[clause[same_var & np.concatenate(([False], lits[1:] != lits[:-1]))]] = True
+
+    keep = ~same_var & ~tautology[clause]
+    lits, clause = lits[keep], clause[keep]
+    kept = np.flatnonzero(~tautology)
+    lengths = np.bincount(clause, minlength=len(lengths))[kept]
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+    return lits, offsets, np.asarray(inst.weights, dtype=np.int64)[kept]
+
+
+"""Returns the Problem of an instance file, loading it only once"""
+def getProblem(filename):
+    if filename not in instances:
+        instances[filename] = Problem(loadInstance(filename))
+    return instances[filename]
+
+
+class Batch:
+    """Independent trials of the SSMC schedule on one problem, advanced together"""
+
+    def __init__(self, problem, times, vals, psizes, optimal, trials, rs):
+        self.problem = problem
+        self.times = np.asarray(times, dtype=float) * problem.runtime
+        self.vals = np.asarray(vals, dtype=float)
+        self.psizes = np.asarray(psizes, dtype=int)
+        self.optimal = optimal
+        self.rs = rs
+        self.T = trials
+
+        # Results, as the last "o" and "c Walltime" lines of ssmc would report them
+        self.opt = -np.ones(trials, dtype=np.int64)
+        self.walltime = -np.ones(trials)
+        self.res_loops = -np.ones(trials, dtype=np.int64)
+        self.res_updates = -np.ones(trials, dtype=np.int64)
+
+        # Schedule state of each trial
+        self.row = np.zeros(trials, dtype=int)
+        self.t = np.zeros(trials)
+        self.loops = np.zeros(trials, dtype=np.int64)
+        self.updates = np.zeros(trials, dtype=np.int64)
+        self.popsize = np.full(trials, problem.popsize, dtype=int)
+        self.best = np.zeros(trials, dtype=np.int64)
+        self.local_min = np.zeros(trials, dtype=np.int64)
+        self.winner = np.zeros(trials, dtype=np.int64)
+        self.active = np.ones(trials, dtype=bool)
+        self.clock = np.zeros(trials)  # seconds of the batch spent on each trial
+
+        # Walkers of every trial, sorted by trial
+        self.words = np.zeros((0, problem.nwords), dtype=np.uint64)
+        self.pot = np.zeros(0, dtype=np.int64)
+        self.owner = np.zeros(0, dtype=int)
+
+    def segments(self):
+        """Returns the number of walkers and the index of the first walker of each trial"""
+        counts = np.bincount(self.owner, minlength=self.T)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        return counts, starts
+
+    def replace(self, trials, words, pot, owner):
+        """Swaps the walkers of the given trials for new ones, keeping the walkers sorted by trial"""
+        keep = ~np.in1d(self.owner, trials)
+        self.words = np.concatenate((self.words[keep], words))
+        self.pot = np.concatenate((self.pot[keep], pot))
+        self.owner = np.concatenate((self.owner[keep], owner))
+        order = np.argsort(self.owner, kind='mergesort')
+        self.words, self.pot, self.owner = self.words[order], self.pot[order], self.owner[order]
+
+    def randomize(self, trials):
+        """Gives the trials a fresh uniformly random population, and makes its best walker the winner"""
+        owner = np.repeat(trials, self.popsize[trials])
+        n = len(owner) * self.problem.nwords
+        words = np.frombuffer(self.rs.bytes(8 * n), dtype=np.uint64).reshape(len(owner), self.problem.nwords)
+        pot = self.problem.potentials(words)
+        self.replace(trials, words, pot, owner)
+
+        counts, starts = self.segments()
+        self.winner[trials] = np.minimum.reduceat(self.pot, starts[trials]) if len(trials) > 0 else 0
+
+    def resize(self, trials, sizes):
+        """Grows or shrinks the populations of the trials, cloning random walkers, as reallocatePopulation does"""
+        counts, starts = self.segments()
+        rank = np.arange(len(self.owner)) - starts[self.owner]
+        target = counts.copy()
+        target[trials] = sizes
+
+        # Shrink by dropping the last walkers; grow by cloning random walkers of the old population.
+        extra = np.maximum(target - counts, 0)
+        grow = np.flatnonzero(extra)
+        src = np.repeat(starts[grow], extra[grow]) + \
+            (self.rs.random_sample(extra[grow].sum()) * np.repeat(counts[grow], extra[grow])).astype(int)
+
+        keep = rank < target[self.owner]
+        self.words = np.concatenate((self.words[keep], self.words[src]))
+        self.pot = np.concatenate((self.pot[keep], self.pot[src]))
+        self.owner = np.concatenate((self.owner[keep], self.owner[src]))
+        order = np.argsort(self.owner, kind='mergesort')
+        self.words, self.pot, self.owner = self.words[order], self.pot[order], self.owner[order]
+
+    def retire(self, trials):
+        """Stops the trials, dropping their walkers"""
+        self.active[trials] = False
+        keep = self.active[self.owner]
+        self.words, self.pot, self.owner = self.words[keep], self.pot[keep], self.owner[keep]
+
+    def report(self, trials, values):
+        """Records new minima, as ssmc prints "o" and "c Walltime" lines"""
+        trials = trials[values[trials] < self.problem.topweight]
+        self.opt[trials] = values[trials]
+        self.walltime[trials] = self.clock[trials]
+        self.res_loops[trials] = self.loops[trials]
+        self.res_updates[trials] = self.updates[trials]
+
+    def startRows(self, trials):
+        """Sets the population size of each trial to that of its current row"""
+        if len(trials) > 0:
+            self.popsize[trials] = self.psizes[self.row[trials]]
+            self.resize(trials, self.popsize[trials])
+
+    def advance(self):
+        """Moves trials whose row is over to their next row, restarting those at the end of the schedule"""
+        nrows = len(self.times)
+        while True:
+            over = np.flatnonzero(self.active & (self.t >= self.times[np.minimum(self.row, nrows - 1)]))
+            if len(over) == 0:
+                return
+
+            self.row[over] += 1
+            self.t[over] = 0
+
+            # End of the schedule: start a new loop from a random population.
+            done = over[self.row[over] >= nrows]
+            if len(done) > 0:
+                self.best[done] = np.minimum(self.best[done], self.local_min[done])
+                self.loops[done] += 1
+                self.row[done] = 0
+                self.randomize(done)
+                self.local_min[done] = self.best[done]
+
+            self.startRows(over)
+
+    def update(self):
+        """Performs one update of every active trial. Only active trials have walkers"""
+        counts, starts = self.segments()
+        trials = np.flatnonzero(self.active & (counts > 0))
+
+        a = self.vals[self.row]
+        b = 1 - a
+        a = a * self.problem.weight
+
+        # Population statistics, per trial
+        ps = counts.astype(float)
+        avg = np.zeros(self.T)
+        mn = np.zeros(self.T)
+        mx = np.zeros(self.T)
+        avg[trials] = np.bincount(self.owner, weights=self.pot, minlength=self.T)[trials] / ps[trials]
+        mn[trials] = np.minimum.reduceat(self.pot, starts[trials])
+        mx[trials] = np.maximum.reduceat(self.pot, starts[trials])
+
+        mean = avg + (mx - mn) * (self.popsize - ps) / (2.0 * self.popsize)
+        dt = np.zeros(self.T)
+        dt[trials] = 0.9 / (a + b * np.maximum(mx - mean, mean - mn))[trials]
+        a_dt = (a * dt)[self.owner]
+        b_dt = (b * dt)[self.owner]
+
+        # Every walker steps, spawns, dies or stays.
+        p = self.rs.random_sample(len(self.owner))
+        step = p < a_dt
+        p -= a_dt
+        e = b_dt * (mean[self.owner] - self.pot)
+        spawn = ~step & (p < e)
+        die = ~step & ~spawn & (p < -e)
+
+        walkers = np.flatnonzero(step)
+        bit = (self.rs.random_sample(len(walkers)) * self.problem.nvars).astype(int)
+        self.words[walkers, bit // WORD_BITS] ^= np.uint64(1) << (bit % WORD_BITS).astype(np.uint64)
+        self.pot[walkers] += self.problem.flipped(self.words[walkers], bit)
+
+        copies = np.repeat(np.arange(len(self.owner)), 1 + spawn - die)
+        self.words, self.pot, self.owner = self.words[copies], self.pot[copies], self.owner[copies]
+
+        counts, starts = self.segments()
+        self.updates[trials] += counts[trials]
+        self.t[trials] += dt[trials]
+
+        # A trial whose population died out restarts from its winner's potential
+        empty = trials[counts[trials] == 0]
+        if len(empty) > 0:
+            self.randomize(empty)
+            counts, starts = self.segments()
+
+        alive = trials[counts[trials] > 0]
+        low = np.zeros(self.T, dtype=np.int64)
+        low[alive] = np.minimum.reduceat(self.pot, starts[alive])
+        self.winner[alive] = np.minimum(self.winner[alive], low[alive])
+
+        better = alive[self.winner[alive] < self.local_min[alive]]
+        if len(better) > 0:
+            self.local_min[better] = self.winner[better]
+            self.report(better, self.local_min)
+
+            hit = better[self.local_min[better] <= self.optimal]
+            if len(hit) > 0:
+                self.retire(hit)
+
+    def tick(self, seconds, counts):
+        """Shares seconds of the batch among the trials, in proportion to their walkers"""
+        total = counts.sum()
+        if total > 0:
+            self.clock += seconds * counts / float(total)
+
+    def run(self, max_time=MAX_TIME):
+        """Runs every trial until it hits the target, or until max_time seconds of the batch were spent on it"""
+        begin = time.time()
+        trials = np.arange(self.T)
+
+        self.randomize(trials)
+        self.tick(time.time() - begin, self.popsize.astype(float))
+        self.report(trials, self.winner)
+        self.best[:] = self.winner
+        self.local_min[:] = self.winner
+        self.retire(trials[self.best <= self.optimal])
+        self.startRows(trials[self.active])
+
+        last = time.time()
+        while self.active.any():
+            counts, _ = self.segments()
+            self.advance()
+            self.update()
+
+            now = time.time()
+            self.tick(now - last, counts)
+            last = now
+
+            over = np.flatnonzero(self.active & (self.clock > max_time))
+            if len(over) > 0:
+                self.retire(over)
+
+        return self.opt, self.walltime, self.res_loops, self.res_updates
+
+
+"""Runs trials of the schedule on an instance at once, each for at most max_time seconds. Returns the optima, times,
+loops and updates of each trial"""
+def runSSMC(filename, times, vals, psizes, optimal, trials, seed=None, max_time=MAX_TIME):
+    rs = np.random.RandomState(seed)
+    batch = Batch(getProblem(filename), times, vals, psizes, optimal, int(trials), rs)
+    return batch.run(max_time)
+
+
+"""Runs a LUT file against every instance of a DAT file in-process. Returns the files, optima, times, loops and updates as arrays, like jobrunner.runLUT"""
+def runLUT(lut, datfile, trials, seed=None, max_time=MAX_TIME):
+    _, dT, A, psize = parseLUT(lut)
+    return runSchedule(dT, A, psize, datfile, trials, seed, max_time)
+
+
+"""Runs a schedule against every instance of a DAT file in-process. Returns the files, optima, times, loops and updates as arrays"""
+def runSchedule(dT, A, psize, datfile, trials, seed=None, max_time=MAX_TIME):
+    files, optima, _ = parseDAT(datfile)
+    trials = int(trials)
+    rs = np.random.RandomState(seed)
+
+    results = []
+    for i, cnf in enumerate(files):
+        results.append(runSSMC(cnf, dT, A, psize, optima[i], trials, rs.randint(1 << 31), max_time))
+
+    return (np.repeat(files, trials),) + tuple(np.concatenate(r) for r in zip(*results))
+
+
+def main():
+    if len(sys.argv) < 4 or len(sys.argv) > 5:
+        print("Usage: ./substochastic.py <LUT.txt> <filelist.dat> trials [seed]")
+        return 1
+
+    seed = None
+    if len(sys.argv) == 5:
+        seed = int(sys.argv[4])
+
+    files, optima, times, loops, updates = runLUT(sys.argv[1], sys.argv[2], sys.argv[3], seed)
+    for i in range(len(files)):
+        print("{0} {1} {2} {3} {4}".format(files[i], optima[i], times[i], loops[i], updates[i]))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
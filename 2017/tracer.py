@@ -0,0 +1,179 @@
+#!/usr/bin/python
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+SLOWEST = 10  # instances listed in the summary
+SLOT_TID = 1000  # trace thread id of the first job runner slot
+
+tracer = None  # Tracer of the running optimization, None when tracing is off
+
+
+class Tracer:
+    """Records timed phases as Chrome trace events, one JSON object per line, so that a trace can be read while it is
+    being written and loaded in chrome://tracing once converted by ./tracer.py -c"""
+
+    def __init__(self, filename):
+        self.file = open(filename, 'a')
+        self.lock = threading.Lock()
+        self.named = set()
+        self.pid = os.getpid()
+
+    def record(self, name, begin, end, tid=None, **args):
+        """Records a phase that ran from begin to end, in seconds since the epoch, on a thread (the calling one if
+        None, else a runner slot number)"""
+        if tid is None:
+            tid = threading.current_thread().ident
+            label = threading.current_thread().name
+        else:
+            tid, label = SLOT_TID + tid, "slot {0}".format(tid)
+
+        event = {"name": name, "ph": "X", "ts": int(begin * 1e6), "dur": int((end - begin) * 1e6),
+                 "pid": self.pid, "tid": tid, "args": args}
+
+        with self.lock:
+            if tid not in self.named:
+                self.named.add(tid)
+                self.write({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": label}})
+            self.write(event)
+
+    def write(self, event):
+        self.file.write(json.dumps(event) + "\n")
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+"""Traces every phase into the given file from now on"""
+def use(filename):
+    global tracer
+    tracer = Tracer(filename)
+    return tracer
+
+
+"""Records a phase that ran from begin to end, if tracing"""
+def record(name, begin, end, tid=None, **args):
+    if tracer is not None:
+        tracer.record(name, begin, end, tid, **args)
+
+
+"""Records the phase of the with block, if tracing"""
+@contextmanager
+def span(name, **args):
+    if tracer is None:
+        yield
+        return
+    begin = time.time()
+    try:
+        yield
+    finally:
+        tracer.record(name, begin, time.time(), **args)
+
+
+"""Decorates a function to record each of its calls as a phase named after it, if tracing"""
+def traced(func):
+    @functools.wraps(func)
+    def call(*args, **kwargs):
+        if tracer is None:
+            return func(*args, **kwargs)
+        with span(func.__name__):
+            return func(*args, **kwargs)
+    return call
+
+
+@atexit.register
+def close():
+    if tracer is not None:
+        tracer.close()
+
+
+"""Returns the complete events of a trace file"""
+def readTrace(filename):
+    events = []
+    with open(filename, 'r') as f:
+        for line in f:
+            if len(line.strip()) > 0:
+                events.append(json.loads(line))
+    return events
+
+
+"""Returns a summary of a trace: the total time of every phase, and the slowest instances by mean trial time. The load
+of a trial is the time from starting ssmc to its problem loaded line, of which ssmc reports the ssmc load"""
+def summarize(events, slowest=SLOWEST):
+    phases = defaultdict(lambda: [0, 0.0])
+    instances = defaultdict(lambda: defaultdict(float))
+
+    for event in events:
+        if event["ph"] != "X":
+            continue
+        seconds = event["dur"] / 1e6
+        phases[event["name"]][0] += 1
+        phases[event["name"]][1] += seconds
+
+        cnf = event["args"].get("instance")
+        if cnf is not None:
+            instances[cnf][event["name"]] += seconds
+            if event["name"] == "load":
+                instances[cnf]["reported load"] += event["args"].get("load", 0.0)
+            elif event["name"] == "solve":
+                instances[cnf]["trials"] += 1
+                instances[cnf]["wait"] += event["args"].get("wait", 0.0)
+
+    lines = ["{0:<16}{1:>10}{2:>14}{3:>14}".format("phase", "count", "total (s)", "mean (s)")]
+    for name, (count, total) in sorted(phases.items(), key=lambda p: -p[1][1]):
+        lines.append("{0:<16}{1:>10}{2:>14.3f}{3:>14.6f}".format(name, count, total, total / count))
+
+    def mean(timings, name):
+        return timings[name] / max(timings["trials"], 1)
+
+    def trial(timings):
+        return mean(timings, "load") + mean(timings, "solve")
+
+    lines.append("")
+    lines.append("Slowest instances, mean seconds per trial:")
+    lines.append("{0:>8}{1:>10}{2:>10}{3:>11}{4:>10}{5:>10}  {6}".format("trials", "trial", "load", "ssmc load",
+                                                                         "solve", "wait", "instance"))
+    for cnf, timings in sorted(instances.items(), key=lambda i: -trial(i[1]))[:slowest]:
+        lines.append("{0:>8d}{1:>10.4f}{2:>10.4f}{3:>11.4f}{4:>10.4f}{5:>10.4f}  {6}".format(
+            int(timings["trials"]), trial(timings), mean(timings, "load"), mean(timings, "reported load"),
+            mean(timings, "solve"), mean(timings, "wait"), cnf))
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+    chrome = None
+    slowest = SLOWEST
+
+    if '-c' in args:
+        i = args.index('-c')
+        chrome = args[i + 1]
+        del args[i:i + 2]
+    if '-n' in args:
+        i = args.index('-n')
+        slowest = int(args[i + 1])
+        del args[i:i + 2]
+
+    if len(args) != 2:
+        print("Usage: ./tracer.py [-c chrome.json] [-n slowest] <trace.jsonl>")
+        sys.exit(1)
+
+    events = readTrace(args[1])
+
+    if chrome is not None:
+        # chrome://tracing and Perfetto load a JSON object holding the list of events
+        with open(chrome, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    print(summarize(events, slowest))
+
+    sys.exit(0)
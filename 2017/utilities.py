@@ -1,9 +1,22 @@
 #!/usr/bin/python
-import smtplib
+import os
+import shutil
+import tempfile
 import numpy as np
+from contextlib import contextmanager
+from cnfbin import isBinary, readHeader
+from notifier import notify
+from tracer import traced
+
+BLOCK_SIZE = 1 << 22  # bytes of lines the bulk loaders parse at a time
+SCRATCH_ROOT = "/dev/shm"  # tmpfs for scratch directories, the system temporary directory is used without it
 
 """Returns the # of variables and clauses of a given CNF file"""
 def parseCNF(cnf):
+    if isBinary(cnf):
+        header = readHeader(cnf)
+        return float(header["nvars"]), float(header["ncls"])
+
     with open(cnf, 'r') as f:
         line = f.readline()
         while len(line) > 0:
@@ -27,6 +40,16 @@ def parseCNF(cnf):
 
 
 
+"""Yields the file, optimum and time of each line of a DAT file"""
+def iterDAT(datfile):
+    with open(datfile, 'r') as f:
+        for line in f:
+            if len(line.strip()) == 0:
+                continue
+            filename, oLbl, eq, oStr, tLbl, eq, tStr = line.split()
+            yield filename, int(oStr), float(tStr)
+
+
 """Returns the files, optima and times, in the given DAT file"""
 def parseDAT(datfile):
 
@@ -34,18 +57,22 @@ def parseDAT(datfile):
     optima = []
     times = []
 
-    with open(datfile, 'r') as f:
-        line = f.readline()
-        while len(line) > 0:
-            filename, oLbl, eq, oStr, tLbl, eq, tStr = line.split()
+    for filename, optimum, t in iterDAT(datfile):
+        files.append(filename)
+        optima.append(optimum)
+        times.append(t)
 
-            files.append(filename)
-            optima.append(int(oStr))
-            times.append(float(tStr))
+    return files, optima, times
 
-            line = f.readline()
 
-    return files, optima, times
+"""Yields the file, optimum, time, loops and updates of each line of a .out file from testrun"""
+def iterOUT(filename):
+    with open(filename, 'r') as f:
+        for line in f:
+            if len(line.strip()) == 0:
+                continue
+            cnf, oStr, tStr, loopStr, uStr = line.split()
+            yield cnf, int(oStr), float(tStr), int(loopStr), int(uStr)
 
 
 """Parse a .out file from testrun, returning the files, times, loops and updates."""
@@ -57,51 +84,102 @@ def parseOUT(filename):
     loops = []
     updates = []
 
+    for cnf, optimum, t, loop, update in iterOUT(filename):
+        files.append(cnf)
+        optima.append(optimum)
+        times.append(t)
+        loops.append(loop)
+        updates.append(update)
+
+    return files, optima, times, loops, updates
+
+
+"""Returns a whitespace-separated file with nfields fields per line as a structured array. The columns are given as
+(name, field index, dtype) and every block of lines is split and converted by NumPy at once"""
+def loadTable(filename, nfields, columns):
+    parts = dict((name, []) for name, _, _ in columns)
+
     with open(filename, 'r') as f:
-        line = f.readline()
-        while len(line) > 0:
-            filename, oStr, tStr, loopStr, uStr = line.split()
+        lines = f.readlines(BLOCK_SIZE)
+        while len(lines) > 0:
+            tokens = "".join(lines).split()
+            if len(tokens) % nfields != 0:
+                raise Exception("Invalid file format: {0}".format(filename))
+
+            # numbers are parsed in C by fromstring; only the string columns become string arrays
+            for name, field, dtype in columns:
+                if dtype is str:
+                    parts[name].append(np.array(tokens[field::nfields]))
+                else:
+                    parts[name].append(np.fromstring(" ".join(tokens[field::nfields]), sep=' ').astype(dtype))
 
-            files.append(filename)
-            optima.append(int(oStr))
-            times.append(float(tStr))
-            loops.append(int(loopStr))
-            updates.append(int(uStr))
+            lines = f.readlines(BLOCK_SIZE)
 
-            line = f.readline()
+    arrays = []
+    for name, _, dtype in columns:
+        if len(parts[name]) > 0:
+            arrays.append(np.concatenate(parts[name]))
+        else:
+            arrays.append(np.array([], dtype=dtype))
+
+    table = np.zeros(len(arrays[0]), dtype=[(name, a.dtype) for (name, _, _), a in zip(columns, arrays)])
+    for (name, _, _), a in zip(columns, arrays):
+        table[name] = a
+
+    return table
 
-    return files, optima, times, loops, updates
+
+"""Returns a DAT file as a structured array with fields file, optimum and time"""
+def loadDAT(datfile):
+    return loadTable(datfile, 7, [("file", 0, str), ("optimum", 3, np.int64), ("time", 6, np.float64)])
+
+
+"""Returns a .out file from testrun as a structured array with fields file, optimum, time, loops and updates"""
+def loadOUT(filename):
+    return loadTable(filename, 5, [("file", 0, str), ("optimum", 1, np.int64), ("time", 2, np.float64),
+                                   ("loops", 3, np.int64), ("updates", 4, np.int64)])
 
 
 """Returns the dT and A vectors from a LUT file as a tuple"""
 def parseLUT(lutfile):
 
     with open(lutfile, 'r') as f:
-        line = f.readline()
-        bins = int(line)
-        dT = np.zeros(bins)
-        A = np.zeros(bins)
-        psize = np.zeros(bins)
-        row = 0
-        while len(line) > 0:
-            line = f.readline()
-            if len(line) > 0:
-                dT[row], A[row], psize[row] = line.rstrip('\n').split('\t')
-                row += 1
-        if row != bins:
-            raise Exception("Invalid LUT file format!")
+        bins = int(f.readline())
+        rows = np.loadtxt(f, delimiter='\t', ndmin=2)
+
+    if rows.shape != (bins, 3):
+        raise Exception("Invalid LUT file format!")
+
+    dT = rows[:, 0].copy()
+    A = rows[:, 1].copy()
+    psize = rows[:, 2].copy()
 
     return bins, dT, A, psize
 
 
+"""Returns the last non-empty line of a file, reading backwards from its end"""
+def tailLine(filename, block=4096):
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b''
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+
+            last = data.rstrip()
+            if b'\n' in last or pos == 0:
+                return last[last.rfind(b'\n') + 1:].decode()
+
+    return ''
+
+
 """Returns the percentage of hits, avg runtime, and factor as a tuple"""
+@traced
 def parseTXT(txtfile):
-    last = ''
-    with open(txtfile, 'r') as f:
-        line = f.readline()
-        while len(line) > 0:
-            last = line
-            line = f.readline()
+    last = tailLine(txtfile)
 
     # Parse last line
     _, hitStr, _, tStr, lStr, _, uStr, _, fStr, _ = last.split()
@@ -116,9 +194,20 @@ def parseTXT(txtfile):
     return hit, updates, factor
 
 
+"""Emails a message from the background notifier (notifier.py), without waiting for the mail server. Without a mail
+account in the environment, the message goes to a file"""
 def sendEmail(msg):
-    server = smtplib.SMTP("smtp.gmail.com", 587)
-    server.starttls()
-    server.login("email.notifier.bryanluu@gmail.com", "7788382652")
-    server.sendmail("email.notifier.bryanluu@gmail.com", "bryanluu30794@gmail.com", '\n'+msg)
-    server.quit()
\ No newline at end of file
+    notify(msg)
+
+
+"""Yields a new private directory for the files of one evaluation, on tmpfs where available, and removes it with
+everything in it afterwards, even when the evaluation fails. Concurrent evaluations, in threads or processes, each get
+their own directory, so they never overwrite each other's files"""
+@contextmanager
+def scratchDir(prefix="ssmc."):
+    root = SCRATCH_ROOT if os.path.isdir(SCRATCH_ROOT) and os.access(SCRATCH_ROOT, os.W_OK) else None
+    path = tempfile.mkdtemp(prefix=prefix, dir=root)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)